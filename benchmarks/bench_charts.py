@@ -0,0 +1,87 @@
+"""
+Measure the chart stage on a synthetic price store: rendering in this process against rendering in worker processes, then a second run where every chart comes from the cache, then a run after a new bar for half of the tickers. Runs on CPU only.
+
+    python -m benchmarks.bench_charts --tickers 200 --processes 8
+"""
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from src.charts import ChartCache, ChartRenderer
+from src.price_store import PriceStore
+
+
+def make_bars(rng: np.random.Generator, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    returns = rng.normal(0.0005, 0.02, len(dates))
+    close = 100 * np.cumprod(1 + returns)
+    open_ = close / (1 + rng.normal(0.0, 0.01, len(dates)))
+    spread = np.abs(rng.normal(0.0, 0.01, len(dates))) * close
+
+    return pd.DataFrame(
+        {
+            "open": open_,
+            "high": np.maximum(open_, close) + spread,
+            "low": np.minimum(open_, close) - spread,
+            "close": close,
+            "adj_close": close,
+            "volume": rng.integers(10**5, 10**7, len(dates)).astype(float),
+            "ret": returns,
+        },
+        index=dates,
+    )
+
+
+def run(renderer: ChartRenderer, tickers: list[str], label: str) -> None:
+    rendered, hits, render_time = renderer.rendered, renderer.hits, renderer.render_time
+    renderer.render(tickers)
+
+    rendered = renderer.rendered - rendered
+    hits = renderer.hits - hits
+    render_time = renderer.render_time - render_time
+    print(
+        f"{label:<28} rendered {rendered:>4}, hits {hits:>4} "
+        f"(hit rate {hits / len(tickers):>4.0%}), "
+        f"{rendered / render_time if render_time > 0 else 0.0:>6.1f} charts/s"
+    )
+
+
+def main(n_tickers: int, n_days: int, processes: int):
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2024-01-02", periods=n_days + 1)
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+
+    with tempfile.TemporaryDirectory() as root:
+        store = PriceStore(os.path.join(root, "prices"))
+        bars = {ticker: make_bars(rng, dates) for ticker in tickers}
+        for ticker in tickers:
+            store.append(ticker, bars[ticker][:-1])
+
+        serial = ChartRenderer(store, ChartCache(os.path.join(root, "serial")), processes=0)
+        run(serial, tickers, "1 process, cold")
+
+        parallel = ChartRenderer(
+            store, ChartCache(os.path.join(root, "charts")), processes=processes
+        )
+        run(parallel, tickers, f"{processes} processes, cold")
+        run(parallel, tickers, f"{processes} processes, warm")
+
+        # a new daily bar for half of the tickers
+        for ticker in tickers[::2]:
+            store.append(ticker, bars[ticker][-1:])
+        run(parallel, tickers, f"{processes} processes, new bar")
+
+        print(f"total: {parallel.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--days", type=int, default=400)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    main(args.tickers, args.days, args.processes)
@@ -0,0 +1,506 @@
+"""
+End-to-end benchmark of quant_news.main without network, Notion or GPU. The yfinance news lists and the article pages are replayed from a local stub server, the pages are written to the fake Notion server, and the VLM is a stub sleeping as long as a model would (StubVLM), or any model of the registry with --model. Each scale runs in its own process, from empty caches, and reports the throughput, the p50 / p95 latency of an article (from the request of its page to the Notion write of its summary), the peak RSS and the request counts. The results are saved to benchmarks/results/<date>-<commit>.json, and --compare checks them against a previous result file.
+
+    python -m benchmarks.bench_e2e --scales 10 100 1000 5000
+    python -m benchmarks.bench_e2e --scales 1000 --pipelined --warm --compare benchmarks/results/<baseline>.json
+
+The news and pages are taken from benchmarks/fixtures/ once recorded from Yahoo (the only step using the network), otherwise synthetic ones are generated:
+
+    python -m benchmarks.bench_e2e --record AAPL TSLA NVDA
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmarks.fake_notion import FakeNotionServer
+from benchmarks.stub_server import StubServer
+
+FIXTURES_DIR = os.path.join(ROOT, "benchmarks", "fixtures")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# the model whose tokenizer PromptBuilder uses with the stub, when it is available offline
+STUB_TOKENIZER_ID = "Qwen/Qwen2.5-VL-7B-Instruct"
+
+_ARTICLE_RE = re.compile(r"/article/(\d+)")
+
+_WORDS = (
+    "shares revenue guidance quarter analysts earnings growth margin investors market "
+    "stock company reported expected outlook demand supply costs rates inflation federal "
+    "reserve sales profit forecast billion million percent rose fell trading index sector "
+    "the a of to and in on for with after as its by from that than higher lower year"
+).split()
+
+
+def record_fixtures(tickers: list[str], root: str = FIXTURES_DIR, delay: float = 0.5) -> None:
+    """
+    Save the current yfinance news of the tickers and their article pages, as the fixtures of the benchmark.
+    """
+    import requests
+    import yfinance as yf
+
+    os.makedirs(os.path.join(root, "pages"), exist_ok=True)
+    session = requests.Session()
+    session.headers["User-Agent"] = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)"
+
+    fixtures, seen_urls = [], set()
+    for ticker in tickers:
+        for news in yf.Ticker(ticker).news:
+            url = ((news.get("content") or {}).get("canonicalUrl") or {}).get("url")
+            if url is None or url in seen_urls:
+                continue
+            seen_urls.add(url)
+
+            time.sleep(delay)
+            try:
+                response = session.get(url, timeout=10)
+            except requests.RequestException:
+                continue
+            if response.status_code != 200:
+                continue
+
+            page = f"pages/{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.html"
+            with open(os.path.join(root, page), "wb") as f:
+                f.write(response.content)
+            fixtures.append({"news": news, "page": page})
+
+    with open(os.path.join(root, "news.json"), "w") as f:
+        json.dump(fixtures, f)
+    print(f"Recorded {len(fixtures)} news with their pages in {root}")
+
+
+def load_fixtures(root: str = FIXTURES_DIR) -> tuple[list[dict], list[bytes], str]:
+    """
+    The recorded (news, page) fixtures, or synthetic ones if none were recorded.
+    """
+    path = os.path.join(root, "news.json")
+    if not os.path.exists(path):
+        return (*synthetic_fixtures(), "synthetic")
+
+    with open(path, "r") as f:
+        fixtures = json.load(f)
+
+    pages = []
+    for fixture in fixtures:
+        with open(os.path.join(root, fixture["page"]), "rb") as f:
+            pages.append(f.read())
+
+    return [fixture["news"] for fixture in fixtures], pages, "recorded"
+
+
+def synthetic_fixtures(n: int = 50, seed: int = 0) -> tuple[list[dict], list[bytes]]:
+    """
+    News in the yfinance format with article pages in the Yahoo layout. The article lengths are log-normal, so a few of them exceed the token budget and are summarized chunk by chunk.
+    """
+    rng = np.random.default_rng(seed)
+    news_list, pages = [], []
+    for i in range(n):
+        title = " ".join(rng.choice(_WORDS, 8)).capitalize()
+        n_words = int(np.clip(rng.lognormal(6.3, 0.7), 80, 6000))
+        paragraphs = [
+            " ".join(rng.choice(_WORDS, size)).capitalize() + "."
+            for size in np.diff(np.r_[0, np.sort(rng.choice(n_words, n_words // 60 + 1)), n_words])
+            if size > 0
+        ]
+
+        news_list.append(
+            {
+                "id": f"synthetic-{i}",
+                "content": {
+                    "id": f"synthetic-{i}",
+                    "contentType": "STORY",
+                    "title": title,
+                    "summary": paragraphs[0],
+                    "pubDate": "2025-01-01T00:00:00Z",
+                    "canonicalUrl": {"url": f"https://finance.yahoo.com/news/synthetic-{i}.html"},
+                    "thumbnail": {"originalUrl": f"https://s.yimg.com/synthetic-{i}.jpg"},
+                },
+            }
+        )
+        body = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+        pages.append(
+            f'<html><head><title>{title}</title></head><body><div class="caas-body">{body}</div></body></html>'.encode()
+        )
+
+    return news_list, pages
+
+
+def make_universe(
+    news_list: list[dict], n_articles: int, news_per_ticker: int, base_url: str
+) -> dict[str, list[dict]]:
+    """
+    The news lists of the tickers of a run of <n_articles> unique news, copied from the fixtures with their own page urls and recent publication dates. The words of the titles and summaries of the copies are shuffled, so the deduplication does not fold them into their fixture. The page of article i is served at /article/i.
+    """
+    rng = np.random.default_rng(0)
+    now = datetime.now(timezone.utc)
+    news_lists = {}
+    for i in range(n_articles):
+        news = json.loads(json.dumps(news_list[i % len(news_list)]))
+        content = news["content"]
+        if i >= len(news_list):
+            for field in ("title", "summary"):
+                words = (content.get(field) or "").split()
+                content[field] = " ".join(rng.permutation(words))
+        content["title"] = f"{content['title']} ({i})"
+        content["canonicalUrl"] = {"url": f"{base_url}/article/{i}"}
+        content["pubDate"] = (now - timedelta(minutes=i % 600 + 1)).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+        news_lists.setdefault(f"T{i // news_per_ticker:04d}", []).append(news)
+
+    return news_lists
+
+
+class TimedNotionServer(FakeNotionServer):
+    """
+    Fake Notion server recording when the news part of each article (found by its url) is written.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.write_times = {}
+
+    def handle(self, method: str, path: str, body: dict) -> tuple:
+        response = super().handle(method, path, body)
+        if path.endswith("/children"):
+            now = time.perf_counter()
+            for article in _ARTICLE_RE.findall(json.dumps(body)):
+                self.write_times[int(article)] = now
+
+        return response
+
+
+def install_stubs(base_url: str, options: dict) -> None:
+    """
+    Point yfinance to the stub server, register the stub VLM in the model registry and give PromptBuilder an offline tokenizer.
+    """
+    import yfinance as yf
+
+    class ReplayTicker:
+        """
+        yfinance.Ticker replaying the news lists of the stub server, through the session of the scrapper.
+        """
+
+        def __init__(self, ticker: str, session=None):
+            import requests
+
+            self.ticker = ticker
+            self.session = session if session is not None else requests.Session()
+
+        @property
+        def news(self) -> list[dict]:
+            return self.session.get(f"{base_url}/news/{self.ticker}", timeout=10).json()
+
+    yf.Ticker = ReplayTicker
+
+    if options["model"] != "stub":
+        return
+
+    from benchmarks.stub_vlm import StubVLM, WordTokenizer
+    from src.models import registry
+    from src.summarizer import PromptBuilder
+
+    StubVLM.prefill_tokens_per_second = options["vlm_prefill_tps"]
+    StubVLM.decode_step = options["vlm_decode_step"]
+    StubVLM.output_tokens = options["vlm_output_tokens"]
+    registry.MODELS["stub"] = ("benchmarks.stub_vlm", "StubVLM")
+    registry.MODEL_IDS["stub"] = StubVLM.model_id
+
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(STUB_TOKENIZER_ID, local_files_only=True)
+    except (ImportError, OSError):
+        tokenizer = WordTokenizer()
+    options["tokenizer"] = type(tokenizer).__name__
+
+    PromptBuilder.from_model_id = classmethod(
+        lambda cls, model_id, **kwargs: cls(tokenizer, **kwargs)
+    )
+
+
+def peak_rss_mb() -> float:
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def vlm_stub_stats(options: dict):
+    """
+    The counters of the stub VLM, loaded by its first generation in the process.
+    """
+    if options["model"] != "stub":
+        return None
+
+    from src.models.registry import load_model
+
+    return load_model("stub").stats()
+
+
+def run_scale(n_articles: int, options: dict) -> list[dict]:
+    """
+    Run quant_news.main on <n_articles> news (then once more on warm caches with --warm) in a temporary working directory, and measure it.
+    """
+    os.environ["NOTION_TOKEN"] = "fake-token"
+    os.environ["NOTION_PAGE_ID"] = "fake-page"
+
+    import quant_news
+
+    news_list, pages, fixtures = load_fixtures(options["fixtures"])
+    news_lists, fetch_times = {}, {}
+
+    def respond(path: str):
+        parts = path.strip("/").split("/")
+        if parts[0] == "news" and len(parts) == 2:
+            return "application/json", json.dumps(news_lists.get(parts[1], [])).encode()
+        if parts[0] == "article" and len(parts) == 2:
+            article = int(parts[1])
+            fetch_times.setdefault(article, time.perf_counter())
+            return "text/html; charset=utf-8", pages[article % len(pages)]
+        return None
+
+    rows = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, StubServer(
+        options["latency"], respond
+    ) as yahoo, TimedNotionServer() as notion_server:
+        os.environ["NOTION_BASE_URL"] = notion_server.url
+        news_lists.update(
+            make_universe(news_list, n_articles, options["news_per_ticker"], yahoo.url)
+        )
+        install_stubs(yahoo.url, options)
+
+        os.chdir(workdir)
+        try:
+            with open("tickers.json", "w") as f:
+                json.dump({"tickers": list(news_lists)}, f)
+
+            for run in ("cold", "warm") if options["warm"] else ("cold",):
+                fetch_times.clear()
+                notion_server.write_times.clear()
+                yahoo.requests.clear()
+                notion_requests = notion_server.request_count
+                vlm_stats = vlm_stub_stats(options)
+
+                start = time.perf_counter()
+                with open("main.log", "a") as log, contextlib.redirect_stdout(log):
+                    quant_news.main(
+                        batch_size=options["batch_size"],
+                        pipelined=options["pipelined"],
+                        model_name=options["model"],
+                        vlm_socket_path=None,
+                        structured=options["structured"],
+                    )
+                elapsed = time.perf_counter() - start
+
+                latencies = np.array(
+                    [
+                        write_time - fetch_times[article]
+                        for article, write_time in notion_server.write_times.items()
+                        if article in fetch_times
+                    ]
+                )
+                written = len(notion_server.write_times)
+                rows.append(
+                    {
+                        "articles": n_articles,
+                        "run": run,
+                        "written": written,
+                        "elapsed": elapsed,
+                        "throughput": written / elapsed,
+                        "latency_p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                        "latency_p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+                        "peak_rss_mb": peak_rss_mb(),
+                        "requests": {
+                            "news_lists": yahoo.requests["news"],
+                            "articles": yahoo.requests["article"],
+                            "notion": notion_server.request_count - notion_requests,
+                        },
+                    }
+                )
+                if vlm_stats is not None:
+                    rows[-1]["vlm"] = {
+                        key: value - vlm_stats[key] if key != "model_id" else value
+                        for key, value in vlm_stub_stats(options).items()
+                    }
+        finally:
+            os.chdir(cwd)
+
+    for row in rows:
+        row["fixtures"] = fixtures
+        row["tokenizer"] = options.get("tokenizer")
+
+    return rows
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "diff", "--quiet", "HEAD"], cwd=ROOT, capture_output=True
+        ).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return commit + ("-dirty" if dirty else "")
+
+
+def format_rows(rows: list[dict]) -> str:
+    lines = [
+        f"{'articles':>8} {'run':>5} {'time':>8} {'art/s':>7} {'p50':>8} {'p95':>8} "
+        f"{'rss':>8} {'yahoo':>6} {'notion':>6} {'vlm calls':>9}"
+    ]
+    for row in rows:
+        p50, p95 = (
+            f"{row[key]:>7.2f}s" if row[key] is not None else f"{'-':>8}"
+            for key in ("latency_p50", "latency_p95")
+        )
+        requests = row["requests"]
+        lines.append(
+            f"{row['articles']:>8} {row['run']:>5} {row['elapsed']:>7.2f}s {row['throughput']:>7.1f} "
+            f"{p50} {p95} {row['peak_rss_mb']:>6.0f}MB "
+            f"{requests['news_lists'] + requests['articles']:>6} {requests['notion']:>6} "
+            f"{row['vlm']['calls'] if 'vlm' in row else '-':>9}"
+        )
+
+    return "\n".join(lines)
+
+
+def compare(baseline: dict, result: dict, tolerance: float) -> list[str]:
+    """
+    The metrics of the rows run in both results which are worse than the baseline by more than <tolerance> (relative).
+    """
+    baseline_rows = {(row["articles"], row["run"]): row for row in baseline["rows"]}
+    regressions = []
+    print(f"compared to {baseline['commit']} ({baseline['date']}):")
+    for row in result["rows"]:
+        base = baseline_rows.get((row["articles"], row["run"]))
+        if base is None:
+            continue
+
+        changes = []
+        # (metric, whether higher is better)
+        for metric, higher_is_better in (
+            ("throughput", True),
+            ("latency_p50", False),
+            ("latency_p95", False),
+            ("peak_rss_mb", False),
+        ):
+            if not row[metric] or not base[metric]:
+                continue
+            change = row[metric] / base[metric] - 1
+            changes.append(f"{metric} {change:+.1%}")
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{row['articles']} {row['run']}: {metric} {change:+.1%}")
+
+        print(f"{row['articles']:>8} {row['run']:>5}  " + ", ".join(changes))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--news-per-ticker", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="latency of the stub server")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--structured", action="store_true")
+    parser.add_argument("--warm", action="store_true", help="run each scale again on warm caches")
+    parser.add_argument("--model", default="stub", help="stub, or a model of the registry")
+    parser.add_argument("--vlm-prefill-tps", type=float, default=50000.0)
+    parser.add_argument("--vlm-decode-step", type=float, default=0.002)
+    parser.add_argument("--vlm-output-tokens", type=int, default=100)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--record", nargs="+", metavar="TICKER", help="record the fixtures from Yahoo and exit")
+    parser.add_argument("--output", default=None, help="result file (default: benchmarks/results/<date>-<commit>.json)")
+    parser.add_argument("--compare", default=None, help="result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    # a single scale, run by the benchmark in a child process
+    parser.add_argument("--single", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record, args.fixtures)
+        return
+
+    from src.config import VLM_BATCH_SIZE
+
+    options = {
+        "news_per_ticker": args.news_per_ticker,
+        "latency": args.latency,
+        "batch_size": args.batch_size if args.batch_size is not None else VLM_BATCH_SIZE,
+        "pipelined": args.pipelined,
+        "structured": args.structured,
+        "warm": args.warm,
+        "model": args.model,
+        "vlm_prefill_tps": args.vlm_prefill_tps,
+        "vlm_decode_step": args.vlm_decode_step,
+        "vlm_output_tokens": args.vlm_output_tokens,
+        "fixtures": args.fixtures,
+    }
+
+    if args.single is not None:
+        print(json.dumps(run_scale(args.single, options)))
+        return
+
+    rows = []
+    print(format_rows([]))
+    for scale in args.scales:
+        # a fresh process per scale, so the peak RSS and the loaded modules are its own
+        child = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_e2e", *sys.argv[1:], "--single", str(scale)],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+        if child.returncode != 0:
+            sys.exit(f"scale {scale} failed:\n{child.stderr}")
+        scale_rows = json.loads(child.stdout.strip().splitlines()[-1])
+        rows.extend(scale_rows)
+        print("\n".join(format_rows(scale_rows).splitlines()[1:]), flush=True)
+
+    result = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "options": options,
+        "rows": rows,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{result['commit']}.json"
+        )
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            regressions = compare(json.load(f), result, args.tolerance)
+        if regressions:
+            sys.exit("regressions above {:.0%}:\n{}".format(args.tolerance, "\n".join(regressions)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Time the factor engine on a synthetic universe: writing the price store, reading the returns of every ticker through the memory maps, and computing the rolling alpha, beta, volatility and correlation of all the tickers at once. The vectorized factors are checked against a per-ticker pandas rolling computation on a sample of the tickers.
+
+    python -m benchmarks.bench_factors --tickers 3000 --days 2500
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.config import TRADING_DAYS_PER_YEAR
+from src.factors import correlation_matrix, rolling_factors
+from src.price_store import BAR_COLUMNS, PriceStore
+
+BENCHMARK = "^BENCH"
+
+
+def make_store(root: str, n_tickers: int, n_days: int, seed: int = 0) -> list[str]:
+    """
+    Daily bars of a one-factor market model, with tickers listed at different dates and a few missing days.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2010-01-04", periods=n_days)
+    market = rng.normal(0.0003, 0.01, n_days)
+    betas = rng.uniform(0.2, 2.0, n_tickers)
+    returns = market[:, None] * betas + rng.normal(0.0, 0.015, (n_days, n_tickers))
+
+    store = PriceStore(root)
+    tickers = [f"T{i:05d}" for i in range(n_tickers)]
+    for j, (ticker, ticker_returns) in enumerate(
+        [(BENCHMARK, market), *zip(tickers, returns.T)]
+    ):
+        first = rng.integers(0, n_days // 4) if j > 0 else 0
+        keep = np.ones(n_days, dtype=bool)
+        keep[:first] = False
+        if j > 0:
+            keep[rng.integers(0, n_days, 5)] = False
+
+        close = 100 * np.cumprod(1 + ticker_returns)
+        bars = pd.DataFrame(
+            {column: close for column in BAR_COLUMNS if column != "ret"}, index=dates
+        ).assign(ret=ticker_returns)
+        # the store is filled in two updates, as the daily runs would
+        split = n_days - 20
+        store.append(ticker, bars[:split][keep[:split]])
+        store.append(ticker, bars[split:][keep[split:]])
+
+    return tickers
+
+
+def pandas_factors(returns: pd.Series, benchmark: pd.Series, window: int) -> pd.DataFrame:
+    valid = returns.notna() & benchmark.notna()
+    y, x = returns.where(valid), benchmark.where(valid)
+    min_periods = max(window // 2, 2)
+
+    cov = y.rolling(window, min_periods=min_periods).cov(x)
+    var_x = x.rolling(window, min_periods=min_periods).var()
+    beta = cov / var_x
+    alpha = (
+        y.rolling(window, min_periods=min_periods).mean()
+        - beta * x.rolling(window, min_periods=min_periods).mean()
+    ) * TRADING_DAYS_PER_YEAR
+
+    return pd.DataFrame(
+        {
+            "alpha": alpha,
+            "beta": beta,
+            "volatility": y.rolling(window, min_periods=min_periods).std()
+            * np.sqrt(TRADING_DAYS_PER_YEAR),
+            "correlation": y.rolling(window, min_periods=min_periods).corr(x),
+        }
+    )
+
+
+def main(n_tickers: int, n_days: int, window: int, n_checked: int):
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        tickers = make_store(root, n_tickers, n_days)
+        print(f"store: {n_tickers} tickers x {n_days} days written in {time.perf_counter() - start:.2f}s")
+
+        store = PriceStore(root)
+        start = time.perf_counter()
+        dates, returns = store.matrix([BENCHMARK, *tickers])
+        read_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        factors = rolling_factors(returns[:, 1:], returns[:, 0], window)
+        factor_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        correlation_matrix(returns[-window:, 1:])
+        correlation_time = time.perf_counter() - start
+
+        print(f"read:               {read_time:.2f}s")
+        print(f"rolling factors:    {factor_time:.2f}s")
+        print(f"correlation matrix: {correlation_time:.2f}s ({n_tickers}x{n_tickers})")
+
+        # the same factors, ticker by ticker with pandas
+        benchmark = pd.Series(returns[:, 0])
+        checked = np.linspace(0, n_tickers - 1, n_checked, dtype=int)
+        start = time.perf_counter()
+        max_errors = {name: 0.0 for name in factors}
+        for j in checked:
+            expected = pandas_factors(pd.Series(returns[:, j + 1]), benchmark, window)
+            for name, values in factors.items():
+                error = np.nanmax(np.abs(values[:, j] - expected[name].to_numpy()), initial=0.0)
+                max_errors[name] = max(max_errors[name], error)
+                assert np.array_equal(np.isnan(values[:, j]), expected[name].isna().to_numpy()), name
+        pandas_time = (time.perf_counter() - start) / n_checked * n_tickers
+
+        print(f"pandas per ticker:  {pandas_time:.2f}s (extrapolated from {n_checked} tickers)")
+        print(f"max abs error vs pandas: {max_errors}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=3000)
+    parser.add_argument("--days", type=int, default=2500)
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--checked", type=int, default=20)
+    args = parser.parse_args()
+
+    main(args.tickers, args.days, args.window, args.checked)
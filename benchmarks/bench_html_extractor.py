@@ -0,0 +1,125 @@
+"""
+Compare the HTML extractors over a corpus of article pages, in pages per second, and check that they extract the same text and image as the BeautifulSoup fallback. Then compare parsing in a thread pool with parsing in a process pool, as the scrapper does under high concurrency.
+
+Saved yahoo pages (*.html) can be given with --fixtures, otherwise synthetic pages of the same structure and size are used.
+
+    python -m benchmarks.bench_html_extractor --fixtures path/to/pages --workers 16
+"""
+
+import argparse
+import glob
+import multiprocessing as mp
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from src.html_extractor import EXTRACTORS, extract_in_process, get_extractor
+
+WORDS = "shares revenue quarter guidance analysts market investors growth margin outlook".split()
+
+
+def make_page(rng: random.Random, i: int) -> bytes:
+    """
+    A page shaped like a yahoo article: a large head of scripts and styles, the navigation, the article body with its image, and the related stories.
+    """
+    sentence = lambda: " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+    head = "".join(
+        f"<script>window.config{j} = {{{', '.join(f'k{k}: {k}' for k in range(50))}}};</script>"
+        for j in range(20)
+    ) + "".join(f"<style>.c{j} {{ margin: {j}px; }}</style>" for j in range(100))
+    nav = "".join(
+        f'<li class="nav-item"><a href="/section/{j}">Section {j}</a></li>' for j in range(150)
+    )
+    paragraphs = "".join(
+        f"<p>{sentence()}. {sentence()}.</p>" for _ in range(rng.randint(10, 40))
+    )
+    related = "".join(
+        f'<div class="related"><a href="/news/{j}"><img src="/thumb/{j}.jpg"><h3>{sentence()}</h3></a></div>'
+        for j in range(60)
+    )
+
+    return f"""<!DOCTYPE html>
+<html><head><title>News {i}</title>{head}</head>
+<body><nav><ul>{nav}</ul></nav>
+<article><header><h1>News {i}</h1></header>
+<figure><img class="caas-img has-preview" src="https://s.yimg.com/news/{i}.jpg"></figure>
+<div class="caas-body">{paragraphs}<p>Story continues</p>{paragraphs}<button>View comments</button></div>
+</article><aside>{related}</aside><footer>{nav}</footer></body></html>""".encode()
+
+
+def load_pages(fixtures: str, n_pages: int) -> list[bytes]:
+    if fixtures is not None:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(fixtures, "*.html"))):
+            with open(path, "rb") as f:
+                pages.append(f.read())
+        return pages
+
+    rng = random.Random(0)
+    return [make_page(rng, i) for i in range(n_pages)]
+
+
+def normalize(result: tuple) -> tuple:
+    text, image_src = result
+    return " ".join(text.split()), image_src
+
+
+def bench_extractors(pages: list[bytes]) -> None:
+    reference = [normalize(get_extractor("bs4").extract(page)) for page in pages]
+    megabytes = sum(len(page) for page in pages) / 2**20
+
+    print(f"{'extractor':>10} {'pages/s':>9} {'MB/s':>7} {'same as bs4':>12}")
+    for name in EXTRACTORS:
+        try:
+            extractor = get_extractor(name)
+        except ImportError:
+            print(f"{name:>10} not installed")
+            continue
+
+        start = time.perf_counter()
+        results = [extractor.extract(page) for page in pages]
+        elapsed = time.perf_counter() - start
+
+        same = sum(normalize(result) == ref for result, ref in zip(results, reference))
+        print(
+            f"{name:>10} {len(pages) / elapsed:>9.1f} {megabytes / elapsed:>7.1f} {same:>6}/{len(pages)}"
+        )
+
+
+def bench_pools(pages: list[bytes], name: str, workers: int) -> None:
+    extractor = get_extractor(name)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        start = time.perf_counter()
+        list(executor.map(extractor.extract, pages))
+        thread_time = time.perf_counter() - start
+
+    with ProcessPoolExecutor(
+        max_workers=os.cpu_count(), mp_context=mp.get_context("spawn")
+    ) as executor:
+        # start the processes and import the parser before timing
+        list(executor.map(extract_in_process, [name] * os.cpu_count(), pages[: os.cpu_count()]))
+        start = time.perf_counter()
+        list(executor.map(extract_in_process, [name] * len(pages), pages))
+        process_time = time.perf_counter() - start
+
+    print(
+        f"{name} with {workers} threads: {len(pages) / thread_time:.1f} pages/s, "
+        f"with {os.cpu_count()} processes: {len(pages) / process_time:.1f} pages/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", type=str, default=None)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    pages = load_pages(args.fixtures, args.pages)
+    print(
+        f"{len(pages)} pages, {sum(len(page) for page in pages) / len(pages) / 1024:.0f} KB on average"
+    )
+    bench_extractors(pages)
+    bench_pools(pages, get_extractor().name, args.workers)
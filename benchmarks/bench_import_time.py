@@ -0,0 +1,101 @@
+"""
+Measure the import time of the entry points with `python -X importtime`, each in a fresh interpreter, and check that none of them imports the heavy modules only needed by the models (torch, transformers, NVML) or only used on demand (yfinance, PIL, matplotlib). The slowest modules of each entry point are listed. It exits with an error when a heavy module is imported, or when an entry point takes longer than --max-ms.
+
+    python -m benchmarks.bench_import_time --repeat 5
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    "scrapper": "src.news_scrapper",
+    "notion": "src.notion, src.notion_writer",
+    "factors": "src.factors",
+    "charts": "src.charts",
+    "quant_news": "quant_news",
+}
+
+HEAVY_MODULES = (
+    "torch",
+    "transformers",
+    "nvidia_smi",
+    "pynvml",
+    "qwen_vl_utils",
+    "yfinance",
+    "PIL",
+    "matplotlib",
+)
+
+_LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_time(modules: str) -> tuple[float, list[tuple[str, int, int]]]:
+    """
+    The wall time (in seconds) of importing the modules in a fresh interpreter, and the (module, self us, cumulative us) of every imported module.
+    """
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modules}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if child.returncode != 0:
+        sys.exit(f"import {modules} failed:\n{child.stderr}")
+
+    imported = []
+    top_level = 0
+    for line in child.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        imported.append((name, int(self_us), int(cumulative_us)))
+        # the modules imported by the -c statement itself, not by another module
+        if len(indent) == 1:
+            top_level += int(cumulative_us)
+
+    return top_level / 1e6, imported
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3, help="imports per entry point, the fastest is kept")
+    parser.add_argument("--top", type=int, default=5, help="slowest modules listed per entry point")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail above this import time")
+    args = parser.parse_args()
+
+    _, baseline = import_time("sys")
+    baseline_modules = {name for name, _, _ in baseline}
+
+    failures = []
+    for entry, modules in ENTRY_POINTS.items():
+        runs = [import_time(modules) for _ in range(args.repeat)]
+        elapsed, imported = min(runs, key=lambda run: run[0])
+
+        heavy = sorted(
+            {name.split(".")[0] for name, _, _ in imported} & set(HEAVY_MODULES)
+        )
+        print(
+            f"{entry:<11} {elapsed * 1e3:>7.1f}ms, "
+            f"{len({name for name, _, _ in imported} - baseline_modules)} modules"
+            + (f", heavy: {', '.join(heavy)}" if heavy else "")
+        )
+        for name, self_us, cumulative_us in sorted(imported, key=lambda module: -module[1])[: args.top]:
+            print(f"    {name:<40} {self_us / 1e3:>7.1f}ms self {cumulative_us / 1e3:>8.1f}ms cumulative")
+
+        if heavy:
+            failures.append(f"{entry} imports {', '.join(heavy)}")
+        if args.max_ms is not None and elapsed * 1e3 > args.max_ms:
+            failures.append(f"{entry} takes {elapsed * 1e3:.0f}ms to import")
+
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Compare the model load configurations (attention backend, quantization, torch.compile) in load time, peak memory and generation throughput. Every configuration runs in a fresh process, so the memory of one does not count in the next. A small text model is used by default, so the matrix also runs on CPU-only hosts.
+
+    python -m benchmarks.bench_load_config --model-id Qwen/Qwen2.5-0.5B-Instruct
+    python -m benchmarks.bench_load_config --vlm qwen
+"""
+
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+from src.config import PROMPT_TEMPLATE, VLM_ROLE
+from src.models.load_config import LoadConfig
+
+CPU_CONFIGS = [
+    LoadConfig(),
+    LoadConfig(attention="eager"),
+    LoadConfig(attention="sdpa"),
+    LoadConfig(quantization="dynamic"),
+    LoadConfig(compile=True),
+]
+
+GPU_CONFIGS = [
+    LoadConfig(),
+    LoadConfig(attention="sdpa"),
+    LoadConfig(attention="flash_attention_2"),
+    LoadConfig(quantization="int8"),
+    LoadConfig(quantization="int4"),
+    LoadConfig(compile=True),
+]
+
+ARTICLE = (
+    "Shares rose after the company reported quarterly revenue above the analysts' "
+    "expectations and raised its guidance for the full year. "
+) * 20
+
+
+def _generate_text_model(model, tokenizer, device, max_new_tokens: int) -> int:
+    import torch
+
+    messages = [
+        {"role": "system", "content": VLM_ROLE},
+        {"role": "user", "content": PROMPT_TEMPLATE.format(title="Results", news_text=ARTICLE)},
+    ]
+    input_ids = tokenizer.apply_chat_template(
+        messages, add_generation_prompt=True, return_tensors="pt"
+    ).to(device)
+
+    with torch.inference_mode():
+        output = model.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            do_sample=False,
+            max_new_tokens=max_new_tokens,
+            min_new_tokens=max_new_tokens,
+        )
+
+    return output.shape[1] - input_ids.shape[1]
+
+
+def run_config(model_id: str, vlm: str, device: str, load_config, max_new_tokens, results):
+    import torch
+
+    start = time.perf_counter()
+    if vlm is not None:
+        from src.models.registry import load_model
+
+        model = load_model(vlm, device, load_config)
+
+        def generate() -> int:
+            output = model.generate(
+                VLM_ROLE,
+                PROMPT_TEMPLATE.format(title="Results", news_text=ARTICLE),
+                max_new_token=max_new_tokens,
+            )
+            return len(model.processor.tokenizer(output).input_ids)
+
+    else:
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model = load_config.load(AutoModelForCausalLM, model_id, device)
+        generate = lambda: _generate_text_model(model, tokenizer, device, max_new_tokens)
+    load_time = time.perf_counter() - start
+
+    # the first generation includes the compilation and the warm up of the kernels
+    start = time.perf_counter()
+    generate()
+    first_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new_tokens = generate()
+    generation_time = time.perf_counter() - start
+
+    results.put(
+        {
+            "config": repr(load_config),
+            "load_time": load_time,
+            "first_generation_time": first_time,
+            "tokens_per_second": new_tokens / generation_time,
+            # ru_maxrss is in KB on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "peak_gpu_mb": (
+                torch.cuda.max_memory_allocated() / 2**20 if torch.cuda.is_available() else 0.0
+            ),
+        }
+    )
+
+
+def main(model_id: str, vlm: str, device: str, max_new_tokens: int):
+    configs = GPU_CONFIGS if device.startswith("cuda") else CPU_CONFIGS
+    context = mp.get_context("spawn")
+    results = context.Queue()
+
+    print(
+        f"{'configuration':<80} {'load':>7} {'first':>7} {'tokens/s':>9} {'RSS MB':>8} {'GPU MB':>8}"
+    )
+    for load_config in configs:
+        process = context.Process(
+            target=run_config,
+            args=(model_id, vlm, device, load_config, max_new_tokens, results),
+        )
+        process.start()
+        process.join()
+
+        if process.exitcode != 0:
+            print(f"{repr(load_config):<80} failed with exit code {process.exitcode}")
+            continue
+
+        result = results.get()
+        print(
+            f"{result['config']:<80} {result['load_time']:>6.1f}s {result['first_generation_time']:>6.1f}s "
+            f"{result['tokens_per_second']:>9.1f} {result['peak_rss_mb']:>8.0f} {result['peak_gpu_mb']:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-id", type=str, default="Qwen/Qwen2.5-0.5B-Instruct")
+    parser.add_argument(
+        "--vlm",
+        type=str,
+        default=None,
+        help="benchmark a model of the registry (e.g. qwen) instead of --model-id",
+    )
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    main(args.model_id, args.vlm, args.device, args.max_new_tokens)
@@ -0,0 +1,59 @@
+"""
+Count the requests needed to write news parts to a local fake Notion server, with the news written one by one and through AsyncNotionWriter, which merges the appends to the same page.
+
+    python -m benchmarks.bench_notion --news 50
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("NOTION_TOKEN", "fake-token")
+os.environ.setdefault("NOTION_PAGE_ID", "fake-page")
+
+from benchmarks.fake_notion import FakeNotionServer
+from src.notion import NotionClient
+from src.notion_writer import AsyncNotionWriter
+from src.utils import notion_add_news_part
+
+
+def write_news(notion, page_id: str, n_news: int):
+    for i in range(n_news):
+        notion_add_news_part(
+            notion,
+            page_id,
+            f"News {i}",
+            "Some summary of the news. " * 10,
+            f"https://finance.yahoo.com/news/{i}",
+            "TSLA",
+            "2025-01-01 00:00:00",
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--news", type=int, default=50)
+    args = parser.parse_args()
+
+    for name in ("per news", "merged"):
+        with FakeNotionServer() as server:
+            notion = NotionClient(base_url=server.url)
+            page_id = notion.create_page("Benchmark")["id"]
+            server.request_count = 0
+
+            start = time.perf_counter()
+            if name == "merged":
+                with AsyncNotionWriter(base_url=server.url) as notion_writer:
+                    write_news(notion_writer, page_id, args.news)
+            else:
+                write_news(notion, page_id, args.news)
+            elapsed = time.perf_counter() - start
+
+            print(
+                f"{name:>9}: {server.request_count} requests, "
+                f"{len(server.blocks[page_id])} blocks, {elapsed:.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Write news parts through AsyncNotionWriter to a local fake Notion server which answers some of the appends with 429, and check that every block arrives in order.
+
+    python -m benchmarks.bench_notion_writer --news 50 --rate-limit-every 3
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("NOTION_TOKEN", "fake-token")
+os.environ.setdefault("NOTION_PAGE_ID", "fake-page")
+
+from benchmarks.fake_notion import FakeNotionServer
+from src.notion import NotionClient
+from src.notion_writer import AsyncNotionWriter
+from src.utils import notion_add_news_part
+
+
+class RateLimitedNotionServer(FakeNotionServer):
+    """
+    Answer every <every>-th append with 429 and a Retry-After header.
+    """
+
+    def __init__(self, every: int, retry_after: int):
+        super().__init__()
+        self.every = every
+        self.retry_after = retry_after
+        self.rate_limited_count = 0
+        self._append_count = 0
+
+    def handle(self, method: str, path: str, body: dict) -> tuple:
+        if "/children" in path:
+            self._append_count += 1
+            if self._append_count % self.every == 0:
+                self.rate_limited_count += 1
+                return (
+                    429,
+                    {"object": "error", "status": 429, "code": "rate_limited", "message": "Rate limited"},
+                    {"Retry-After": str(self.retry_after)},
+                )
+
+        return super().handle(method, path, body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--news", type=int, default=50)
+    parser.add_argument("--rate-limit-every", type=int, default=3)
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    with RateLimitedNotionServer(args.rate_limit_every, args.retry_after) as server:
+        notion = NotionClient(base_url=server.url)
+        page_id = notion.create_page("Benchmark")["id"]
+
+        start = time.perf_counter()
+        with AsyncNotionWriter(base_url=server.url) as notion_writer:
+            for i in range(args.news):
+                notion_add_news_part(
+                    notion_writer,
+                    page_id,
+                    f"News {i}",
+                    "Some summary of the news. " * 10,
+                    f"https://finance.yahoo.com/news/{i}",
+                    "TSLA",
+                    "2025-01-01 00:00:00",
+                )
+            enqueue_time = time.perf_counter() - start
+        total_time = time.perf_counter() - start
+
+        titles = [
+            block["heading_2"]["rich_text"][0]["text"]["content"]
+            for block in server.blocks[page_id]
+            if block["type"] == "heading_2"
+        ]
+        assert titles == [f"News {i}" for i in range(args.news)]
+
+        print(f"news: {args.news}, blocks: {len(server.blocks[page_id])}")
+        print(f"enqueue time: {enqueue_time * 1000:.1f}ms, total time: {total_time:.2f}s")
+        print(
+            f"requests: {notion_writer.request_count}, retries: {notion_writer.retry_count}, "
+            f"429 answered: {server.rate_limited_count}"
+        )
+
+
+if __name__ == "__main__":
+    main()
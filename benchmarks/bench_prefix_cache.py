@@ -0,0 +1,114 @@
+"""
+Compare the time to first token of the summary prompts with and without reusing the KV cache of the shared prefix (the role and PROMPT_PREFIX), on a small text model on CPU. The greedy outputs of both are checked to be the same.
+
+    python -m benchmarks.bench_prefix_cache --model Qwen/Qwen2.5-0.5B-Instruct --news 10
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from src.config import PROMPT_PREFIX, PROMPT_TEMPLATE, VLM_ROLE
+from src.models.prefix_cache import PrefixCache
+from src.models.registry import _FirstTokenTimer
+
+WORDS = "shares revenue quarter guidance analysts market investors growth margin outlook".split()
+
+
+def make_article(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def render(tokenizer, prompt: str, add_generation_prompt: bool = True) -> torch.Tensor:
+    messages = [
+        {"role": "system", "content": VLM_ROLE},
+        {"role": "user", "content": prompt},
+    ]
+    text = tokenizer.apply_chat_template(
+        messages, tokenize=False, add_generation_prompt=add_generation_prompt
+    )
+    return tokenizer(text, return_tensors="pt").input_ids
+
+
+def time_to_first_token(generate, input_ids: torch.Tensor, max_new_tokens: int):
+    timer = _FirstTokenTimer()
+    start = time.perf_counter()
+    output = generate(
+        input_ids,
+        torch.ones_like(input_ids),
+        do_sample=False,
+        max_new_tokens=max_new_tokens,
+        streamer=timer,
+    )
+    return timer.first_token_time - start, output[0, input_ids.shape[1] :].tolist()
+
+
+def main(model_id: str, n_news: int, article_words: int, max_new_tokens: int):
+    torch.set_num_threads(os.cpu_count())
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=torch.float32)
+    model.eval()
+
+    prefix_cache = PrefixCache(
+        model, render(tokenizer, PROMPT_PREFIX, add_generation_prompt=False)[0]
+    )
+
+    def generate(input_ids, attention_mask, **kwargs):
+        return model.generate(input_ids=input_ids, attention_mask=attention_mask, **kwargs)
+
+    rng = random.Random(0)
+    prompts = [
+        render(
+            tokenizer,
+            PROMPT_TEMPLATE.format(
+                title=f"News title {i}", news_text=make_article(rng, article_words)
+            ),
+        )
+        for i in range(n_news)
+    ]
+
+    # warm up both paths, which also computes the prefix cache once
+    time_to_first_token(generate, prompts[0], 1)
+    time_to_first_token(prefix_cache.generate, prompts[0], 1)
+
+    results = {"without prefix reuse": [], "with prefix reuse": []}
+    mismatches = 0
+    for input_ids in prompts:
+        ttft, plain_output = time_to_first_token(generate, input_ids, max_new_tokens)
+        results["without prefix reuse"].append(ttft)
+        ttft, cached_output = time_to_first_token(
+            prefix_cache.generate, input_ids, max_new_tokens
+        )
+        results["with prefix reuse"].append(ttft)
+        mismatches += plain_output != cached_output
+
+    prompt_tokens = statistics.mean(input_ids.shape[1] for input_ids in prompts)
+    print(
+        f"{model_id}: {n_news} prompts of {prompt_tokens:.0f} tokens on average, "
+        f"{len(prefix_cache.prefix_ids)} of them in the shared prefix"
+    )
+    for name, ttfts in results.items():
+        print(
+            f"{name:>22}: mean TTFT {statistics.mean(ttfts) * 1000:7.1f}ms, "
+            f"median {statistics.median(ttfts) * 1000:7.1f}ms"
+        )
+    print(
+        f"speedup: {statistics.mean(results['without prefix reuse']) / statistics.mean(results['with prefix reuse']):.2f}x, "
+        f"{mismatches} of {n_news} greedy outputs differ"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="Qwen/Qwen2.5-0.5B-Instruct")
+    parser.add_argument("--news", type=int, default=10)
+    parser.add_argument("--article-words", type=int, default=150)
+    parser.add_argument("--max-new-tokens", type=int, default=8)
+    args = parser.parse_args()
+
+    main(args.model, args.news, args.article_words, args.max_new_tokens)
@@ -0,0 +1,117 @@
+"""
+Compare process_news_df with its previous row by row implementation over synthetic yfinance news records, in time and peak memory.
+
+    python -m benchmarks.bench_process_news_df --news 20000
+"""
+
+import argparse
+import calendar
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from src.utils import process_news_df
+
+
+def legacy_process_news_df(news: pd.DataFrame, day_ago_time: int, today_time: int):
+    """
+    The implementation before the vectorised rewrite, without its debug file writes.
+    """
+    news_content_jsons = list(news["content"])
+    news_content_df = pd.DataFrame(news_content_jsons)
+    news_content_df = news_content_df[["title", "summary", "pubDate"]]
+
+    news_content_df["pubDate"] = news_content_df["pubDate"].apply(
+        lambda x: datetime.strptime(x, "%Y-%m-%dT%H:%M:%SZ")
+    ).apply(lambda x: calendar.timegm(x.timetuple()))
+
+    news_url_list = []
+    image_url_list = []
+    for news_json in news_content_jsons:
+        news_url = None
+        if news_json.get("canonicalUrl", None) is not None:
+            news_url = news_json["canonicalUrl"].get("url")
+        news_url_list.append(news_url)
+
+        image_url = None
+        if news_json.get("thumbnail", None) is not None:
+            image_url = news_json["thumbnail"].get("originalUrl")
+        image_url_list.append(image_url)
+
+    news_content_df["news_url"] = news_url_list
+    news_content_df["image_url"] = image_url_list
+
+    return news_content_df[
+        (news_content_df["pubDate"] >= day_ago_time)
+        & (news_content_df["pubDate"] <= today_time)
+    ]
+
+
+def make_news(n_news: int, now: datetime) -> pd.DataFrame:
+    rng = random.Random(0)
+    contents = []
+    for i in range(n_news):
+        pub_date = now - timedelta(hours=rng.uniform(0, 24 * 7))
+        contents.append(
+            {
+                "id": f"id-{i}",
+                "contentType": "STORY",
+                "title": f"News title {i}",
+                "summary": "Some summary of the news. " * 5,
+                "pubDate": pub_date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "canonicalUrl": {"url": f"https://finance.yahoo.com/news/{i}.html"},
+                "thumbnail": (
+                    {"originalUrl": f"https://s.yimg.com/{i}.jpg"}
+                    if rng.random() < 0.8
+                    else None
+                ),
+                "provider": {"displayName": "Yahoo Finance"},
+            }
+        )
+
+    return pd.DataFrame({"id": [c["id"] for c in contents], "content": contents})
+
+
+def measure(func, *args) -> tuple[float, float, pd.DataFrame]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak / 1024**2, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--news", type=int, default=20000)
+    parser.add_argument("--time-range", type=int, default=48 * 60 * 60)
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    today_time = int(now.timestamp())
+    day_ago_time = today_time - args.time_range
+    news = make_news(args.news, now)
+
+    legacy_time, legacy_peak, legacy_df = measure(
+        legacy_process_news_df, news, day_ago_time, today_time
+    )
+    new_time, new_peak, new_df = measure(process_news_df, news, day_ago_time, today_time)
+
+    # same news and fields, whatever the dtypes and missing value markers
+    assert legacy_df.reset_index(drop=True).astype(object).fillna("").values.tolist() == (
+        new_df.reset_index(drop=True).astype(object).fillna("").values.tolist()
+    )
+
+    print(f"news: {args.news}, kept: {len(new_df)}")
+    print(f"legacy:     {legacy_time * 1000:.1f}ms, peak {legacy_peak:.1f}MiB")
+    print(f"vectorised: {new_time * 1000:.1f}ms, peak {new_peak:.1f}MiB")
+    print(f"speedup:    {legacy_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark FinanceNewsScrapper.scrap against a local stub server, comparing one by one fetching with the concurrent fetch mode.
+
+    python -m benchmarks.bench_scrap --tickers 20 --news-per-ticker 10 --latency 0.1
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.stub_server import StubServer
+from src.news_scrapper import FinanceNewsScrapper
+
+
+def make_news_obj(base_url: str, n_tickers: int, news_per_ticker: int) -> dict:
+    return {
+        f"T{t}": pd.DataFrame(
+            {
+                "title": [f"T{t}-news-{i}" for i in range(news_per_ticker)],
+                "news_url": [
+                    f"{base_url}/T{t}-news-{i}" for i in range(news_per_ticker)
+                ],
+                # a thumbnail is given, so no image is downloaded
+                "image_url": ["thumbnail"] * news_per_ticker,
+            }
+        )
+        for t in range(n_tickers)
+    }
+
+
+def run(scrapper: FinanceNewsScrapper, news_obj: dict) -> tuple[float, dict]:
+    scrapper._get_news_obj = lambda tickers: news_obj
+
+    start = time.perf_counter()
+    result = scrapper.scrap(list(news_obj), verbose=False)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=20)
+    parser.add_argument("--news-per-ticker", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--per-host", type=int, default=16)
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency) as server:
+        news_obj = make_news_obj(server.url, args.tickers, args.news_per_ticker)
+        n_articles = args.tickers * args.news_per_ticker
+
+        serial_time, serial_result = run(FinanceNewsScrapper(max_workers=1), news_obj)
+        concurrent_time, concurrent_result = run(
+            FinanceNewsScrapper(
+                max_workers=args.workers, max_requests_per_host=args.per_host
+            ),
+            news_obj,
+        )
+
+    assert serial_result == concurrent_result
+
+    print(f"articles: {n_articles}, latency per request: {args.latency}s")
+    print(f"serial:     {serial_time:.2f}s ({n_articles / serial_time:.1f} articles/s)")
+    print(
+        f"concurrent: {concurrent_time:.2f}s ({n_articles / concurrent_time:.1f} articles/s)"
+    )
+    print(f"speedup:    {serial_time / concurrent_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure the overhead of the tracing instrumentation: the cost of a span with the tracer disabled and enabled, then a scrap against the local stub server with and without tracing. The trace of the traced scrap is written for chrome://tracing or https://ui.perfetto.dev.
+
+    python -m benchmarks.bench_tracing --trace scrap_trace.json
+"""
+
+import argparse
+import timeit
+
+from benchmarks.bench_scrap import make_news_obj, run
+from benchmarks.stub_server import StubServer
+from src.news_scrapper import FinanceNewsScrapper
+from src.tracing import traced, tracer
+
+
+@traced("bench.function")
+def traced_function():
+    pass
+
+
+def untraced_function():
+    pass
+
+
+def span_block():
+    with tracer.span("bench.span", key=1):
+        pass
+
+
+def bench_spans(number: int) -> None:
+    baseline = timeit.timeit(untraced_function, number=number) / number
+    for enabled in (False, True):
+        tracer.enabled = enabled
+        span_time = timeit.timeit(span_block, number=number) / number
+        function_time = timeit.timeit(traced_function, number=number) / number
+        print(
+            f"tracer {'enabled ' if enabled else 'disabled'}: span {span_time * 1e9:>6.0f}ns, "
+            f"decorated call {(function_time - baseline) * 1e9:>6.0f}ns over a plain call"
+        )
+    tracer.disable()
+    tracer.reset()
+
+
+def bench_scrap(n_tickers: int, news_per_ticker: int, latency: float, trace_path: str) -> None:
+    with StubServer(latency=latency) as server:
+        news_obj = make_news_obj(server.url, n_tickers, news_per_ticker)
+
+        for enabled in (False, True):
+            tracer.enabled = enabled
+            elapsed, _ = run(FinanceNewsScrapper(max_workers=16, max_requests_per_host=16), news_obj)
+            print(f"scrap with tracer {'enabled ' if enabled else 'disabled'}: {elapsed:.2f}s")
+
+    tracer.disable()
+    tracer.export_chrome_trace(trace_path)
+    print(f"{len(tracer.events)} spans written to {trace_path}")
+    print(tracer.summary())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200000)
+    parser.add_argument("--tickers", type=int, default=20)
+    parser.add_argument("--news-per-ticker", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--trace", default="scrap_trace.json")
+    args = parser.parse_args()
+
+    bench_spans(args.number)
+    bench_scrap(args.tickers, args.news_per_ticker, args.latency, args.trace)
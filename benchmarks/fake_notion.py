@@ -0,0 +1,86 @@
+import json
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeNotionServer:
+    """
+    A local server implementing the few Notion API endpoints used by NotionClient. It counts the requests and keeps the appended blocks of each page in memory.
+    """
+
+    def __init__(self):
+        self.request_count = 0
+        self.requests = []  # (method, path)
+        self.blocks = {}  # page_id -> appended blocks
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _send_json(self, status: int, body: dict, headers: dict = None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self):
+                body = self._read_json() if self.command != "GET" else {}
+                with server._lock:
+                    server.request_count += 1
+                    server.requests.append((self.command, self.path))
+
+                response = server.handle(self.command, self.path, body)
+                self._send_json(*response)
+
+            do_GET = do_POST = do_PATCH = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def handle(self, method: str, path: str, body: dict) -> tuple:
+        """
+        Return (status, json body[, headers]) of a request. Subclasses can override it to inject errors.
+        """
+        if match := re.search(r"/blocks/([^/]+)/children", path):
+            # the created blocks get their ids, as with Notion
+            children = [dict(block, id=str(uuid.uuid4())) for block in body["children"]]
+            with self._lock:
+                self.blocks.setdefault(match.group(1), []).extend(children)
+            return 200, {"object": "list", "results": children}
+
+        if path.endswith("/search"):
+            return 200, {"object": "list", "results": []}
+
+        if path.endswith("/pages") and method == "POST":
+            return 200, {"object": "page", "id": str(uuid.uuid4())}
+
+        if match := re.search(r"/pages/([^/]+)", path):
+            return 200, {"object": "page", "id": match.group(1)}
+
+        return 404, {"object": "error", "message": f"Unknown endpoint {path}"}
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
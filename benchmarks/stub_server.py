@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ARTICLE_HTML = """
+<html>
+  <head><title>{title}</title></head>
+  <body>
+    <div class="caas-body">
+      <p>{title}. Shares moved after the company reported quarterly results.</p>
+      <p>Analysts said the guidance was in line with expectations. Story continues</p>
+      <p>The stock has been volatile in recent sessions. View comments</p>
+    </div>
+  </body>
+</html>
+"""
+
+
+def article_page(path: str) -> tuple[str, bytes]:
+    return (
+        "text/html; charset=utf-8",
+        ARTICLE_HTML.format(title=path.strip("/")).encode(),
+    )
+
+
+class StubServer:
+    """
+    A local HTTP server serving canned Yahoo article HTML for every path, with an artificial latency per request. <respond> can serve other contents: it gets the path and returns (content type, body bytes), or None for a 404. The requests are counted per first path segment in <requests>.
+    """
+
+    def __init__(self, latency: float = 0.1, respond=None):
+        self.latency = latency
+        self.respond = respond if respond is not None else article_page
+        self.request_count = 0
+        self.requests = Counter()
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.request_count += 1
+                    server.requests[self.path.strip("/").split("/")[0]] += 1
+                time.sleep(server.latency)
+
+                response = server.respond(self.path)
+                if response is None:
+                    self.send_error(404)
+                    return
+
+                content_type, body = response
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
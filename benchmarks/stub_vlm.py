@@ -0,0 +1,132 @@
+import hashlib
+import re
+import threading
+import time
+
+from src.structured import SENTIMENTS, GeneratedText, SentimentResult
+
+_WORD_RE = re.compile(r"\s*\S+")
+
+
+class StubVLM:
+    """
+    Deterministic stand-in of Qwen25Vision for the benchmarks, with the same generation methods and no weights. A batch sleeps as long as a model would take: the prompt tokens at <prefill_tokens_per_second>, then one <decode_step> per generated token, shared by the whole batch. The words of the prompts are counted as their tokens.
+    """
+
+    model_id = "stub/latency-simulator"
+
+    # latency model, set by the benchmark before the stub is loaded (a fast model by default, so the other stages show)
+    prefill_tokens_per_second = 50000.0
+    decode_step = 0.002
+    output_tokens = 100
+
+    def __init__(self, device: str = None, load_config=None):
+        self.device = device if device is not None else "cpu"
+        self.load_config = load_config
+
+        self.calls = 0
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.busy_time = 0.0
+        self._lock = threading.Lock()
+
+    def generate_batch(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=1500,
+        temperature=0.6,
+        streamer=None,
+    ) -> list[str]:
+        n_tokens = min(self.output_tokens, max_new_token)
+        self._simulate(prompts, n_tokens, streamer)
+
+        return [GeneratedText(self._summary(prompt, n_tokens), n_tokens) for prompt in prompts]
+
+    def generate_structured(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=None,
+        temperature=None,
+        streamer=None,
+    ) -> list[SentimentResult]:
+        n_tokens = min(self.output_tokens, max_new_token or self.output_tokens)
+        self._simulate(prompts, n_tokens, streamer)
+
+        results = []
+        for prompt in prompts:
+            digest = hashlib.sha1(prompt.encode("utf-8")).digest()
+            results.append(
+                SentimentResult(
+                    self._summary(prompt, n_tokens),
+                    SENTIMENTS[digest[0] % len(SENTIMENTS)],
+                    0.5 + digest[1] / 510,
+                    n_tokens,
+                )
+            )
+
+        return results
+
+    def _simulate(self, prompts: list[str], n_tokens: int, streamer) -> None:
+        prompt_tokens = sum(len(_WORD_RE.findall(prompt)) for prompt in prompts)
+        prefill_time = prompt_tokens / self.prefill_tokens_per_second
+
+        start = time.perf_counter()
+        time.sleep(prefill_time)
+        if streamer is not None:
+            # the prompt, then the first token
+            streamer.put(None)
+            streamer.put(None)
+        time.sleep(max(n_tokens - 1, 0) * self.decode_step)
+        if streamer is not None:
+            streamer.end()
+
+        with self._lock:
+            self.calls += 1
+            self.prompts += len(prompts)
+            self.prompt_tokens += prompt_tokens
+            self.busy_time += time.perf_counter() - start
+
+    @staticmethod
+    def _summary(prompt: str, n_tokens: int) -> str:
+        words = _WORD_RE.findall(prompt)[-n_tokens:]
+        return "".join(words).strip()
+
+    def stats(self) -> dict:
+        return {
+            "model_id": self.model_id,
+            "calls": self.calls,
+            "prompts": self.prompts,
+            "prompt_tokens": self.prompt_tokens,
+            "busy_time": self.busy_time,
+        }
+
+
+class WordTokenizer:
+    """
+    Word level tokenizer standing in for the tokenizer of the model in PromptBuilder, when transformers or the tokenizer files are not available offline. The words (with their leading spaces) are the tokens, so decode gives back the text.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._words = []
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str, add_special_tokens: bool = False) -> dict:
+        return {"input_ids": [self._id(word) for word in _WORD_RE.findall(text)]}
+
+    def _id(self, word: str) -> int:
+        token_id = self._ids.get(word)
+        if token_id is None:
+            with self._lock:
+                token_id = self._ids.setdefault(word, len(self._words))
+                if token_id == len(self._words):
+                    self._words.append(word)
+
+        return token_id
+
+    def decode(self, input_ids: list[int]) -> str:
+        return "".join(self._words[token_id] for token_id in input_ids)
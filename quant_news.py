@@ -1,48 +1,345 @@
+import argparse
+import functools
 import json
+import time
 from datetime import datetime
 
-from src.config import PROMPT_TEMPLATE, VLM_ROLE
-from src.models.qwen_vision import Qwen25Vision
+from src.config import VLM_BATCH_SIZE
+from src.models.load_config import LoadConfig, add_load_config_arguments
+from src.models.pool import InferencePool
+from src.models.registry import DEFAULT_SOCKET_PATH, MODELS, get_vlm
 from src.news_scrapper import FinanceNewsScrapper
 from src.notion import NotionClient
+from src.notion_writer import AsyncNotionWriter
+from src.pipeline import NewsPipeline
+from src.seen_index import SeenIndex
+from src.sentiment import EscalationRules, SentimentClassifier, TieredSummarizer
+from src.sharding import ShardQueue, format_progress, merge_run, run_workers
+from src.summarizer import NewsSummarizer, PromptBuilder
+from src.summary_cache import CachedVLM, SummaryCache
+from src.tracing import SamplingProfiler, tracer
 from src.utils import notion_add_news_part
 
 
-def main():
+def main(
+    batch_size: int = VLM_BATCH_SIZE,
+    pipelined: bool = False,
+    use_cache: bool = True,
+    model_name: str = "qwen",
+    vlm_socket_path: str = DEFAULT_SOCKET_PATH,
+    incremental: bool = False,
+    use_pool: bool = False,
+    structured: bool = False,
+    tiered: bool = False,
+    load_config: LoadConfig = None,
+    num_shards: int = 0,
+    shard_processes: int = None,
+    shard_queue_path: str = "shards.cache",
+    shard_role: str = "all",
+    run_id: str = None,
+    shard_queue_wal: bool = True,
+):
+    today = datetime.today().strftime("%Y-%m-%d")
+
+    if num_shards > 0 or shard_role != "all":
+        # the watchlist is split into shards processed by worker processes (of this host or others), then merged into one page
+        main_sharded(
+            num_shards,
+            shard_processes,
+            shard_queue_path,
+            shard_role,
+            run_id if run_id is not None else today,
+            {
+                "batch_size": batch_size,
+                "use_cache": use_cache,
+                "model_name": model_name,
+                "vlm_socket_path": vlm_socket_path,
+                "incremental": incremental,
+                "structured": structured,
+                "tiered": tiered,
+                "load_config": load_config,
+                "queue_wal": shard_queue_wal,
+            },
+        )
+        return
+
     notion = NotionClient()
-    scrapper = FinanceNewsScrapper()
-    vlm = Qwen25Vision()
+    # in incremental mode, the news written by the previous runs are not processed again
+    seen_index = SeenIndex() if incremental else None
+    scrapper = FinanceNewsScrapper(seen_index=seen_index)
+    if use_pool:
+        # one model process per available GPU (or a few CPU processes)
+        vlm = InferencePool(
+            model_name, micro_batch_size=batch_size, load_config=load_config
+        )
+        # the pool spreads a batch over its workers, so give it a batch for each of them
+        batch_size *= len(vlm.stats()["devices"])
+    else:
+        # the model is loaded on the first generation only, or served by a running VLM server
+        vlm = get_vlm(model_name, vlm_socket_path, load_config)
+    # in tiered mode, a small classifier labels every news and the VLM only summarizes the escalated ones
+    classifier = SentimentClassifier() if tiered else None
+    escalation_rules = EscalationRules.from_file("tickers.json") if tiered else None
+    # summaries already generated in previous runs are taken from the cache
+    cache = SummaryCache() if use_cache else None
 
     with open("tickers.json", "r") as f:
         tickers = json.load(f)["tickers"]
 
-    tickers_news = scrapper.scrap(tickers)
-
-    today = datetime.today().strftime("%Y-%m-%d")
     sub_page_title = f"{today} - Finance News"
     sub_pages = notion.create_page(sub_page_title)
     sub_pages_id = sub_pages["id"]
 
-    for ticker, news in tickers_news.items():
-        for news_title, news_contents in news.items():
-            news_text, news_image, news_url = news_contents
+    if pipelined:
+        # scrapping, generation and Notion writes run concurrently
+        pipeline = NewsPipeline(
+            scrapper,
+            vlm,
+            sub_pages_id,
+            batch_size=batch_size,
+            cache=cache,
+            seen_index=seen_index,
+            structured=structured,
+            classifier=classifier,
+            escalation_rules=escalation_rules,
+        )
+        pipeline.run(tickers)
+        print(pipeline.summarizer.report())
+        if use_pool:
+            vlm.close()
+        print(f"VLM: {vlm.stats()}")
+        if cache is not None:
+            print(f"Summary cache: {cache.stats()}")
+        print(f"HTTP cache: {scrapper.http_cache.stats()}")
+        return
+
+    # long articles are summarized chunk by chunk within the token budget
+    summarizer = NewsSummarizer(
+        CachedVLM(vlm, cache),
+        PromptBuilder.from_model_id(vlm.model_id),
+        structured=structured,
+    )
+    if tiered:
+        summarizer = TieredSummarizer(summarizer, classifier, escalation_rules)
 
-            prompt = PROMPT_TEMPLATE.format(title=news_title, news_text=news_text)
+    # a news shared by several tickers is scrapped and summarized only once
+    articles, scrapped_at = [], {}
+    for news_tickers, news_title, news_contents in scrapper.iter_news(tickers):
+        articles.append((news_tickers, news_title, *news_contents))
+        # the latency of the news starts when it is scrapped
+        scrapped_at[news_contents[-1]] = time.perf_counter()
 
-            vlm_response = vlm(VLM_ROLE, prompt, news_image)
+    # the news parts are written to Notion in the background while the next batch is generated
+    notion_writer = AsyncNotionWriter()
 
+    for i in range(0, len(articles), batch_size):
+        batch = articles[i : i + batch_size]
+
+        vlm_responses = summarizer.summarize_batch(
+            [news_title for _, news_title, _, _, _ in batch],
+            [news_text for _, _, news_text, _, _ in batch],
+            [news_image for _, _, _, news_image, _ in batch],
+            [news_url for _, _, _, _, news_url in batch],
+            news_tickers=[news_tickers for news_tickers, _, _, _, _ in batch],
+            start_times=[scrapped_at[news_url] for _, _, _, _, news_url in batch],
+        )
+
+        for (news_tickers, news_title, _, _, news_url), vlm_response in zip(
+            batch, vlm_responses
+        ):
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-            notion_add_news_part(
-                notion,
-                sub_pages_id,
-                news_title,
-                vlm_response,
-                news_url,
-                ticker,
-                current_time,
-            )
+            for ticker in news_tickers:
+                notion_add_news_part(
+                    notion_writer,
+                    sub_pages_id,
+                    news_title,
+                    vlm_response,
+                    news_url,
+                    ticker,
+                    current_time,
+                    on_written=(
+                        functools.partial(
+                            seen_index.mark_written, news_url, ticker, news_title, sub_pages_id
+                        )
+                        if seen_index is not None
+                        else None
+                    ),
+                )
+
+    notion_writer.close()
+
+    print(summarizer.report())
+    if use_pool:
+        vlm.close()
+    print(f"VLM: {vlm.stats()}")
+    if cache is not None:
+        print(f"Summary cache: {cache.stats()}")
+    print(f"HTTP cache: {scrapper.http_cache.stats()}")
+
+
+def main_sharded(
+    num_shards: int,
+    processes: int,
+    queue_path: str,
+    role: str,
+    run_id: str,
+    worker_options: dict,
+):
+    """
+    Sharded run of the watchlist. The "all" role creates the run (or resumes it), runs <processes> shard workers on this host and merges the summaries into the daily page. The "worker" role only processes the shards of an existing run, e.g. on other hosts sharing the queue file, and the "merge" role only writes the summaries of the finished shards.
+    """
+    shard_queue = ShardQueue(queue_path, wal=worker_options["queue_wal"])
+
+    if role == "all":
+        with open("tickers.json", "r") as f:
+            tickers = json.load(f)["tickers"]
+        shard_queue.create_run(run_id, tickers, num_shards)
+    elif shard_queue.run_tickers(run_id) is None:
+        raise ValueError(
+            f"No run {run_id} in {queue_path}, please start it with --shards first."
+        )
+
+    if role in ("all", "worker"):
+        run_workers(
+            queue_path,
+            run_id,
+            processes,
+            worker_options,
+        )
+
+    if role == "worker":
+        return
+
+    progress = shard_queue.progress(run_id)
+    if not shard_queue.is_finished(run_id):
+        print(format_progress(progress))
+        print(f"Run {run_id} still has shards to process, merging later")
+        return
+
+    notion = NotionClient()
+    # the page of the day of the run
+    sub_pages = notion.create_page(f"{run_id} - Finance News")
+    seen_index = SeenIndex() if worker_options["incremental"] else None
+    written = merge_run(shard_queue, run_id, sub_pages["id"], seen_index)
+
+    print(format_progress(progress))
+    print(f"Merged {written} news parts of run {run_id}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=VLM_BATCH_SIZE)
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="overlap scrapping, generation and Notion writes",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="summarize every news again instead of reusing the cached summaries",
+    )
+    parser.add_argument("--model", default="qwen", choices=list(MODELS))
+    parser.add_argument(
+        "--vlm-socket",
+        default=DEFAULT_SOCKET_PATH,
+        help="socket of the VLM server (python -m src.models.registry) to reuse its loaded model",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip the news already written to Notion by the previous runs",
+    )
+    parser.add_argument(
+        "--pool",
+        action="store_true",
+        help="run one model process per available GPU, or CPU processes without GPU",
+    )
+    parser.add_argument(
+        "--structured",
+        action="store_true",
+        help="generate a short JSON answer with a constrained sentiment label and its confidence",
+    )
+    parser.add_argument(
+        "--tiered",
+        action="store_true",
+        help="label every news with a small sentiment classifier and only summarize the escalated ones with the VLM",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="split the watchlist into this many shards, processed by worker processes and merged into one page",
+    )
+    parser.add_argument(
+        "--shard-processes",
+        type=int,
+        default=None,
+        help="number of shard worker processes on this host (default: one per GPU, or one per shard with a VLM server)",
+    )
+    parser.add_argument(
+        "--shard-queue",
+        default="shards.cache",
+        help="SQLite job queue of the sharded runs, on a shared filesystem to add workers of other hosts",
+    )
+    parser.add_argument(
+        "--shard-queue-hosts",
+        action="store_true",
+        help="the shard queue is shared with workers of other hosts on a network filesystem, where SQLite cannot use WAL",
+    )
+    parser.add_argument(
+        "--shard-role",
+        default="all",
+        choices=["all", "worker", "merge"],
+        help="worker: only process the shards of an existing run, merge: only write the finished run to Notion",
+    )
+    parser.add_argument(
+        "--run-id", default=None, help="id of the sharded run to resume (default: today)"
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        help="write a Chrome trace (JSON) of the run to this path and print the time spent per stage",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="sample the Python stacks during the run and write them as collapsed stacks to this path",
+    )
+    # how the model is loaded when it is not served by a running VLM server
+    add_load_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.trace is not None:
+        tracer.enable()
+    profiler = SamplingProfiler() if args.profile is not None else None
+    if profiler is not None:
+        profiler.start()
+
+    try:
+        main(
+            batch_size=args.batch_size,
+            pipelined=args.pipelined,
+            use_cache=not args.no_cache,
+            model_name=args.model,
+            vlm_socket_path=args.vlm_socket,
+            incremental=args.incremental,
+            use_pool=args.pool,
+            structured=args.structured,
+            tiered=args.tiered,
+            load_config=LoadConfig.from_args(args),
+            num_shards=args.shards,
+            shard_processes=args.shard_processes,
+            shard_queue_path=args.shard_queue,
+            shard_role=args.shard_role,
+            run_id=args.run_id,
+            shard_queue_wal=not args.shard_queue_hosts,
+        )
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.export_collapsed(args.profile)
+        if args.trace is not None:
+            tracer.export_chrome_trace(args.trace)
+            print(tracer.summary())
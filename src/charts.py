@@ -0,0 +1,315 @@
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from .config import (
+    CHART_BATCH_SIZE,
+    CHART_PROMPT_TEMPLATE,
+    CHART_ROLE,
+    CHART_STYLE,
+    CHART_WINDOW,
+)
+from .image_store import ImageStore, StoredImage
+from .price_store import PriceStore
+
+# bump it when the drawing code changes, so the cached charts are rendered again
+CHART_VERSION = 1
+
+
+class ChartCache(ImageStore):
+    """
+    Store of the rendered charts, under the hash of what they show: the ticker, the window, the last bar and the style. A chart is only rendered again when a new bar is stored or the style changes. The charts are images of the ImageStore, so the preprocessed features of the model are cached next to them as for the news images.
+    """
+
+    def __init__(self, root: str = "chart_cache"):
+        super().__init__(root)
+
+    @staticmethod
+    def make_key(ticker: str, window: int, last_bar: str, style: dict) -> str:
+        key = json.dumps(
+            [CHART_VERSION, ticker, window, last_bar, style], sort_keys=True
+        )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[StoredImage]:
+        if not os.path.exists(self._image_path(key)):
+            return None
+
+        return StoredImage(self, key)
+
+    def put_chart(self, key: str, png: bytes) -> StoredImage:
+        self._atomic_write(self._image_path(key), lambda f: f.write(png))
+
+        return StoredImage(self, key)
+
+
+def adjusted_bars(table, window: int) -> dict[str, np.ndarray]:
+    """
+    The OHLCV of the last <window> bars of a PriceStore table, adjusted for the dividends and splits. The adjusted closes of the store come from different downloads, so the adjustment is rebuilt from the stored daily returns, anchored on the last close.
+    """
+    bars = {
+        column: table.column(column).to_numpy()[-window:]
+        for column in ("open", "high", "low", "close", "volume", "ret")
+    }
+    bars["date"] = table.column("date").to_numpy().astype("datetime64[D]")[-window:]
+
+    growth = np.cumprod(np.r_[1.0, 1.0 + np.nan_to_num(bars["ret"][1:])])
+    adjusted_close = bars["close"][-1] * growth / growth[-1]
+    factor = adjusted_close / bars["close"]
+    for column in ("open", "high", "low", "close"):
+        bars[column] = bars[column] * factor
+
+    return bars
+
+
+def render_chart(ticker: str, bars: dict[str, np.ndarray], window: int, style: dict) -> bytes:
+    """
+    Draw the candlesticks of the last <window> bars with the moving averages and the volume, and return the PNG. The bars may hold more than <window> bars, to compute the moving averages from the first drawn bar. The figure is drawn with the Agg canvas, without pyplot or a display.
+    """
+    from matplotlib.collections import PolyCollection
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import FuncFormatter
+
+    closes = bars["close"]
+    moving_averages = {
+        length: np.convolve(closes, np.ones(length) / length, mode="full")[: len(closes)]
+        for length in style["moving_averages"]
+    }
+    for length, values in moving_averages.items():
+        values[: length - 1] = np.nan
+
+    drawn = slice(-window, None)
+    opens, highs, lows, closes = (
+        bars[column][drawn] for column in ("open", "high", "low", "close")
+    )
+    dates = bars["date"][drawn]
+    x = np.arange(len(closes))
+    colors = np.where(closes >= opens, style["up_color"], style["down_color"])
+
+    # a fixed layout, tight_layout would draw the figure once more to measure it
+    figure = Figure(figsize=(style["width"], style["height"]), dpi=style["dpi"])
+    figure.subplots_adjust(left=0.08, right=0.95, top=0.93, bottom=0.08, hspace=0.05)
+    if style["volume"]:
+        price_ax, volume_ax = figure.subplots(
+            2, 1, sharex=True, gridspec_kw={"height_ratios": [3, 1]}
+        )
+    else:
+        price_ax, volume_ax = figure.subplots(), None
+
+    # the wicks and the bodies are one collection each rather than one artist per bar
+    price_ax.vlines(x, lows, highs, colors=colors, linewidth=0.8)
+    price_ax.add_collection(
+        PolyCollection(
+            _boxes(x, np.minimum(opens, closes), np.maximum(opens, closes)),
+            facecolors=colors,
+            edgecolors=colors,
+            linewidths=0.5,
+        )
+    )
+    for length, values in moving_averages.items():
+        price_ax.plot(x, values[drawn], linewidth=1.0, label=f"SMA {length}")
+    if moving_averages:
+        price_ax.legend(loc="upper left", fontsize=8)
+    price_ax.set_title(f"{ticker} daily, last {len(x)} bars up to {dates[-1]}")
+    price_ax.grid(alpha=0.3)
+
+    if volume_ax is not None:
+        volumes = bars["volume"][drawn]
+        volume_ax.add_collection(
+            PolyCollection(
+                _boxes(x, np.zeros_like(volumes), volumes),
+                facecolors=colors,
+                linewidths=0,
+            )
+        )
+        volume_ax.set_ylim(0, max(np.nanmax(volumes), 1.0) * 1.05)
+        volume_ax.yaxis.set_major_formatter(FuncFormatter(lambda v, _: f"{v / 1e6:g}M"))
+        volume_ax.set_ylabel("Volume")
+        volume_ax.grid(alpha=0.3)
+
+    price_ax.set_xlim(-1, len(x))
+    price_ax.autoscale_view(scalex=False)
+    ticks = np.linspace(0, len(x) - 1, min(6, len(x)), dtype=int)
+    (volume_ax if volume_ax is not None else price_ax).set_xticks(
+        ticks, [str(dates[i]) for i in ticks]
+    )
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+
+    return buffer.getvalue()
+
+
+def _boxes(x: np.ndarray, bottoms: np.ndarray, tops: np.ndarray, width: float = 0.6) -> np.ndarray:
+    """
+    The (bars, 4, 2) vertices of the rectangles of width <width> centered on x.
+    """
+    left, right = x - width / 2, x + width / 2
+    return np.stack(
+        [
+            np.column_stack([left, bottoms]),
+            np.column_stack([left, tops]),
+            np.column_stack([right, tops]),
+            np.column_stack([right, bottoms]),
+        ],
+        axis=1,
+    )
+
+
+def render_from_store(store_root: str, ticker: str, window: int, style: dict) -> bytes:
+    """
+    Entry point of the rendering processes: the bars are read from the memory-mapped store in the process, rather than sent to it.
+    """
+    table = PriceStore(store_root).read(ticker)
+    warm_up = max(style["moving_averages"], default=1) - 1
+
+    return render_chart(ticker, adjusted_bars(table, window + warm_up), window, style)
+
+
+class ChartRenderer:
+    """
+    Render the charts of many tickers in parallel worker processes, and take the unchanged ones from the cache. The charts are rendered in <processes> spawned processes (the CPU count by default, 0 renders in this process).
+    """
+
+    def __init__(
+        self,
+        store: PriceStore,
+        cache: ChartCache = None,
+        window: int = CHART_WINDOW,
+        style: dict = None,
+        processes: int = None,
+    ):
+        self.store = store
+        self.cache = cache if cache is not None else ChartCache()
+        self.window = window
+        self.style = style if style is not None else CHART_STYLE
+        self.processes = processes if processes is not None else (os.cpu_count() or 1)
+
+        self.rendered = 0
+        self.hits = 0
+        self.render_time = 0.0
+
+    def render(self, tickers: list[str]) -> dict[str, StoredImage]:
+        """
+        The chart of each ticker with stored bars, rendered or from the cache.
+        """
+        charts, missed = {}, {}
+        for ticker in tickers:
+            last_bar = self.store.last_date(ticker)
+            if last_bar is None:
+                continue
+
+            key = ChartCache.make_key(ticker, self.window, last_bar.isoformat(), self.style)
+            chart = self.cache.get(key)
+            if chart is not None:
+                charts[ticker] = chart
+                self.hits += 1
+            else:
+                missed[ticker] = key
+
+        if not missed:
+            return {ticker: charts[ticker] for ticker in tickers if ticker in charts}
+
+        start = time.perf_counter()
+        args = (
+            [self.store.root] * len(missed),
+            list(missed),
+            [self.window] * len(missed),
+            [self.style] * len(missed),
+        )
+        if self.processes > 0 and len(missed) > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(self.processes, len(missed)),
+                mp_context=mp.get_context("spawn"),
+            ) as executor:
+                chunksize = max(len(missed) // (4 * self.processes), 1)
+                pngs = list(executor.map(render_from_store, *args, chunksize=chunksize))
+        else:
+            pngs = list(map(render_from_store, *args))
+
+        for (ticker, key), png in zip(missed.items(), pngs):
+            charts[ticker] = self.cache.put_chart(key, png)
+        self.rendered += len(missed)
+        self.render_time += time.perf_counter() - start
+
+        return {ticker: charts[ticker] for ticker in tickers if ticker in charts}
+
+    def stats(self) -> dict:
+        total = self.rendered + self.hits
+        return {
+            "rendered": self.rendered,
+            "hits": self.hits,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "render_time": self.render_time,
+            "charts_per_second": (
+                self.rendered / self.render_time if self.render_time > 0 else 0.0
+            ),
+        }
+
+
+def analyze_charts(
+    vlm,
+    charts: dict[str, StoredImage],
+    window: int = CHART_WINDOW,
+    batch_size: int = CHART_BATCH_SIZE,
+) -> dict[str, str]:
+    """
+    Ask the VLM to analyze the chart of each ticker, <batch_size> charts per generation. With a CachedVLM, an unchanged chart is not analyzed again.
+    """
+    tickers = list(charts)
+    analyses = {}
+    for i in range(0, len(tickers), batch_size):
+        batch = tickers[i : i + batch_size]
+        outputs = vlm.generate_batch(
+            CHART_ROLE,
+            [CHART_PROMPT_TEMPLATE.format(ticker=ticker, window=window) for ticker in batch],
+            [charts[ticker] for ticker in batch],
+        )
+        analyses.update(zip(batch, outputs))
+
+    return analyses
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render the charts of the watchlist from the price store, and optionally analyze them with the VLM."
+    )
+    parser.add_argument("--tickers", default="tickers.json")
+    parser.add_argument("--store", default="price_store")
+    parser.add_argument("--window", type=int, default=CHART_WINDOW)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument(
+        "--analyze", action="store_true", help="analyze the charts with the VLM"
+    )
+    parser.add_argument("--model", default="qwen")
+    parser.add_argument("--batch-size", type=int, default=CHART_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with open(args.tickers, "r") as f:
+        tickers = json.load(f)["tickers"]
+
+    renderer = ChartRenderer(
+        PriceStore(args.store), window=args.window, processes=args.processes
+    )
+    charts = renderer.render(tickers)
+    print(f"Charts: {renderer.stats()}")
+
+    if args.analyze:
+        from .models.registry import DEFAULT_SOCKET_PATH, get_vlm
+        from .summary_cache import CachedVLM, SummaryCache
+
+        cache = SummaryCache()
+        vlm = CachedVLM(get_vlm(args.model, DEFAULT_SOCKET_PATH), cache)
+        for ticker, analysis in analyze_charts(
+            vlm, charts, args.window, args.batch_size
+        ).items():
+            print(f"{ticker}:\n{analysis}\n")
+        print(f"Summary cache: {cache.stats()}")
@@ -1,6 +1,7 @@
 VLM_ROLE = "You are a financial analyst with expertise in analyzing and summarizing finance news articles."
 
-PROMPT_TEMPLATE = """
+# the instructions shared by the prompts of all the news, kept as the prefix of PROMPT_TEMPLATE so that their KV cache can be computed once and reused
+PROMPT_PREFIX = """
     You will receive a finance news article, title, and an associated image. Your task is to summarize and analyze the article. The task requires the following actions:
 
     1. Read the news article and title.
@@ -11,7 +12,11 @@ PROMPT_TEMPLATE = """
     
     NOTE: Ensure your summary is clear and concise. You MUST output only the plain text summary. You MUST output the sentiment of the article.
 
-    Given news title: {title}
+    """
+
+PROMPT_TEMPLATE = (
+    PROMPT_PREFIX
+    + """Given news title: {title}
 
     News article content: {news_text}
 
@@ -21,3 +26,129 @@ PROMPT_TEMPLATE = """
     
     Sentiment: [Positive/Negative/Neutral]
     """
+)
+
+# number of news articles summarized together in one generation call
+VLM_BATCH_SIZE = 4
+
+# the article text of a news whose page could not be fetched, which is summarized again by the next run instead of being cached
+FAILED_CONTENT_PREFIX = "Failed to get content from "
+
+# token budget of the article text in one prompt, longer articles are summarized chunk by chunk
+MAX_ARTICLE_TOKENS = 3000
+CHUNK_TOKENS = 1500
+CHUNK_SUMMARY_MAX_NEW_TOKENS = 256
+
+CHUNK_PROMPT_TEMPLATE = """
+    You will receive one part of a long finance news article. Summarize the key facts, figures and opinions of this part in a few plain text sentences. Do not add anything that is not in the text.
+
+    Given news title: {title}
+
+    Part {index} of {total} of the news article: {news_text}
+    """
+
+REDUCE_PROMPT_TEMPLATE = """
+    You will receive the summaries of the consecutive parts of a finance news article, its title, and an associated image. Your task is to summarize and analyze the whole article. The task requires the following actions:
+
+    1. Read the summaries of the parts and the title.
+    2. Examine the image, and determine if it is relevant to the article.
+    3. Write a concise, clear summary of the whole article in plain text.
+    4. Determine the sentiment of the article: positive, negative, or neutral.
+    5. End your summary with a newline.
+
+    NOTE: Ensure your summary is clear and concise. You MUST output only the plain text summary. You MUST output the sentiment of the article.
+
+    Given news title: {title}
+
+    Summaries of the parts of the news article: {chunk_summaries}
+
+    Output format:
+
+    <your summary>
+
+    Sentiment: [Positive/Negative/Neutral]
+    """
+
+# structured mode: the answer is a JSON object whose sentiment label is constrained, and the generation stops once it is closed
+STRUCTURED_PROMPT_TEMPLATE = """
+    You will receive a finance news article, its title, and an associated image. Summarize the article and determine its sentiment.
+
+    Given news title: {title}
+
+    News article content: {news_text}
+
+    Answer with a single JSON object of this schema, with a summary of at most three sentences:
+
+    {{"sentiment": "Positive" | "Negative" | "Neutral", "summary": "<your summary>"}}
+    """
+
+STRUCTURED_MAX_NEW_TOKENS = 192
+
+# tiered mode: a small finance sentiment classifier labels every news on CPU, and only the news matching the escalation rules are summarized by the VLM
+FAST_SENTIMENT_MODEL_ID = "ProsusAI/finbert"
+FAST_SENTIMENT_BATCH_SIZE = 32
+
+# the default rules, which the "escalation_rules" of tickers.json can override per ticker, e.g. {"TSLA": {"always": true}}
+ESCALATION_RULES = {
+    # escalate every news of the ticker
+    "always": False,
+    # escalate when the classifier is less confident than this
+    "min_confidence": 0.8,
+    # escalate the news of these sentiments
+    "sentiments": ["Negative"],
+    # escalate the high-impact news, whose title contains one of these words
+    "keywords": [
+        "earnings",
+        "guidance",
+        "merger",
+        "acquisition",
+        "acquire",
+        "lawsuit",
+        "sec",
+        "investigation",
+        "downgrade",
+        "upgrade",
+        "bankruptcy",
+        "recall",
+        "layoffs",
+        "ceo",
+    ],
+}
+
+# the factors of the stocks (alpha, beta, volatility, correlation) are computed against this index, over this many trading days
+BENCHMARK_TICKER = "^GSPC"
+FACTOR_WINDOW = 60
+TRADING_DAYS_PER_YEAR = 252
+
+# time series analysis: the VLM reads a candlestick chart of the last CHART_WINDOW daily bars of each ticker
+CHART_ROLE = "You are a financial analyst with expertise in the technical analysis of stock price charts."
+
+CHART_PROMPT_TEMPLATE = """
+    You will receive a daily candlestick chart of the stock {ticker} over its last {window} trading days, with its moving averages and its volume. Your task is to analyze the chart. The task requires the following actions:
+
+    1. Describe the trend of the price and where it stands relative to its moving averages.
+    2. Point out the notable patterns, supports and resistances, and the volume spikes.
+    3. Determine the outlook of the chart: bullish, bearish, or neutral.
+
+    NOTE: You MUST output only plain text, and end with the outlook.
+
+    Output format:
+
+    <your analysis>
+
+    Outlook: [Bullish/Bearish/Neutral]
+    """
+
+CHART_WINDOW = 120
+CHART_BATCH_SIZE = 8
+
+# everything that changes the look of a chart, part of the key of the cached charts
+CHART_STYLE = {
+    "width": 8.0,  # in inches
+    "height": 5.0,
+    "dpi": 100,
+    "moving_averages": [20, 50],
+    "volume": True,
+    "up_color": "#26a69a",
+    "down_color": "#ef5350",
+}
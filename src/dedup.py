@@ -0,0 +1,175 @@
+import hashlib
+import re
+from urllib.parse import urlparse, urlunparse
+
+import numpy as np
+import pandas as pd
+
+# Mersenne prime used by the universal hashing of MinHash
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize the url so that the same article linked with different tracking parameters, letter cases or trailing slashes is considered the same.
+    """
+    if not url:
+        return ""
+
+    parsed = urlparse(url.strip())
+    return urlunparse(
+        (
+            parsed.scheme.lower(),
+            parsed.netloc.lower().removeprefix("www."),
+            parsed.path.rstrip("/"),
+            "",
+            "",
+            "",
+        )
+    )
+
+
+class MinHasher:
+    """
+    MinHash signatures of word shingles, used to estimate the Jaccard similarity between the texts of two news.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> set[str]:
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        if len(words) < self.shingle_size:
+            return {" ".join(words)} if words else set()
+
+        return {
+            " ".join(words[i : i + self.shingle_size])
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = self.shingles(text)
+        if not shingles:
+            return np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.uint64)
+
+        # 32 bits hashes keep a * hash below 2^63, so the products never overflow
+        hashes = np.array(
+            [
+                int.from_bytes(
+                    hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(),
+                    "little",
+                )
+                for shingle in shingles
+            ],
+            dtype=np.uint64,
+        )
+
+        return ((np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME).min(axis=0)
+
+    @staticmethod
+    def similarity(signature_1: np.ndarray, signature_2: np.ndarray) -> float:
+        return float(np.mean(signature_1 == signature_2))
+
+
+def deduplicate_news(
+    tickers_news: dict[str, pd.DataFrame],
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    bands: int = 16,
+) -> tuple[list[dict], dict]:
+    """
+    Fold the news returned for several tickers into unique news. Two news are the same if their canonical urls are identical, or if the MinHash similarity of their title and summary is at least <threshold>. Candidates are found with locality sensitive hashing over <bands> bands of the signatures.
+
+    Return the unique news, each a dictionary with the keys "tickers", "title", "news_url", "image_url", "pub_date" and "duplicate_urls" (the urls of the near-identical news folded into it), and the statistics of the deduplication.
+    """
+    # collect every news, folding the identical canonical urls directly
+    news_list = []
+    url_index = {}
+    total = 0
+
+    for ticker, news_df in tickers_news.items():
+        if news_df.empty:
+            continue
+
+        summaries = (
+            news_df["summary"] if "summary" in news_df else [""] * len(news_df)
+        )
+        pub_dates = news_df["pubDate"] if "pubDate" in news_df else [None] * len(news_df)
+        for title, summary, news_url, image_url, pub_date in zip(
+            news_df["title"], summaries, news_df["news_url"], news_df["image_url"], pub_dates
+        ):
+            total += 1
+            url = canonicalize_url(news_url)
+
+            if url and url in url_index:
+                news = news_list[url_index[url]]
+                if ticker not in news["tickers"]:
+                    news["tickers"].append(ticker)
+                continue
+
+            if url:
+                url_index[url] = len(news_list)
+            news_list.append(
+                {
+                    "tickers": [ticker],
+                    "title": title,
+                    "news_url": news_url,
+                    "image_url": image_url,
+                    "pub_date": int(pub_date) if pub_date is not None else None,
+                    "duplicate_urls": [],
+                    "text": f"{title} {summary or ''}",
+                }
+            )
+
+    # find the near-identical news with MinHash + LSH, and merge them with union-find
+    hasher = MinHasher(num_perm=num_perm)
+    signatures = [hasher.signature(news.pop("text")) for news in news_list]
+    parents = list(range(len(news_list)))
+
+    def find(i: int) -> int:
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    rows = num_perm // bands
+    for band in range(bands):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            bucket = signature[band * rows : (band + 1) * rows].tobytes()
+            buckets.setdefault(bucket, []).append(i)
+
+        for candidates in buckets.values():
+            first = candidates[0]
+            for other in candidates[1:]:
+                root_1, root_2 = find(first), find(other)
+                if root_1 != root_2 and (
+                    MinHasher.similarity(signatures[first], signatures[other])
+                    >= threshold
+                ):
+                    # keep the earliest news as the representative
+                    parents[max(root_1, root_2)] = min(root_1, root_2)
+
+    unique_news = []
+    for i, news in enumerate(news_list):
+        root = find(i)
+        if root == i:
+            unique_news.append(news)
+        else:
+            for ticker in news["tickers"]:
+                if ticker not in news_list[root]["tickers"]:
+                    news_list[root]["tickers"].append(ticker)
+            news_list[root]["duplicate_urls"].append(news["news_url"])
+
+    stats = {
+        "news": total,
+        "unique_news": len(unique_news),
+        "dedup_ratio": 1 - len(unique_news) / total if total > 0 else 0.0,
+    }
+
+    return unique_news, stats
@@ -0,0 +1,149 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from .config import BENCHMARK_TICKER, FACTOR_WINDOW, TRADING_DAYS_PER_YEAR
+from .price_store import PriceStore, update_prices
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Sum of the last <window> rows at every row (of fewer rows for the first ones), for all the columns at once, from cumulative sums. The cumulative sums restart at every block of <window> rows, so their rounding errors do not build up over the history.
+    """
+    sums = np.empty_like(values)
+    previous = None
+    for start in range(0, len(values), window):
+        block = np.cumsum(values[start : start + window], axis=0)
+        sums[start : start + window] = block
+        if previous is not None:
+            # the rows of the previous block still in the window
+            sums[start : start + window] += previous[-1] - previous[: len(block)]
+        previous = block
+
+    return sums
+
+
+def rolling_factors(
+    stock_returns: np.ndarray,
+    benchmark_returns: np.ndarray,
+    window: int = FACTOR_WINDOW,
+    min_periods: int = None,
+) -> dict[str, np.ndarray]:
+    """
+    Rolling alpha, beta, volatility and correlation with the benchmark of every stock over the last <window> days, for the whole universe at once.
+
+    stock_returns is a (days, stocks) matrix of daily returns and benchmark_returns the (days,) returns of the benchmark on the same days, both with NaN for the missing days. Each stock only uses the days where both it and the benchmark have a return, and its factors are NaN while it has fewer than <min_periods> (default: half the window) such days in the window. alpha and volatility are annualized. Return (days, stocks) matrices.
+    """
+    if min_periods is None:
+        min_periods = max(window // 2, 2)
+
+    valid = ~np.isnan(stock_returns) & ~np.isnan(benchmark_returns)[:, None]
+    y = np.where(valid, stock_returns, 0.0)
+    x = np.where(valid, benchmark_returns[:, None], 0.0)
+
+    n = _rolling_sum(valid.astype(np.float64), window)
+    sum_x = _rolling_sum(x, window)
+    sum_y = _rolling_sum(y, window)
+    sum_xy = _rolling_sum(x * y, window)
+    sum_xx = _rolling_sum(x * x, window)
+    sum_yy = _rolling_sum(y * y, window)
+    del x, y, valid
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x = sum_x / n
+        mean_y = sum_y / n
+        # sample (co)variances, clipped at 0 against the rounding errors of the sums
+        cov_xy = (sum_xy - sum_x * mean_y) / (n - 1)
+        var_x = np.maximum((sum_xx - sum_x * mean_x) / (n - 1), 0.0)
+        var_y = np.maximum((sum_yy - sum_y * mean_y) / (n - 1), 0.0)
+
+        beta = cov_xy / var_x
+        alpha = (mean_y - beta * mean_x) * TRADING_DAYS_PER_YEAR
+        volatility = np.sqrt(var_y * TRADING_DAYS_PER_YEAR)
+        correlation = cov_xy / np.sqrt(var_x * var_y)
+
+    factors = {
+        "alpha": alpha,
+        "beta": beta,
+        "volatility": volatility,
+        "correlation": np.clip(correlation, -1.0, 1.0),
+    }
+    too_few = n < min_periods
+    for values in factors.values():
+        values[too_few | ~np.isfinite(values)] = np.nan
+
+    return factors
+
+
+def correlation_matrix(returns: np.ndarray, min_periods: int = 2) -> np.ndarray:
+    """
+    (stocks, stocks) correlation matrix of the returns of a window, with one matrix product. The missing returns are left out of the means and variances of each stock, and count as no co-movement in the covariances.
+    """
+    valid = ~np.isnan(returns)
+    n = valid.sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        demeaned = np.where(valid, returns - np.nansum(returns, axis=0) / n, 0.0)
+        norms = np.sqrt((demeaned * demeaned).sum(axis=0))
+        correlation = (demeaned.T @ demeaned) / np.outer(norms, norms)
+
+    too_few = n < min_periods
+    correlation[too_few, :] = np.nan
+    correlation[:, too_few] = np.nan
+
+    return np.clip(correlation, -1.0, 1.0)
+
+
+def latest_factors(
+    store: PriceStore,
+    tickers: list[str],
+    benchmark: str = BENCHMARK_TICKER,
+    window: int = FACTOR_WINDOW,
+) -> pd.DataFrame:
+    """
+    The factors of the tickers on the last stored day, from the returns in the store.
+    """
+    dates, returns = store.matrix([benchmark, *tickers])
+    factors = rolling_factors(returns[:, 1:], returns[:, 0], window)
+
+    return pd.DataFrame(
+        {
+            "date": pd.Timestamp(dates[-1]).date() if len(dates) else None,
+            **{name: values[-1] for name, values in factors.items()},
+        },
+        index=pd.Index(tickers, name="ticker"),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Update the price store and compute the rolling factors of the watchlist."
+    )
+    parser.add_argument("--tickers", default="tickers.json")
+    parser.add_argument("--benchmark", default=BENCHMARK_TICKER)
+    parser.add_argument("--window", type=int, default=FACTOR_WINDOW)
+    parser.add_argument("--store", default="price_store")
+    parser.add_argument(
+        "--no-update", action="store_true", help="only use the bars already stored"
+    )
+    args = parser.parse_args()
+
+    from .http_layer import CachedLimiterSession, HTTPCache
+
+    with open(args.tickers, "r") as f:
+        tickers = json.load(f)["tickers"]
+
+    store = PriceStore(args.store)
+    if not args.no_update:
+        # the yfinance API answers are never cached, so the bars are always fresh
+        update_prices(store, [args.benchmark, *tickers], CachedLimiterSession(HTTPCache()))
+
+    start = time.perf_counter()
+    factors = latest_factors(store, tickers, args.benchmark, args.window)
+    elapsed = time.perf_counter() - start
+
+    print(factors.to_string(float_format="{:.3f}".format))
+    print(f"{len(tickers)} tickers in {elapsed:.2f}s")
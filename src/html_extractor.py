@@ -0,0 +1,142 @@
+import importlib.util
+from typing import Optional
+
+# the CSS classes of the article body and of its main image on the yahoo pages
+BODY_CLASS = "caas-body"
+IMAGE_CLASS = "caas-img has-preview"
+
+# the yahoo widgets inside the article body
+WORDS_TO_REMOVE = ["Story continues", "View comments"]
+
+
+def _clean_text(text: str) -> str:
+    for word in WORDS_TO_REMOVE:
+        text = text.replace(word, "")
+
+    return text
+
+
+class BeautifulSoupExtractor:
+    """
+    Pure Python extraction with BeautifulSoup's html.parser, always available but slow on the large yahoo pages.
+    """
+
+    name = "bs4"
+
+    def extract(self, html: bytes) -> tuple[str, Optional[str]]:
+        """
+        Get the text of the article body and the url of its image (or None) from the page.
+        """
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+
+        text = ""
+        if text_element := soup.find("div", class_=BODY_CLASS):
+            text = _clean_text(text_element.text)
+
+        image_src = None
+        if image_element := soup.find("img", class_=IMAGE_CLASS):
+            image_src = image_element.get("src")
+
+        return text, image_src
+
+
+class LxmlExtractor:
+    """
+    Extraction with the libxml2 parser of lxml, about an order of magnitude faster than html.parser.
+    """
+
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import html
+
+        self._html = html
+        self._body_xpath = f'//div[contains(concat(" ", normalize-space(@class), " "), " {BODY_CLASS} ")]'
+        self._image_xpath = f'//img[@class="{IMAGE_CLASS}"]/@src'
+
+    def extract(self, html: bytes) -> tuple[str, Optional[str]]:
+        if not html.strip():
+            return "", None
+
+        tree = self._html.fromstring(html)
+
+        text = ""
+        if text_elements := tree.xpath(self._body_xpath):
+            text = _clean_text(text_elements[0].text_content())
+
+        image_srcs = tree.xpath(self._image_xpath)
+
+        return text, str(image_srcs[0]) if image_srcs else None
+
+
+class SelectolaxExtractor:
+    """
+    Extraction with the lexbor parser of selectolax, the fastest backend when it is installed.
+    """
+
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+
+        self._parser = LexborHTMLParser
+        self._image_selector = "img." + ".".join(IMAGE_CLASS.split())
+
+    def extract(self, html: bytes) -> tuple[str, Optional[str]]:
+        tree = self._parser(html)
+
+        text = ""
+        if text_element := tree.css_first(f"div.{BODY_CLASS}"):
+            text = _clean_text(text_element.text())
+
+        image_src = None
+        for image_element in tree.css(self._image_selector):
+            # html.parser matches the exact class attribute, so do the same
+            if image_element.attributes.get("class") == IMAGE_CLASS:
+                image_src = image_element.attributes.get("src")
+                break
+
+        return text, image_src
+
+
+# name -> (module required by the backend, extractor class), from the fastest to the fallback
+EXTRACTORS = {
+    "selectolax": ("selectolax", SelectolaxExtractor),
+    "lxml": ("lxml", LxmlExtractor),
+    "bs4": ("bs4", BeautifulSoupExtractor),
+}
+
+
+def get_extractor(name: str = "auto"):
+    """
+    Get the extractor of the given backend, or the fastest installed one for "auto".
+    """
+    if name == "auto":
+        name = next(
+            name
+            for name, (module, _) in EXTRACTORS.items()
+            if importlib.util.find_spec(module) is not None
+        )
+
+    if name not in EXTRACTORS:
+        raise ValueError(
+            f"Unknown HTML extractor {name}, please choose from {['auto', *EXTRACTORS]}."
+        )
+
+    return EXTRACTORS[name][1]()
+
+
+# extractors of the parsing processes, created once per process
+_process_extractors = {}
+
+
+def extract_in_process(name: str, html: bytes) -> tuple[str, Optional[str]]:
+    """
+    Entry point of the parsing process pool of the scrapper.
+    """
+    if name not in _process_extractors:
+        _process_extractors[name] = get_extractor(name)
+
+    return _process_extractors[name].extract(html)
@@ -0,0 +1,333 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+from requests import ConnectionError, Response, Session, Timeout
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.exceptions import MaxRetryError
+from urllib3.util import Retry
+
+# requests per second allowed to the article pages and news lists of Yahoo Finance, whose concurrency is also capped by FinanceNewsScrapper.max_requests_per_host
+ARTICLE_RATE_LIMIT = 20.0
+
+# requests per second allowed to each host, the hosts not listed are not rate limited. The yfinance API hosts throttle early
+HOST_RATE_LIMITS = {
+    "finance.yahoo.com": ARTICLE_RATE_LIMIT,
+    "query1.finance.yahoo.com": 2.0,
+    "query2.finance.yahoo.com": 2.0,
+}
+
+# the hosts of the yfinance API, cookie and crumb requests, whose answers are never cached so a re-run gets fresh news lists and crumbs
+UNCACHED_HOSTS = (
+    "query1.finance.yahoo.com",
+    "query2.finance.yahoo.com",
+    "fc.yahoo.com",
+    "guce.yahoo.com",
+    "consent.yahoo.com",
+)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class HostRateLimiter:
+    """
+    Token bucket per host, shared by all the threads of the session. A request waits for a token of its host, so the bursts of concurrent requests are spread over time.
+    """
+
+    def __init__(self, rates: dict[str, float], burst: int = 2):
+        self.rates = rates
+        self.burst = burst
+        self.wait_time = 0.0
+
+        self._buckets = {}  # host -> [tokens, last refill time]
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str) -> None:
+        rate = self.rates.get(host)
+        if rate is None:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                delay = (1 - tokens) / rate
+                self.wait_time += delay
+
+            time.sleep(delay)
+
+
+class HTTPCache:
+    """
+    On-disk cache of HTTP responses stored in SQLite. The GET responses with an ETag or a Last-Modified header are kept with their validators, so that they can be revalidated with a conditional request, and an unchanged page costs a 304 without body.
+    """
+
+    def __init__(self, path: str = "http.cache", max_entries: int = 50000):
+        self.path = path
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        # the session is used from the fetching threads
+        self._lock = threading.Lock()
+        # the cache is shared by the shard workers of the host, so wait for their locks, and let them read while one writes
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                stored_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(method: str, url: str, body: Optional[bytes]) -> str:
+        hasher = hashlib.sha256(f"{method} {url}".encode("utf-8"))
+        if body:
+            hasher.update(body if isinstance(body, bytes) else body.encode("utf-8"))
+
+        return hasher.hexdigest()
+
+    def get(self, key: str) -> Optional[tuple[int, dict, bytes, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, headers, body, stored_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        status, headers, body, stored_at = row
+        return status, json.loads(headers), body, stored_at
+
+    def put(self, key: str, url: str, status: int, headers: dict, body: bytes) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(dict(headers)), body, time.time()),
+            )
+            # keep the most recently stored responses
+            self._conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def touch(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+
+    def count(self, outcome: str) -> None:
+        """
+        Count a request answered from the cache ("hits"), revalidated ("revalidated") or sent in full ("misses"), from any fetching thread.
+        """
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "entries": entries,
+            }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter adding the per-host rate limits, the retries and the HTTP cache of the article pages under a plain requests Session.
+
+    The retries are run by the adapter rather than by urllib3, so each attempt waits for a token of its host like the first one.
+
+    Only the GET requests outside UNCACHED_HOSTS are cached, i.e. the article pages, never the yfinance API, cookie and crumb requests nor the POST news lists. A page still fresh by its Cache-Control max-age is served from the cache, otherwise it is revalidated with If-None-Match / If-Modified-Since, and a 304 is answered with the cached page.
+    """
+
+    def __init__(
+        self,
+        cache: HTTPCache,
+        rate_limiter: HostRateLimiter,
+        retry: Retry = None,
+        uncached_hosts: tuple[str, ...] = UNCACHED_HOSTS,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.retry = retry if retry is not None else Retry(0, read=False)
+        self.uncached_hosts = uncached_hosts
+
+    def send(self, request, **kwargs) -> Response:
+        url = urlparse(request.url)
+        host = url.netloc
+
+        if (
+            request.method != "GET"
+            or self.cache is None
+            or url.hostname in self.uncached_hosts
+        ):
+            return self._send(request, host, **kwargs)
+
+        key = HTTPCache.make_key(request.method, request.url, request.body)
+        cached = self.cache.get(key)
+
+        if cached is not None and self._is_fresh(cached):
+            self.cache.count("hits")
+            return self._cached_response(request, cached)
+
+        if cached is not None:
+            _, headers, _, _ = cached
+            headers = CaseInsensitiveDict(headers)
+            if "ETag" in headers:
+                request.headers["If-None-Match"] = headers["ETag"]
+            if "Last-Modified" in headers:
+                request.headers["If-Modified-Since"] = headers["Last-Modified"]
+
+        response = self._send(request, host, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            self.cache.count("revalidated")
+            self.cache.touch(key)
+            return self._cached_response(request, cached)
+
+        self.cache.count("misses")
+        if self._is_cacheable(response):
+            # reading the content consumes a streamed response, so it is kept on the response
+            self.cache.put(
+                key, request.url, response.status_code, response.headers, response.content
+            )
+
+        return response
+
+    def _send(self, request, host: str, **kwargs) -> Response:
+        """
+        Send the request, retried on connection errors and on the statuses of the retry policy. The last response is returned once the retries are exhausted.
+        """
+        retry = self.retry
+        while True:
+            self.rate_limiter.acquire(host)
+            try:
+                response = super().send(request, **kwargs)
+            except (ConnectionError, Timeout) as e:
+                try:
+                    retry = retry.increment(request.method, request.url, error=e)
+                except MaxRetryError:
+                    raise e
+                retry.sleep()
+                continue
+
+            has_retry_after = "Retry-After" in response.headers
+            if not retry.is_retry(request.method, response.status_code, has_retry_after):
+                return response
+
+            try:
+                retry = retry.increment(request.method, request.url, response=response.raw)
+            except MaxRetryError:
+                return response
+
+            # the Retry-After of the response, or the backoff
+            retry.sleep(response.raw)
+            response.close()
+
+    @staticmethod
+    def _is_fresh(cached: tuple) -> bool:
+        _, headers, _, stored_at = cached
+        age = time.time() - stored_at
+
+        match = _MAX_AGE_RE.search(CaseInsensitiveDict(headers).get("Cache-Control", ""))
+        return match is not None and age < int(match.group(1))
+
+    @staticmethod
+    def _is_cacheable(response: Response) -> bool:
+        if response.status_code != 200:
+            return False
+
+        if "no-store" in response.headers.get("Cache-Control", ""):
+            return False
+
+        return "ETag" in response.headers or "Last-Modified" in response.headers
+
+    @staticmethod
+    def _cached_response(request, cached: tuple) -> Response:
+        status, headers, body, _ = cached
+
+        response = Response()
+        response.status_code = status
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(headers)
+        # the body is stored decoded
+        response.headers.pop("Content-Encoding", None)
+        response.headers.pop("Content-Length", None)
+        response._content = body
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.from_cache = True
+
+        return response
+
+
+class CachedLimiterSession(Session):
+    """
+    The one pooled session of the yfinance requests and of the article fetches, with retries, per-host rate limits (HOST_RATE_LIMITS unless given) and the HTTP cache of the article pages (if given). It replaces the requests_cache / requests_ratelimiter session of the same name, whose cache also replayed the yfinance answers.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[HTTPCache] = None,
+        rate_limits: dict[str, float] = None,
+        pool_size: int = 8,
+    ):
+        super().__init__()
+
+        retry = Retry(
+            total=5,
+            backoff_factor=2,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=None,  # the news lists are POST requests
+            raise_on_status=False,
+        )
+        adapter = CachingAdapter(
+            cache,
+            HostRateLimiter(rate_limits if rate_limits is not None else HOST_RATE_LIMITS),
+            retry=retry,
+            pool_connections=max(pool_size, 1),
+            pool_maxsize=max(pool_size, 1),
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
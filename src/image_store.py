@@ -0,0 +1,114 @@
+import hashlib
+import mmap
+import os
+import tempfile
+from typing import TYPE_CHECKING
+
+# PIL is only imported when an image is decoded, the scrapper only stores the bytes
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+class StoredImage:
+    """
+    Reference to an image of the ImageStore. It is what the scrapper keeps instead of the decoded image, so the memory does not grow with the number of news.
+    """
+
+    def __init__(self, store: "ImageStore", key: str):
+        self.store = store
+        self.key = key
+
+    def load(self) -> "Image.Image":
+        return self.store.open(self.key)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, StoredImage) and other.key == self.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __repr__(self) -> str:
+        return f"StoredImage({self.key[:12]})"
+
+
+class ImageStore:
+    """
+    Content-addressed on-disk store of the news images. An image is saved once under the SHA-256 of its bytes, so the stock photos reused by many news take the space of one. The preprocessed features of the images can be cached next to them.
+    """
+
+    def __init__(self, root: str = "image_store"):
+        self.root = root
+        os.makedirs(os.path.join(root, "images"), exist_ok=True)
+
+    def put(self, data: bytes) -> StoredImage:
+        key = hashlib.sha256(data).hexdigest()
+        path = self._image_path(key)
+
+        if not os.path.exists(path):
+            self._atomic_write(path, lambda f: f.write(data))
+
+        return StoredImage(self, key)
+
+    def open(self, key: str) -> "Image.Image":
+        """
+        Decode the image through a memory map of its file, so its bytes are only read from the disk when needed.
+        """
+        from PIL import Image
+
+        with open(self._image_path(key), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                image = Image.open(mapped)
+                image.load()
+
+        return image
+
+    def load_features(self, key: str, namespace: str):
+        """
+        Get the cached features of the image computed by <namespace> (e.g. a model and its preprocessing settings), or None if they are not cached yet.
+        """
+        import torch
+
+        path = self._features_path(key, namespace)
+        if not os.path.exists(path):
+            return None
+
+        return torch.load(path, mmap=True, weights_only=True)
+
+    def save_features(self, key: str, namespace: str, features: dict) -> None:
+        import torch
+
+        self._atomic_write(
+            self._features_path(key, namespace), lambda f: torch.save(features, f)
+        )
+
+    def _image_path(self, key: str) -> str:
+        return os.path.join(self.root, "images", key[:2], key)
+
+    def _features_path(self, key: str, namespace: str) -> str:
+        namespace_hash = hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.root, "features", namespace_hash, key[:2], f"{key}.pt")
+
+    @staticmethod
+    def _atomic_write(path: str, write) -> None:
+        """
+        Write to a temporary file then rename it, so concurrent writers and readers never see a partial file.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def load_image(image) -> "Image.Image":
+    """
+    Get the PIL image of either a StoredImage or a PIL image.
+    """
+    if isinstance(image, StoredImage):
+        return image.load()
+
+    return image
@@ -1,62 +1,230 @@
 import torch
 from PIL import Image
-from transformers import AutoProcessor, MllamaForConditionalGeneration
-
-from src.utils import get_available_gpu
+from transformers import (
+    AutoProcessor,
+    LogitsProcessorList,
+    MllamaForConditionalGeneration,
+)
+
+from ..config import STRUCTURED_MAX_NEW_TOKENS
+from ..image_store import load_image
+from ..structured import (
+    ANSWER_PREFIX,
+    GeneratedText,
+    SentimentConstraint,
+    SentimentResult,
+    parse_structured_output,
+)
+from ..utils import get_available_gpu
+from .load_config import LoadConfig
+
+
+def _mixes_images(images: list) -> bool:
+    return (
+        images is not None
+        and any(image is None for image in images)
+        and any(image is not None for image in images)
+    )
 
 
 class LlamaVision:
-    def __init__(self):
-        self.device = torch.device(get_available_gpu())
+    model_id = "meta-llama/Llama-3.2-11B-Vision-Instruct"
 
-        self.model_id = "meta-llama/Llama-3.2-11B-Vision-Instruct"
-        self.model = MllamaForConditionalGeneration.from_pretrained(
-            self.model_id, torch_dtype=torch.bfloat16, low_cpu_mem_usage=True
-        ).to(self.device)
+    def __init__(self, device: str = None, load_config: LoadConfig = None):
+        # the device is picked automatically unless given, e.g. by the inference pool
+        self.device = torch.device(device if device is not None else get_available_gpu())
+
+        # the dtype, attention backend, quantization and compilation fit the device unless configured
+        self.load_config = load_config if load_config is not None else LoadConfig()
+        self.model = self.load_config.load(
+            MllamaForConditionalGeneration, self.model_id, self.device
+        )
         self.processor = AutoProcessor.from_pretrained(self.model_id)
 
+        # the prompts are left-padded so that the generation of every row starts at the same position
+        self.processor.tokenizer.padding_side = "left"
+        if self.processor.tokenizer.pad_token_id is None:
+            self.processor.tokenizer.pad_token = self.processor.tokenizer.eos_token
+
+        self.terminator_tokens = [
+            self.processor.tokenizer.eos_token_id,
+            self.processor.tokenizer.convert_tokens_to_ids("``"),
+        ]
+
     def generate(
         self, role: str, prompt: str, image=None, max_new_token=1500, temperature=0.6
     ) -> str:
         """
         Generate text based on the prompt and optional image input.
         """
-        messages = [
-            {"role": "assistant", "content": role},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image"} if image is not None else None,
-                    {"type": "text", "text": prompt},
-                ],
-            },
+        return self.generate_batch(
+            role, [prompt], [image], max_new_token, temperature
+        )[0]
+
+    def generate_batch(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=1500,
+        temperature=0.6,
+        streamer=None,
+    ) -> list[str]:
+        """
+        Generate text for a batch of prompts in a single forward pass. Each prompt can optionally be paired with an image (use None for no image). The prompts are left-padded so that the generated tokens of every item are aligned at the end of the batch. The optional streamer is passed to model.generate and receives the tokens as they are generated.
+        """
+        if _mixes_images(images):
+            return self._generate_by_image(
+                self.generate_batch,
+                role,
+                prompts,
+                images,
+                max_new_token=max_new_token,
+                temperature=temperature,
+                streamer=streamer,
+            )
+
+        output_ids = self._generate(
+            role,
+            prompts,
+            images,
+            do_sample=True,
+            max_new_tokens=max_new_token,
+            temperature=temperature,
+            top_p=0.9,
+            streamer=streamer,
+        )
+
+        output_texts = self.processor.batch_decode(output_ids, skip_special_tokens=True)
+
+        return [
+            GeneratedText(text, tokens)
+            for text, tokens in zip(output_texts, self._generated_tokens(output_ids))
         ]
 
-        prompt_template = self.processor.apply_chat_template(
-            messages, add_generation_prompt=True
+    def generate_structured(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=STRUCTURED_MAX_NEW_TOKENS,
+        temperature=None,
+        streamer=None,
+    ) -> list[SentimentResult]:
+        """
+        Generate a SentimentResult for each prompt (e.g. STRUCTURED_PROMPT_TEMPLATE). The answer is a JSON object whose sentiment label is constrained to SENTIMENTS, and the generation of each item ends as soon as the object is closed. The decoding is greedy unless a temperature is given.
+        """
+        if _mixes_images(images):
+            return self._generate_by_image(
+                self.generate_structured,
+                role,
+                prompts,
+                images,
+                max_new_token=max_new_token,
+                temperature=temperature,
+                streamer=streamer,
+            )
+
+        constraint = SentimentConstraint(self.processor.tokenizer, self.terminator_tokens[0])
+        sampling = (
+            dict(do_sample=False)
+            if temperature is None
+            else dict(do_sample=True, temperature=temperature, top_p=0.9)
         )
 
-        inputs = self.processor(image, prompt_template, return_tensors="pt").to(
-            self.device
+        output_ids = self._generate(
+            role,
+            prompts,
+            images,
+            answer_prefix=ANSWER_PREFIX,
+            max_new_tokens=max_new_token,
+            logits_processor=LogitsProcessorList([constraint]),
+            streamer=streamer,
+            **sampling,
         )
-        terminators = [
-            self.processor.tokenizer.eos_token_id,
-            self.processor.tokenizer.convert_tokens_to_ids("``"),
+        output_texts = self.processor.batch_decode(output_ids, skip_special_tokens=True)
+
+        return [
+            parse_structured_output(text, constraint.confidence(row, ids), tokens)
+            for row, (text, ids, tokens) in enumerate(
+                zip(output_texts, output_ids.tolist(), self._generated_tokens(output_ids))
+            )
         ]
 
+    def _generate_by_image(self, generate, role: str, prompts: list[str], images: list, **kwargs) -> list:
+        """
+        Mllama takes either an image for every prompt of a batch or none, so a batch mixing both is generated as two batches, the prompts with an image then the others.
+        """
+        results = [None] * len(prompts)
+        for with_image in (True, False):
+            rows = [i for i, image in enumerate(images) if (image is not None) == with_image]
+            outputs = generate(
+                role, [prompts[i] for i in rows], [images[i] for i in rows], **kwargs
+            )
+            for i, output in zip(rows, outputs):
+                results[i] = output
+
+        return results
+
+    def _generate(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        answer_prefix: str = "",
+        **generate_kwargs,
+    ) -> torch.Tensor:
+        """
+        Run model.generate on the batch, with the answer of each item starting with <answer_prefix>, and return the generated token ids.
+        """
+        if images is None:
+            images = [None] * len(prompts)
+
+        if len(images) != len(prompts):
+            raise ValueError("The number of images must match the number of prompts.")
+
+        prompt_templates = [
+            self.processor.apply_chat_template(
+                self._build_messages(role, prompt, image), add_generation_prompt=True
+            )
+            + answer_prefix
+            for prompt, image in zip(prompts, images)
+        ]
+
+        # Mllama expects a list of images per item
+        batch_images = None
+        if any(image is not None for image in images):
+            batch_images = [[load_image(image)] for image in images]
+
+        inputs = self.processor(
+            batch_images, prompt_templates, padding=True, return_tensors="pt"
+        ).to(self.device)
+
         output = self.model.generate(
             **inputs,
-            do_sample=True,
-            max_new_tokens=max_new_token,
-            eos_token_id=terminators,
-            temperature=temperature,
-            top_p=0.9,
-            pad_token_id=self.processor.tokenizer.eos_token_id,
+            eos_token_id=self.terminator_tokens,
+            pad_token_id=self.processor.tokenizer.pad_token_id,
+            **generate_kwargs,
         )
 
-        result = self.processor.decode(output[0, len(inputs["input_ids"][0]) : -1])
+        # with left padding all the prompts end at the same position
+        return output[:, inputs["input_ids"].shape[1] :]
 
-        return result
+    def _generated_tokens(self, output_ids: torch.Tensor) -> list[int]:
+        """
+        The number of tokens generated for each item, i.e. its output ids without the padding added once it ended before the others.
+        """
+        return (output_ids != self.processor.tokenizer.pad_token_id).sum(dim=1).tolist()
+
+    def _build_messages(self, role: str, prompt: str, image=None) -> list[dict]:
+        content = [{"type": "text", "text": prompt}]
+        if image is not None:
+            content.insert(0, {"type": "image"})
+
+        return [
+            {"role": "assistant", "content": role},
+            {"role": "user", "content": content},
+        ]
 
     def __call__(
         self, role: str, prompt: str, image=None, max_new_token=1500, temperature=0.8
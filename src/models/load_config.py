@@ -0,0 +1,170 @@
+import importlib.util
+import warnings
+
+ATTENTION_BACKENDS = ("auto", "flash_attention_2", "sdpa", "eager")
+QUANTIZATIONS = (None, "int8", "int4", "dynamic")
+
+
+def flash_attention_available(device, dtype) -> bool:
+    import torch
+
+    return (
+        device.type == "cuda"
+        and dtype in (torch.float16, torch.bfloat16)
+        and importlib.util.find_spec("flash_attn") is not None
+    )
+
+
+class LoadConfig:
+    """
+    How a model is loaded: the dtype, the attention backend, the weight quantization and the compilation of the forward pass. The defaults pick what works on the device, so the same config loads on GPU and on CPU-only hosts.
+
+    - dtype: "auto" (bfloat16 or float16 on GPU, float32 on CPU) or a torch dtype name
+    - attention: "auto" picks flash_attention_2 when flash-attn is installed and the device is a GPU, then sdpa, then eager
+    - quantization: "int8" / "int4" weights with bitsandbytes (GPU only), or "dynamic" int8 quantization of the linear layers (CPU only)
+    - compile: torch.compile the forward pass with a static KV cache, so the decode steps run as compiled graphs
+
+    torch is only imported when the model is loaded, so the command line tools can build a config cheaply.
+    """
+
+    def __init__(
+        self,
+        dtype: str = "auto",
+        attention: str = "auto",
+        quantization: str = None,
+        compile: bool = False,
+    ):
+        if attention not in ATTENTION_BACKENDS:
+            raise ValueError(
+                f"Unknown attention backend {attention}, please choose from {ATTENTION_BACKENDS}."
+            )
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown quantization {quantization}, please choose from {QUANTIZATIONS}."
+            )
+
+        self.dtype = dtype
+        self.attention = attention
+        self.quantization = quantization
+        self.compile = compile
+
+    def torch_dtype(self, device):
+        import torch
+
+        if self.dtype != "auto":
+            return getattr(torch, self.dtype)
+
+        # the dynamic quantization and most CPU kernels are float32
+        if device.type != "cuda":
+            return torch.float32
+
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+    def attn_implementation(self, device) -> str:
+        import torch
+
+        dtype = self.torch_dtype(device)
+        if self.attention == "flash_attention_2" and not flash_attention_available(
+            device, dtype
+        ):
+            warnings.warn(
+                f"flash_attention_2 is not available on {device} with {dtype}, using sdpa"
+            )
+            return "sdpa"
+
+        if self.attention != "auto":
+            return self.attention
+
+        if flash_attention_available(device, dtype):
+            return "flash_attention_2"
+
+        if hasattr(torch.nn.functional, "scaled_dot_product_attention"):
+            return "sdpa"
+
+        return "eager"
+
+    def load(self, model_class, model_id: str, device, **kwargs):
+        """
+        Load the model of <model_id> with model_class.from_pretrained on the device, according to the config.
+        """
+        import torch
+
+        device = torch.device(device)
+        dtype = self.torch_dtype(device)
+
+        if self.quantization in ("int8", "int4"):
+            if device.type != "cuda":
+                raise ValueError(
+                    f"{self.quantization} quantization requires a GPU, use dynamic quantization on CPU."
+                )
+            from transformers import BitsAndBytesConfig
+
+            kwargs["quantization_config"] = (
+                BitsAndBytesConfig(load_in_8bit=True)
+                if self.quantization == "int8"
+                else BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_quant_type="nf4",
+                    bnb_4bit_compute_dtype=dtype,
+                )
+            )
+        elif self.quantization == "dynamic" and device.type != "cpu":
+            raise ValueError("dynamic quantization only runs on CPU.")
+
+        model = model_class.from_pretrained(
+            model_id,
+            torch_dtype=dtype,
+            device_map=device,
+            attn_implementation=self.attn_implementation(device),
+            low_cpu_mem_usage=True,
+            **kwargs,
+        )
+        model.eval()
+
+        if self.quantization == "dynamic":
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+        if self.compile:
+            # the shapes of a static cache do not change from one decode step to the next
+            model.generation_config.cache_implementation = "static"
+            model.forward = torch.compile(model.forward, mode="reduce-overhead")
+
+        return model
+
+    @classmethod
+    def from_args(cls, args) -> "LoadConfig":
+        return cls(args.dtype, args.attention, args.quantization, args.compile)
+
+    def key(self) -> tuple:
+        return (self.dtype, self.attention, self.quantization, self.compile)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, LoadConfig) and other.key() == self.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+    def __repr__(self) -> str:
+        return (
+            f"LoadConfig(dtype={self.dtype}, attention={self.attention}, "
+            f"quantization={self.quantization}, compile={self.compile})"
+        )
+
+
+def add_load_config_arguments(parser) -> None:
+    """
+    Add the options of LoadConfig to an argparse parser, read back with LoadConfig.from_args.
+    """
+    parser.add_argument("--dtype", default="auto", help="e.g. bfloat16, float16 or float32")
+    parser.add_argument("--attention", default="auto", choices=ATTENTION_BACKENDS)
+    parser.add_argument(
+        "--quantization",
+        default=None,
+        choices=[quantization for quantization in QUANTIZATIONS if quantization is not None],
+        help="int8 / int4 weights on GPU, or dynamic int8 quantization on CPU",
+    )
+    parser.add_argument(
+        "--compile", action="store_true", help="torch.compile the forward pass of the model"
+    )
@@ -0,0 +1,228 @@
+import multiprocessing as mp
+import queue
+
+from ..config import STRUCTURED_MAX_NEW_TOKENS, VLM_BATCH_SIZE
+from .load_config import LoadConfig
+from .registry import GENERATE_METHODS, MODEL_IDS, MODELS, load_model
+
+# rough number of tokens of a news image, 1280 * 28 * 28 max pixels / (28 * 28) pixels per token
+IMAGE_TOKENS = 1280
+
+
+def _worker_main(name: str, model: tuple, device: str, load_config, task_queue, result_queue):
+    """
+    Load the model on the device, then generate the tasks of the queue until None is received.
+    """
+    # a spawned process imports a fresh registry, without the models added to MODELS at runtime
+    MODELS.setdefault(name, model)
+    model = load_model(name, device, load_config)
+
+    while (task := task_queue.get()) is not None:
+        task_id, method, role, prompts, images, max_new_token, temperature = task
+        try:
+            outputs = getattr(model, method)(
+                role, prompts, images, max_new_token, temperature
+            )
+            result_queue.put((task_id, outputs, None))
+        except Exception as e:
+            result_queue.put((task_id, None, repr(e)))
+
+
+class _Worker:
+    def __init__(self, context, name: str, device: str, load_config, result_queue):
+        self.device = device
+        self.task_queue = context.Queue()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(name, MODELS[name], device, load_config, self.task_queue, result_queue),
+            daemon=True,
+        )
+        self.process.start()
+
+        # task_id -> (task, estimated tokens) sent to this worker and not answered yet
+        self.outstanding = {}
+
+    @property
+    def load(self) -> int:
+        return sum(tokens for _, tokens in self.outstanding.values())
+
+
+class InferencePool:
+    """
+    One model process per available GPU (or CPU worker processes if there is none) with the same generate_batch interface as the models. A batch is split into micro-batches of news of similar lengths, each sent to the worker with the fewest outstanding tokens, and the outputs are returned in order. Crashed workers are restarted and their tasks sent again.
+    """
+
+    def __init__(
+        self,
+        name: str = "qwen",
+        devices: list[str] = None,
+        num_cpu_workers: int = 2,
+        micro_batch_size: int = VLM_BATCH_SIZE,
+        max_task_retries: int = 2,
+        load_config: LoadConfig = None,
+    ):
+        if name not in MODELS:
+            raise ValueError(f"Unknown model {name}, please choose from {list(MODELS)}.")
+
+        if devices is None:
+            from ..utils import get_available_gpus
+
+            devices = get_available_gpus() or ["cpu"] * num_cpu_workers
+
+        self.name = name
+        self.model_id = MODEL_IDS[name]
+        self.micro_batch_size = micro_batch_size
+        self.max_task_retries = max_task_retries
+        self.load_config = load_config
+        self.restart_count = 0
+
+        # CUDA cannot be used in forked processes
+        self._context = mp.get_context("spawn")
+        self._result_queue = self._context.Queue()
+        self._workers = [
+            _Worker(self._context, name, device, load_config, self._result_queue)
+            for device in devices
+        ]
+        self._next_task_id = 0
+        self._task_retries = {}
+
+    @staticmethod
+    def estimate_tokens(prompt: str, image=None) -> int:
+        # about 4 characters per token for English text
+        return len(prompt) // 4 + (IMAGE_TOKENS if image is not None else 0)
+
+    def generate_batch(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=1500,
+        temperature=0.6,
+    ) -> list[str]:
+        return self._generate(
+            "generate_batch", role, prompts, images, max_new_token, temperature
+        )
+
+    def generate_structured(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=STRUCTURED_MAX_NEW_TOKENS,
+        temperature=None,
+    ) -> list:
+        return self._generate(
+            "generate_structured", role, prompts, images, max_new_token, temperature
+        )
+
+    def _generate(
+        self,
+        method: str,
+        role: str,
+        prompts: list[str],
+        images: list,
+        max_new_token: int,
+        temperature,
+    ) -> list:
+        if method not in GENERATE_METHODS:
+            raise ValueError(f"Unknown generation method {method}.")
+
+        if images is None:
+            images = [None] * len(prompts)
+
+        estimated_tokens = [
+            self.estimate_tokens(prompt, image) for prompt, image in zip(prompts, images)
+        ]
+
+        # news of similar lengths share a micro-batch, so little compute is wasted on padding
+        order = sorted(range(len(prompts)), key=lambda i: estimated_tokens[i], reverse=True)
+
+        pending = {}  # task_id -> indices of the news in the batch
+        for start in range(0, len(order), self.micro_batch_size):
+            indices = order[start : start + self.micro_batch_size]
+            task_id = self._next_task_id
+            self._next_task_id += 1
+
+            task = (
+                task_id,
+                method,
+                role,
+                [prompts[i] for i in indices],
+                [images[i] for i in indices],
+                max_new_token,
+                temperature,
+            )
+            pending[task_id] = indices
+            self._submit(task, sum(estimated_tokens[i] for i in indices))
+
+        results = [None] * len(prompts)
+        while pending:
+            try:
+                task_id, outputs, error = self._result_queue.get(timeout=1.0)
+            except queue.Empty:
+                self._restart_dead_workers()
+                continue
+
+            for worker in self._workers:
+                worker.outstanding.pop(task_id, None)
+
+            # a task sent again after a crash may be answered twice
+            if task_id not in pending:
+                continue
+
+            if error is not None:
+                raise RuntimeError(f"The inference worker failed: {error}")
+
+            for i, output in zip(pending.pop(task_id), outputs):
+                results[i] = output
+
+        return results
+
+    def _submit(self, task: tuple, tokens: int) -> None:
+        worker = min(self._workers, key=lambda worker: worker.load)
+        worker.outstanding[task[0]] = (task, tokens)
+        worker.task_queue.put(task)
+
+    def _restart_dead_workers(self) -> None:
+        for i, worker in enumerate(self._workers):
+            if worker.process.is_alive():
+                continue
+
+            print(
+                f"Inference worker on {worker.device} died with exit code {worker.process.exitcode}, restarting it"
+            )
+            self._workers[i] = _Worker(
+                self._context, self.name, worker.device, self.load_config, self._result_queue
+            )
+            self.restart_count += 1
+
+            for task_id, (task, tokens) in worker.outstanding.items():
+                retries = self._task_retries.get(task_id, 0)
+                if retries >= self.max_task_retries:
+                    raise RuntimeError(
+                        f"The inference task {task_id} crashed the workers {retries + 1} times."
+                    )
+
+                self._task_retries[task_id] = retries + 1
+                self._submit(task, tokens)
+
+    def stats(self) -> dict:
+        return {
+            "model_id": self.model_id,
+            "devices": [worker.device for worker in self._workers],
+            "restarts": self.restart_count,
+        }
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.task_queue.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,87 @@
+import torch
+from transformers import DynamicCache
+
+
+def common_prefix_length(a: torch.Tensor, b: torch.Tensor) -> int:
+    length = min(len(a), len(b))
+    mismatches = (a[:length] != b[:length]).nonzero()
+
+    return int(mismatches[0]) if len(mismatches) > 0 else length
+
+
+class PrefixCache:
+    """
+    KV cache of a prompt prefix shared by many generations (the role and the instructions of the prompt template), computed once and copied into every generation starting with it, so the prefill only runs on the rest of the prompt.
+
+    The prompts of a batch are left padded, so the prefix of each prompt starts after its padding. The cache of the batch covers the same number of positions in every row: the padding of the row, then as much of the prefix as fits. The cached keys and values of the padding are zeros, masked by the attention mask like the padding of an uncached generation, and the positions of the tokens are counted from the first unpadded one, so the rows get the keys and values they would have without the cache.
+    """
+
+    def __init__(self, model, prefix_ids: torch.Tensor):
+        self.model = model
+        # compared with the prompts, which are on the device of the model
+        self.prefix_ids = prefix_ids.to(model.device)
+        self.hits = 0
+        self.misses = 0
+
+        self._cache = None
+
+    def generate(
+        self, input_ids: torch.Tensor, attention_mask: torch.Tensor = None, **kwargs
+    ) -> torch.Tensor:
+        if attention_mask is None:
+            padding = [0] * input_ids.shape[0]
+        else:
+            padding = (attention_mask.cumsum(-1) == 0).sum(-1).tolist()
+
+        # the last prompt token is never cached, since generate needs at least one token to compute the logits
+        length = min(
+            [
+                pad + common_prefix_length(ids[pad:], self.prefix_ids)
+                for ids, pad in zip(input_ids, padding)
+            ]
+            + [input_ids.shape[1] - 1]
+        )
+
+        if length <= min(padding):
+            self.misses += 1
+            return self.model.generate(
+                input_ids=input_ids, attention_mask=attention_mask, **kwargs
+            )
+
+        cache = self._batch_cache(length, padding)
+
+        self.hits += 1
+        return self.model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=cache,
+            **kwargs,
+        )
+
+    def _batch_cache(self, length: int, padding: list[int]) -> DynamicCache:
+        """
+        The cache of the first <length> positions of the batch, with the prefix of each row shifted right by its padding.
+        """
+        cache = DynamicCache()
+        for layer_idx, layer in enumerate(self._prefix_cache().layers):
+            shape = (len(padding), layer.keys.shape[1], length, layer.keys.shape[3])
+            keys = layer.keys.new_zeros(shape)
+            values = layer.values.new_zeros(shape)
+            for row, pad in enumerate(padding):
+                if pad < length:
+                    keys[row, :, pad:] = layer.keys[0, :, : length - pad]
+                    values[row, :, pad:] = layer.values[0, :, : length - pad]
+            cache.update(keys, values, layer_idx)
+
+        return cache
+
+    def _prefix_cache(self) -> DynamicCache:
+        if self._cache is None:
+            with torch.no_grad():
+                self._cache = self.model(
+                    input_ids=self.prefix_ids.unsqueeze(0),
+                    past_key_values=DynamicCache(),
+                    use_cache=True,
+                ).past_key_values
+
+        return self._cache
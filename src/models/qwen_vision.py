@@ -1,28 +1,59 @@
-import os
-import sys
-
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
 
 import torch
-from PIL import Image
-from qwen_vl_utils import process_vision_info
-from transformers import AutoProcessor, Qwen2_5_VLForConditionalGeneration
+from qwen_vl_utils import fetch_image
+from transformers import (
+    AutoProcessor,
+    LogitsProcessor,
+    LogitsProcessorList,
+    Qwen2_5_VLForConditionalGeneration,
+)
+
+from ..config import PROMPT_PREFIX, STRUCTURED_MAX_NEW_TOKENS
+from ..image_store import StoredImage, load_image
+from ..structured import (
+    ANSWER_PREFIX,
+    GeneratedText,
+    SentimentConstraint,
+    SentimentResult,
+    parse_structured_output,
+)
+from ..tracing import tracer
+from ..utils import get_available_gpu
+from .load_config import LoadConfig
+from .prefix_cache import PrefixCache
+
+
+class _StepTimer(LogitsProcessor):
+    """
+    Record when each token is chosen, to split a traced generation into its prefill and decode phases. The logits processors run once per generated token, after the forward pass of the step.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.times = []
+
+    def __call__(self, input_ids, scores):
+        if self.device.type == "cuda":
+            # the kernels run asynchronously, wait for the step to be done
+            torch.cuda.synchronize(self.device)
+        self.times.append(time.perf_counter())
 
-from utils import get_available_gpu
+        return scores
 
 
 class Qwen25Vision:
-    def __init__(self):
-        self.device = torch.device(get_available_gpu())
+    model_id = "Qwen/Qwen2.5-VL-7B-Instruct"
 
-        self.model_id = "Qwen/Qwen2.5-VL-7B-Instruct"
+    def __init__(self, device: str = None, load_config: LoadConfig = None):
+        # the device is picked automatically unless given, e.g. by the inference pool
+        self.device = torch.device(device if device is not None else get_available_gpu())
 
-        self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-            self.model_id,
-            torch_dtype=torch.bfloat16,
-            device_map=self.device,
-            attn_implementation="flash_attention_2",
-        ).to(self.device)
+        # the dtype, attention backend, quantization and compilation fit the device unless configured
+        self.load_config = load_config if load_config is not None else LoadConfig()
+        self.model = self.load_config.load(
+            Qwen2_5_VLForConditionalGeneration, self.model_id, self.device
+        )
 
         min_pixels = 256 * 28 * 28
         max_pixels = 1280 * 28 * 28
@@ -31,17 +62,277 @@ class Qwen25Vision:
             self.model_id, min_pixels=min_pixels, max_pixels=max_pixels, use_fast=True
         )
 
+        # the cached pixel values depend on the preprocessing settings
+        self.features_namespace = f"{self.model_id}-{min_pixels}-{max_pixels}"
+
+        # the prompts are left-padded so that the generation of every row starts at the same position
+        self.processor.tokenizer.padding_side = "left"
+
         self.terminator_tokens = [
             self.processor.tokenizer.eos_token_id,
             self.processor.tokenizer.convert_tokens_to_ids("``"),
         ]
 
+        # the KV cache of the role and PROMPT_PREFIX is reused by the text only prompts, set to None to disable it.
+        # A compiled model generates with its static cache instead.
+        self.prompt_prefix = PROMPT_PREFIX if not self.load_config.compile else None
+        self._prefix_caches = {}  # role -> PrefixCache
+
     def generate(
         self, role: str, prompt: str, image=None, max_new_token=1500, temperature=0.6
     ) -> str:
         """
         Generate text based on the prompt and optional image input.
         """
+        return self.generate_batch(
+            role, [prompt], [image], max_new_token, temperature
+        )[0]
+
+    def generate_batch(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=1500,
+        temperature=0.6,
+        streamer=None,
+    ) -> list[str]:
+        """
+        Generate text for a batch of prompts in a single forward pass. Each prompt can optionally be paired with an image (use None for no image). The prompts are left-padded so that the generated tokens of every item are aligned at the end of the batch. The optional streamer is passed to model.generate and receives the tokens as they are generated.
+        """
+        output_ids = self._generate(
+            role,
+            prompts,
+            images,
+            do_sample=True,
+            max_new_tokens=max_new_token,
+            temperature=temperature,
+            top_p=0.9,
+            streamer=streamer,
+        )
+
+        output_texts = self.processor.batch_decode(
+            output_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )
+
+        return [
+            GeneratedText(text, tokens)
+            for text, tokens in zip(output_texts, self._generated_tokens(output_ids))
+        ]
+
+    def generate_structured(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=STRUCTURED_MAX_NEW_TOKENS,
+        temperature=None,
+        streamer=None,
+    ) -> list[SentimentResult]:
+        """
+        Generate a SentimentResult for each prompt (e.g. STRUCTURED_PROMPT_TEMPLATE). The answer is a JSON object whose sentiment label is constrained to SENTIMENTS, and the generation of each item ends as soon as the object is closed. The decoding is greedy unless a temperature is given.
+        """
+        constraint = SentimentConstraint(self.processor.tokenizer, self.terminator_tokens[0])
+        sampling = (
+            dict(do_sample=False)
+            if temperature is None
+            else dict(do_sample=True, temperature=temperature, top_p=0.9)
+        )
+
+        output_ids = self._generate(
+            role,
+            prompts,
+            images,
+            answer_prefix=ANSWER_PREFIX,
+            max_new_tokens=max_new_token,
+            logits_processor=LogitsProcessorList([constraint]),
+            streamer=streamer,
+            **sampling,
+        )
+        output_texts = self.processor.batch_decode(
+            output_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )
+
+        return [
+            parse_structured_output(text, constraint.confidence(row, ids), tokens)
+            for row, (text, ids, tokens) in enumerate(
+                zip(output_texts, output_ids.tolist(), self._generated_tokens(output_ids))
+            )
+        ]
+
+    def _generate(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        answer_prefix: str = "",
+        **generate_kwargs,
+    ) -> torch.Tensor:
+        """
+        Run model.generate on the batch, with the answer of each item starting with <answer_prefix>, and return the generated token ids.
+        """
+        if images is None:
+            images = [None] * len(prompts)
+
+        if len(images) != len(prompts):
+            raise ValueError("The number of images must match the number of prompts.")
+
+        with tracer.span(
+            "qwen.preprocess",
+            batch=len(prompts),
+            images=sum(image is not None for image in images),
+        ):
+            batch_messages = [
+                self._build_messages(role, prompt, image)
+                for prompt, image in zip(prompts, images)
+            ]
+
+            prompt_templates = [
+                self.processor.apply_chat_template(messages, add_generation_prompt=True)
+                + answer_prefix
+                for messages in batch_messages
+            ]
+
+            inputs = self._prepare_inputs(prompt_templates, images)
+
+        generate_kwargs.update(
+            eos_token_id=self.terminator_tokens,
+            pad_token_id=self.processor.tokenizer.pad_token_id,
+        )
+
+        step_timer = None
+        if tracer.enabled:
+            step_timer = _StepTimer(self.device)
+            generate_kwargs["logits_processor"] = LogitsProcessorList(
+                [*(generate_kwargs.get("logits_processor") or []), step_timer]
+            )
+        start = time.perf_counter()
+
+        # the pixel values are only passed to the first forward of model.generate, which a cached prefix skips
+        if self.prompt_prefix is not None and all(image is None for image in images):
+            self._reset_rope_deltas()
+            output = self._prefix_cache(role).generate(
+                inputs.input_ids, inputs.attention_mask, **generate_kwargs
+            )
+        else:
+            output = self.model.generate(**inputs, **generate_kwargs)
+
+        # with left padding all the prompts end at the same position
+        output_ids = output[:, inputs.input_ids.shape[1] :]
+
+        if step_timer is not None and step_timer.times:
+            self._trace_generation(
+                start, time.perf_counter(), step_timer.times, inputs, output_ids
+            )
+
+        return output_ids
+
+    def _generated_tokens(self, output_ids: torch.Tensor) -> list[int]:
+        """
+        The number of tokens generated for each item, i.e. its output ids without the padding added once it ended before the others.
+        """
+        return (output_ids != self.processor.tokenizer.pad_token_id).sum(dim=1).tolist()
+
+    def _trace_generation(
+        self, start: float, end: float, step_times: list[float], inputs, output_ids
+    ) -> None:
+        """
+        Record the prefill (up to the first token) and the decode (the other tokens) of a generation, with their token counts and throughputs.
+        """
+        prompt_tokens = int(inputs.attention_mask.sum())
+        generated_tokens = sum(self._generated_tokens(output_ids))
+        prefill_end = step_times[0]
+
+        tracer.add_span(
+            "qwen.prefill",
+            start,
+            prefill_end,
+            batch=len(output_ids),
+            prompt_tokens=prompt_tokens,
+            tokens_per_s=prompt_tokens / max(prefill_end - start, 1e-9),
+        )
+        tracer.add_span(
+            "qwen.decode",
+            prefill_end,
+            end,
+            batch=len(output_ids),
+            steps=len(step_times),
+            generated_tokens=generated_tokens,
+            tokens_per_s=generated_tokens / max(end - prefill_end, 1e-9),
+        )
+
+    def _prepare_inputs(self, prompt_templates: list[str], images: list):
+        """
+        Do what the processor does on the texts and images, except that the pixel values of the stored images are cached per image hash, so an image shared by many news is resized and normalized once.
+        """
+        pixel_values, image_grid_thw = [], []
+        for image in images:
+            if image is not None:
+                features = self._image_features(image)
+                pixel_values.append(features["pixel_values"])
+                image_grid_thw.append(features["image_grid_thw"])
+
+        # expand the image token of each prompt to the number of tokens of its image
+        image_token = self.processor.image_token
+        merge_length = self.processor.image_processor.merge_size**2
+        grid_iter = iter(image_grid_thw)
+
+        texts = []
+        for text in prompt_templates:
+            while image_token in text:
+                num_tokens = int(next(grid_iter).prod()) // merge_length
+                text = text.replace(image_token, "<|placeholder|>" * num_tokens, 1)
+            texts.append(text.replace("<|placeholder|>", image_token))
+
+        inputs = self.processor.tokenizer(texts, padding=True, return_tensors="pt")
+        if pixel_values:
+            inputs["pixel_values"] = torch.cat(pixel_values)
+            inputs["image_grid_thw"] = torch.cat(image_grid_thw)
+
+        return inputs.to(self.device)
+
+    def _image_features(self, image) -> dict:
+        """
+        Get the pixel values and grid size of an image, from the image store if they were already computed.
+        """
+        if isinstance(image, StoredImage):
+            features = image.store.load_features(image.key, self.features_namespace)
+            if features is not None:
+                return features
+
+        resized_image = fetch_image({"image": load_image(image)})
+        features = dict(
+            self.processor.image_processor(images=[resized_image], return_tensors="pt")
+        )
+
+        if isinstance(image, StoredImage):
+            image.store.save_features(image.key, self.features_namespace, features)
+
+        return features
+
+    def _prefix_cache(self, role: str) -> PrefixCache:
+        if role not in self._prefix_caches:
+            prompt_template = self.processor.apply_chat_template(
+                self._build_messages(role, self.prompt_prefix)
+            )
+            prefix_ids = self.processor.tokenizer(
+                prompt_template, return_tensors="pt"
+            ).input_ids[0]
+            self._prefix_caches[role] = PrefixCache(self.model, prefix_ids)
+
+        return self._prefix_caches[role]
+
+    def _reset_rope_deltas(self) -> None:
+        """
+        Qwen2.5-VL offsets the rotary positions by rope_deltas, computed on the first forward of a generation and kept on the model until the next one. A generation from a cached prefix starts after that forward, so it would reuse the offsets of the previous generation. The positions of text are counted from its attention mask, padded or not, and are not offset.
+        """
+        for module in (self.model, getattr(self.model, "model", None)):
+            if module is not None and hasattr(module, "rope_deltas"):
+                module.rope_deltas = torch.zeros(
+                    (1, 1), dtype=torch.long, device=self.device
+                )
+
+    def _build_messages(self, role: str, prompt: str, image=None) -> list[dict]:
         messages = [
             {"role": "assistant", "content": role},
             {
@@ -51,42 +342,11 @@ class Qwen25Vision:
                 ],
             },
         ]
-        
+
         if image is not None:
             messages[1]["content"].append({"type": "image", "image": image})
 
-        prompt_template = self.processor.apply_chat_template(
-            messages, add_generation_prompt=True
-        )
-
-        image_inputs, video_inputs = process_vision_info(messages)
-
-        inputs = self.processor(
-            text=[prompt_template],
-            images=image_inputs,
-            videos=video_inputs,
-            padding=True,
-            return_tensors="pt",
-        ).to(self.device)
-
-        output = self.model.generate(
-            **inputs,
-            do_sample=True,
-            max_new_tokens=max_new_token,
-            eos_token_id=self.terminator_tokens,
-            temperature=temperature,
-            top_p=0.9,
-            pad_token_id=self.processor.tokenizer.eos_token_id,
-        )
-
-        output_trimmed = [
-            out_ids[len(in_ids) :] for in_ids, out_ids in zip(inputs.input_ids, output)
-        ]
-        output_text = self.processor.batch_decode(
-            output_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-        )
-
-        return output_text[0]
+        return messages
 
     def __call__(
         self, role: str, prompt: str, image=None, max_new_token=1500, temperature=0.8
@@ -97,7 +357,7 @@ class Qwen25Vision:
 if __name__ == "__main__":
     llm = Qwen25Vision()
 
-    # image = Image.open("hkust.jpg")
+    # image = fetch_image({"image": "hkust.jpg"})
     image = None
 
     role = "You are a helpful assistant"
@@ -0,0 +1,379 @@
+import argparse
+import importlib
+import os
+import secrets
+import stat
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from ..config import STRUCTURED_MAX_NEW_TOKENS
+from .load_config import LoadConfig, add_load_config_arguments
+
+# name -> (module, class) of the supported models, imported only when the model is loaded. The modules are relative to this package, or absolute names of other packages
+MODELS = {
+    "qwen": (".qwen_vision", "Qwen25Vision"),
+    "llama": (".llama_vision", "LlamaVision"),
+}
+
+MODEL_IDS = {
+    "qwen": "Qwen/Qwen2.5-VL-7B-Instruct",
+    "llama": "meta-llama/Llama-3.2-11B-Vision-Instruct",
+}
+
+# the generation methods of the models, with the same arguments, which the server and the pool can call
+GENERATE_METHODS = ("generate_batch", "generate_structured")
+
+# the socket is in a directory of the user only, since the connections exchange pickles
+_RUNTIME_DIR = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "quant-lvlm",
+)
+DEFAULT_SOCKET_PATH = os.path.join(_RUNTIME_DIR, "vlm.sock")
+
+# models already loaded in this process, so the weights, processor and tokenizer are loaded once
+_loaded_models = {}
+
+
+def load_model(name: str, device: str = None, load_config: LoadConfig = None):
+    """
+    Load the model (or get the already loaded one) of the given name. The device is picked automatically if not given, and the load config (dtype, attention, quantization, compilation) fits the device if not given.
+    """
+    if name not in MODELS:
+        raise ValueError(f"Unknown model {name}, please choose from {list(MODELS)}.")
+
+    key = (name, device, load_config)
+    if key not in _loaded_models:
+        module_name, class_name = MODELS[name]
+        model_class = getattr(
+            importlib.import_module(module_name, __package__), class_name
+        )
+        _loaded_models[key] = model_class(device, load_config)
+
+    return _loaded_models[key]
+
+
+def _authkey_path(socket_path: str) -> str:
+    return socket_path + ".key"
+
+
+def _check_owned(path: str, mode_mask: int = 0o077) -> None:
+    """
+    Raise PermissionError unless the path belongs to the current user and is not accessible by the others (the bits of <mode_mask>).
+    """
+    info = os.lstat(path)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not owned by the current user")
+    if stat.S_IMODE(info.st_mode) & mode_mask:
+        raise PermissionError(f"{path} is accessible by other users")
+
+
+def _create_authkey(socket_path: str) -> bytes:
+    """
+    Create the directory of the socket for the current user only, and write a new random authkey next to the socket, readable by the current user only.
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    _check_owned(directory)
+
+    authkey = secrets.token_bytes(32)
+    key_path = _authkey_path(socket_path)
+    if os.path.lexists(key_path):
+        os.remove(key_path)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as fp:
+        fp.write(authkey)
+
+    return authkey
+
+
+def _read_authkey(socket_path: str) -> bytes:
+    """
+    Read the authkey of the server of the socket, after checking that the socket, its directory and the key belong to the current user.
+    """
+    key_path = _authkey_path(socket_path)
+    _check_owned(os.path.dirname(os.path.abspath(socket_path)))
+    _check_owned(socket_path)
+    _check_owned(key_path)
+
+    with open(key_path, "rb") as fp:
+        return fp.read()
+
+
+class _FirstTokenTimer:
+    """
+    Streamer recording when model.generate produces its first token. The first put is the prompt itself.
+    """
+
+    def __init__(self):
+        self.first_token_time = None
+        self._puts = 0
+
+    def put(self, value):
+        self._puts += 1
+        if self._puts == 2 and self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+
+    def end(self):
+        pass
+
+
+class LazyVLM:
+    """
+    Stand-in of Qwen25Vision / LlamaVision which loads the model on the first generation request only, so the runs without anything to summarize never pay for the loading.
+    """
+
+    def __init__(self, name: str = "qwen", load_config: LoadConfig = None, device: str = None):
+        if name not in MODELS:
+            raise ValueError(f"Unknown model {name}, please choose from {list(MODELS)}.")
+
+        self.name = name
+        self.model_id = MODEL_IDS[name]
+        self.load_config = load_config
+        # picked automatically unless given
+        self.device = device
+
+        self._created_time = time.perf_counter()
+        self.load_time = None
+        self.time_to_first_token = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return (self.name, self.device, self.load_config) in _loaded_models
+
+    def generate_batch(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=1500,
+        temperature=0.6,
+    ) -> list[str]:
+        return self._generate(
+            "generate_batch", role, prompts, images, max_new_token, temperature
+        )
+
+    def generate_structured(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=STRUCTURED_MAX_NEW_TOKENS,
+        temperature=None,
+    ) -> list:
+        return self._generate(
+            "generate_structured", role, prompts, images, max_new_token, temperature
+        )
+
+    def _generate(self, method: str, *args) -> list:
+        if not self.is_loaded:
+            start = time.perf_counter()
+            load_model(self.name, self.device, self.load_config)
+            self.load_time = time.perf_counter() - start
+
+        generate = getattr(load_model(self.name, self.device, self.load_config), method)
+
+        if self.time_to_first_token is not None:
+            return generate(*args)
+
+        timer = _FirstTokenTimer()
+        outputs = generate(*args, streamer=timer)
+        if timer.first_token_time is not None:
+            # measured from the creation of the stand-in, so it includes the loading
+            self.time_to_first_token = timer.first_token_time - self._created_time
+
+        return outputs
+
+    def stats(self) -> dict:
+        return {
+            "model_id": self.model_id,
+            "loaded": self.is_loaded,
+            "load_config": repr(self.load_config) if self.load_config is not None else None,
+            "load_time": self.load_time,
+            "time_to_first_token": self.time_to_first_token,
+        }
+
+
+class VLMServer:
+    """
+    Long-lived process keeping a model loaded and serving generation requests over a Unix socket, so that repeated runs (e.g. from cron) reuse the loaded model.
+
+    The socket and its random authkey are only accessible by the user of the server, since the requests are pickles.
+    """
+
+    def __init__(
+        self,
+        name: str = "qwen",
+        socket_path: str = DEFAULT_SOCKET_PATH,
+        load_config: LoadConfig = None,
+    ):
+        self.vlm = LazyVLM(name, load_config)
+        self.socket_path = socket_path
+
+    def serve_forever(self, preload: bool = True) -> None:
+        if preload:
+            start = time.perf_counter()
+            load_model(self.vlm.name, load_config=self.vlm.load_config)
+            self.vlm.load_time = time.perf_counter() - start
+            print(f"Loaded {self.vlm.model_id} in {self.vlm.load_time:.1f}s")
+
+        authkey = _create_authkey(self.socket_path)
+        if os.path.lexists(self.socket_path):
+            # the socket of a previous server, never a file of someone else
+            _check_owned(self.socket_path, mode_mask=0)
+            if not stat.S_ISSOCK(os.lstat(self.socket_path).st_mode):
+                raise FileExistsError(f"{self.socket_path} exists and is not a socket")
+            os.remove(self.socket_path)
+
+        with Listener(self.socket_path, family="AF_UNIX", authkey=authkey) as listener:
+            os.chmod(self.socket_path, 0o600)
+            print(f"Serving {self.vlm.model_id} on {self.socket_path}")
+            while True:
+                with listener.accept() as conn:
+                    self._handle(conn)
+
+    def _handle(self, conn) -> None:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+
+            if request["method"] == "info":
+                conn.send(
+                    {
+                        "result": {
+                            "model_id": self.vlm.model_id,
+                            "load_config": self.vlm.load_config,
+                        }
+                    }
+                )
+                continue
+
+            if request["method"] not in GENERATE_METHODS:
+                conn.send({"error": f"Unknown method {request['method']}"})
+                continue
+
+            try:
+                start = time.perf_counter()
+                timer = _FirstTokenTimer()
+                generate = getattr(
+                    load_model(self.vlm.name, load_config=self.vlm.load_config),
+                    request["method"],
+                )
+                result = generate(
+                    *request["args"], streamer=timer, **request["kwargs"]
+                )
+                time_to_first_token = (
+                    timer.first_token_time - start
+                    if timer.first_token_time is not None
+                    else None
+                )
+                conn.send({"result": result, "time_to_first_token": time_to_first_token})
+            except Exception as e:
+                conn.send({"error": repr(e)})
+
+
+class VLMClient:
+    """
+    Client of VLMServer with the same generate_batch interface as the models. It only connects to a socket of the current user, with the authkey written by the server.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        start = time.perf_counter()
+        self._conn = Client(
+            socket_path, family="AF_UNIX", authkey=_read_authkey(socket_path)
+        )
+        self.connect_time = time.perf_counter() - start
+        self.time_to_first_token = None
+
+        self._conn.send({"method": "info"})
+        info = self._conn.recv()["result"]
+        self.model_id = info["model_id"]
+        self.load_config = info["load_config"]
+
+    def generate_batch(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=1500,
+        temperature=0.6,
+    ) -> list[str]:
+        return self._call(
+            "generate_batch", role, prompts, images, max_new_token, temperature
+        )
+
+    def generate_structured(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        max_new_token=STRUCTURED_MAX_NEW_TOKENS,
+        temperature=None,
+    ) -> list:
+        return self._call(
+            "generate_structured", role, prompts, images, max_new_token, temperature
+        )
+
+    def _call(self, method: str, *args) -> list:
+        self._conn.send({"method": method, "args": args, "kwargs": {}})
+        response = self._conn.recv()
+
+        if "error" in response:
+            raise RuntimeError(f"The VLM server failed: {response['error']}")
+
+        if self.time_to_first_token is None:
+            self.time_to_first_token = response["time_to_first_token"]
+
+        return response["result"]
+
+    def stats(self) -> dict:
+        return {
+            "model_id": self.model_id,
+            "connect_time": self.connect_time,
+            "time_to_first_token": self.time_to_first_token,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def get_vlm(
+    name: str = "qwen",
+    socket_path: str = DEFAULT_SOCKET_PATH,
+    load_config: LoadConfig = None,
+    device: str = None,
+):
+    """
+    Use the model of the running VLM server if there is one serving the same model with the same load config, otherwise a model loaded lazily in this process with the load config, on the device if given.
+    """
+    if socket_path is not None and os.path.exists(socket_path):
+        try:
+            client = VLMClient(socket_path)
+        except (ConnectionError, OSError, AuthenticationError) as e:
+            print(f"Cannot use the VLM server on {socket_path} ({e}), loading the model locally")
+        else:
+            # the default config of the server fits its device, as the one of a local model would
+            if client.model_id == MODEL_IDS.get(name) and (
+                client.load_config or LoadConfig()
+            ) == (load_config or LoadConfig()):
+                return client
+
+            print(
+                f"The VLM server on {socket_path} serves {client.model_id} with "
+                f"{client.load_config!r}, loading {name} locally"
+            )
+            client.close()
+
+    return LazyVLM(name, load_config, device)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a VLM over a Unix socket.")
+    parser.add_argument("--model", default="qwen", choices=list(MODELS))
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    add_load_config_arguments(parser)
+    args = parser.parse_args()
+
+    VLMServer(args.model, args.socket, LoadConfig.from_args(args)).serve_forever()
@@ -1,53 +1,84 @@
+import contextlib
 import json
+import multiprocessing as mp
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from io import BytesIO
 from typing import Optional
+from urllib.parse import urlparse
 
 import pandas as pd
-import yfinance as yf
-from bs4 import BeautifulSoup
-from PIL import Image
-from pyrate_limiter import Duration, Limiter, RequestRate
-from requests import Session
-from requests.adapters import HTTPAdapter
-from requests_cache import CacheMixin, SQLiteCache
-from requests_ratelimiter import LimiterMixin, MemoryQueueBucket
-from urllib3.util import Retry
+from requests import RequestException
 
-from utils import process_news_df
+from .config import FAILED_CONTENT_PREFIX
+from .dedup import deduplicate_news
+from .html_extractor import extract_in_process, get_extractor
+from .http_layer import CachedLimiterSession, HTTPCache
+from .image_store import ImageStore, StoredImage
+from .seen_index import SeenIndex
+from .tracing import traced, tracer
+from .utils import process_news_df
 
 
-class CachedLimiterSession(CacheMixin, LimiterMixin, Session):
-    pass
+# from this number of fetching threads, the pages are parsed in a process pool instead of the threads, which would contend for the GIL
+PARSE_POOL_MIN_WORKERS = 16
 
 
 class FinanceNewsScrapper:
-    def __init__(self, time_range: int = 48 * 60 * 60):
+    def __init__(
+        self,
+        time_range: int = 48 * 60 * 60,
+        max_workers: int = 8,
+        max_requests_per_host: int = 4,
+        request_timeout: float = 10.0,
+        image_store: ImageStore = None,
+        seen_index: SeenIndex = None,
+        extractor: str = "auto",
+        parse_processes: int = None,
+        http_cache: HTTPCache = None,
+        rate_limits: dict[str, float] = None,
+    ):
         # constant variables
         self.HEADER = {
             "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/18.0.1 Safari/605.1.15"
         }
         self.time_range = time_range # change it to two days range
 
-        # session variables
-        self.yf_session = CachedLimiterSession(
-            limiter=Limiter(
-                RequestRate(10, Duration.SECOND * 5)
-            ),  # max 10 requests per 5 seconds
-            bucket_class=MemoryQueueBucket,
-            backend=SQLiteCache("yfinance.cache"),
-        )
-
-        retry = Retry(
-            total=5,
-            backoff_factor=2,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
+        # concurrent fetching settings, max_workers = 1 fetches the news one by one
+        self.max_workers = max_workers
+        self.max_requests_per_host = max_requests_per_host
+        self.request_timeout = request_timeout
+        self._host_semaphores = {}
+        self._host_semaphores_lock = threading.Lock()
+
+        # the images are kept on the disk, the scrapped news only hold references to them
+        self.image_store = image_store if image_store is not None else ImageStore()
+
+        # the news already written in the previous runs are skipped if given
+        self.seen_index = seen_index
+
+        # the article body is extracted by the fastest installed HTML parser unless given ("selectolax", "lxml" or "bs4")
+        self.extractor = get_extractor(extractor)
+        # number of parsing processes, 0 parses in the fetching threads, None decides by <max_workers>
+        if parse_processes is None:
+            parse_processes = (
+                (os.cpu_count() or 1) if max_workers >= PARSE_POOL_MIN_WORKERS else 0
+            )
+        self.parse_processes = parse_processes
+        self._parse_pool = None
 
-        adapter = HTTPAdapter(max_retries=retry)
+        # statistics of the cross-ticker deduplication of the last scrap, and the publication dates of its unique news by url
+        self.dedup_stats = {}
+        self.pub_dates = {}
 
-        self.requests_session = Session()
-        self.requests_session.mount("https://", adapter)
+        # one pooled session for yfinance and the articles, rate limited per host (HOST_RATE_LIMITS unless given), and which revalidates the cached pages with conditional requests
+        self.http_cache = http_cache if http_cache is not None else HTTPCache()
+        self.session = CachedLimiterSession(
+            self.http_cache, rate_limits=rate_limits, pool_size=max_workers
+        )
 
     def scrap(
         self, tickers: list[str], verbose: bool = True
@@ -56,24 +87,80 @@ class FinanceNewsScrapper:
         Scrap the news for each ticker in the list. The news will be stored in a dictionary where the key is the ticker and the value is another dictionary where the key is the title of the news and the value is the content of the news.
         """
         tickers_news = self._get_news_obj(tickers)
-        ticker_news_map = {}
+        ticker_news_map = {ticker: {} for ticker in tickers_news}
 
-        for ticker, news_df in tickers_news.items():
-            if verbose:
-                print(f"Processing news for {ticker}")
+        for news_tickers, title, news_contents in self._iter_news_contents(
+            tickers_news, verbose
+        ):
+            for ticker in news_tickers:
+                ticker_news_map[ticker][title] = news_contents
 
-            news_map = {}
+        return ticker_news_map
 
-            for i in range(len(news_df)):
-                title, news_url, image_url = news_df.iloc[i][["title", "news_url", "image_url"]]
-                text_and_images = self._get_each_news_content(news_url, image_url)
+    def iter_news(self, tickers: list[str], verbose: bool = True, claim=None):
+        """
+        Yield (tickers, title, (text, image, news_url)) for each unique news as soon as its content is fetched, instead of waiting for all the tickers to be scrapped. A news returned for several tickers is yielded once with all of its tickers.
 
-                news_map[title] = (*text_and_images, news_url)
+        claim, if given, is called with the unique news (dicts of deduplicate_news) before any content is fetched, and returns those to fetch, e.g. the news not claimed by another shard of a sharded run.
+        """
+        tickers_news = self._get_news_obj(tickers)
 
-            ticker_news_map[ticker] = news_map.copy()
+        yield from self._iter_news_contents(tickers_news, verbose, claim)
 
-        return ticker_news_map
+    def _iter_news_contents(
+        self, tickers_news: dict[str, pd.DataFrame], verbose: bool, claim=None
+    ):
+        """
+        Deduplicate the news across the tickers, then fetch the content of every unique news through the thread pool and yield them in order. At most 2 * <max_workers> news are in flight, so the memory does not grow with the number of news when the consumer is slower than the fetching.
+        """
+        unique_news, self.dedup_stats = deduplicate_news(tickers_news)
+        if claim is not None:
+            unique_news = claim(unique_news)
+        self.pub_dates = {news["news_url"]: news["pub_date"] for news in unique_news}
+
+        # the news folded into a unique news are written with it
+        if self.seen_index is not None:
+            for news in unique_news:
+                self.seen_index.add_duplicates(news["news_url"], news["duplicate_urls"])
+
+        if verbose:
+            print(
+                f"Processing {self.dedup_stats['unique_news']} unique news out of {self.dedup_stats['news']} news "
+                f"(dedup ratio: {self.dedup_stats['dedup_ratio']:.1%})"
+            )
+
+        max_workers = max(self.max_workers, 1)
+        pending = deque()
+
+        parse_pool = (
+            ProcessPoolExecutor(
+                max_workers=self.parse_processes,
+                # forking a process with running threads is unsafe
+                mp_context=mp.get_context("spawn"),
+            )
+            if self.parse_processes > 0
+            else contextlib.nullcontext()
+        )
+
+        with parse_pool, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            self._parse_pool = parse_pool if self.parse_processes > 0 else None
+            for news in unique_news:
+                future = executor.submit(
+                    self._get_each_news_content, news["news_url"], news["image_url"]
+                )
+                pending.append((news, future))
+
+                if len(pending) >= 2 * max_workers:
+                    news_, future_ = pending.popleft()
+                    yield news_["tickers"], news_["title"], (*future_.result(), news_["news_url"])
+
+            while pending:
+                news_, future_ = pending.popleft()
+                yield news_["tickers"], news_["title"], (*future_.result(), news_["news_url"])
+
+            self._parse_pool = None
 
+    @traced("scrapper.get_news_obj")
     def _get_news_obj(self, tickers: list[str]) -> dict[str, pd.DataFrame]:
         """
         Get the news object from yfinance for each ticker. Only news published within <time_range> hours are considered.
@@ -83,51 +170,115 @@ class FinanceNewsScrapper:
         today_time = int(today_time.timestamp())
         day_ago_time = today_time - self.time_range # please refer to the __init__ to see what time_range is (e.g. one day ago / two days ago)
 
-        tickers_obj = yf.Tickers(tickers, session=self.yf_session)
+        # the news lists of the tickers are fetched concurrently
+        with ThreadPoolExecutor(max_workers=max(self.max_workers, 1)) as executor:
+            news_lists = executor.map(self._get_ticker_news, tickers)
+            tickers_news_lists = dict(zip(tickers, news_lists))
 
         # get the news
-        tickers_news = {
-            ticker: process_news_df(pd.DataFrame(news), day_ago_time, today_time)
-            for ticker, news in tickers_obj.news().items()
-        }
+        tickers_news = {}
+        for ticker, news in tickers_news_lists.items():
+            # incremental run: only the news after the ticker's high-water mark and not yet written
+            start_time = (
+                self.seen_index.start_time(ticker, day_ago_time)
+                if self.seen_index is not None
+                else day_ago_time
+            )
+            with tracer.span("process_news_df", ticker=ticker, news=len(news)):
+                news_df = process_news_df(pd.DataFrame(news), start_time, today_time)
+
+            if self.seen_index is None:
+                tickers_news[ticker] = news_df
+                continue
+
+            tickers_news[ticker] = self.seen_index.filter_new(ticker, news_df)
 
         return tickers_news
 
+    def _get_ticker_news(self, ticker: str) -> list[dict]:
+        # yfinance takes longer to import than the rest of the scrapper, so it is imported when the news are fetched
+        import yfinance as yf
+
+        with tracer.span("yfinance.news", ticker=ticker) as span:
+            news = yf.Ticker(ticker, session=self.session).news
+            span.set(news=len(news))
+
+        return news
+
+    @traced("scrapper.get_each_news_content")
     def _get_each_news_content(
         self, news_url: str, image_url: Optional[str]
-    ) -> tuple[str, Optional[Image.Image]]:
+    ) -> tuple[str, Optional[StoredImage]]:
         """
         Get the text and image from the news_url. Only one news is processed in this function.
         """
-        response = self.requests_session.get(news_url, headers=self.HEADER)
+        try:
+            with tracer.span("http.article", url=news_url) as span:
+                response = self._get(news_url, headers=self.HEADER)
+                span.set(
+                    status=response.status_code,
+                    bytes=len(response.content),
+                    from_cache=getattr(response, "from_cache", False),
+                )
+        except RequestException as e:
+            return (
+                f"{FAILED_CONTENT_PREFIX}{news_url} with error {e}. Please check the URL.",
+                None,
+            )
 
         if response.status_code != 200:
             return (
-                f"Failed to get content from {news_url} with status code {response.status_code}. Please check the URL.",
+                f"{FAILED_CONTENT_PREFIX}{news_url} with status code {response.status_code}. Please check the URL.",
                 None,
             )
 
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        text = ""
+        with tracer.span("html.extract", extractor=self.extractor.name):
+            text, image_src = self._extract(response.content)
         image = None
 
-        # get the text
-        if text_element := soup.find("div", class_="caas-body"):
-            text = text_element.text
-            words_to_remove = ["Story continues", "View comments"]
-            for word in words_to_remove:
-                text = text.replace(word, "")
-
         # get the image
-        if image_url is None:
-            if image_element := soup.find("img", class_="caas-img has-preview"):
-                image_url = image_element["src"]
-                response = self.requests_session.get(image_url)
-                image = Image.open(BytesIO(response.content))
+        if image_url is None and image_src is not None:
+            from PIL import Image, UnidentifiedImageError
+
+            try:
+                with tracer.span("http.image", url=image_src):
+                    response = self._get(image_src)
+                # only the header is parsed here, the pixels are decoded when the model needs them
+                Image.open(BytesIO(response.content))
+                image = self.image_store.put(response.content)
+            except (RequestException, UnidentifiedImageError):
+                image = None
 
         return text, image
 
+    def _extract(self, html: bytes) -> tuple[str, Optional[str]]:
+        """
+        Get the article text and image url of the page, in the parsing process pool if there is one.
+        """
+        if self._parse_pool is not None:
+            return self._parse_pool.submit(
+                extract_in_process, self.extractor.name, html
+            ).result()
+
+        return self.extractor.extract(html)
+
+    def _get(self, url: str, **kwargs):
+        """
+        Send a GET request through the retrying session while holding the semaphore of the url's host, so that at most <max_requests_per_host> requests hit the same website at the same time.
+        """
+        host = urlparse(url).netloc
+        with self._host_semaphores_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(
+                    self.max_requests_per_host
+                )
+            semaphore = self._host_semaphores[host]
+
+        with semaphore:
+            return self.session.get(
+                url, timeout=self.request_timeout, **kwargs
+            )
+
 
 if __name__ == "__main__":
 
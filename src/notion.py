@@ -5,11 +5,16 @@ from datetime import datetime
 from dotenv import load_dotenv
 from notion_client import Client
 
+from .tracing import tracer
+
 load_dotenv()
 
 
 class NotionClient:
-    def __init__(self):
+    # Notion accepts at most 100 children blocks per append request
+    MAX_BLOCKS_PER_REQUEST = 100
+
+    def __init__(self, base_url: str = None):
         self._token = os.getenv("NOTION_TOKEN", "")
         if self._token == "":
             raise ValueError(
@@ -21,7 +26,16 @@ class NotionClient:
             raise ValueError(
                 "Please provide a valid NOTION_PAGE_ID in your environment variables."
             )
-        self._client = Client(auth=self._token)
+
+        # base_url (or NOTION_BASE_URL) is only used to point the client to another server, e.g. a local fake Notion server
+        if base_url is None:
+            base_url = os.getenv("NOTION_BASE_URL") or None
+        self._base_url = base_url
+
+        if base_url is not None:
+            self._client = Client(auth=self._token, base_url=base_url)
+        else:
+            self._client = Client(auth=self._token)
 
     def create_page(self, title: str) -> dict:
         """
@@ -29,12 +43,14 @@ class NotionClient:
         """
         already_exists, page_id = self._check_subpage_exists(title)
         if already_exists:
-            return self._client.pages.retrieve(page_id)
+            with tracer.span("notion.pages.retrieve"):
+                return self._client.pages.retrieve(page_id)
 
-        new_created_page = self._client.pages.create(
-            parent={"page_id": self._main_page_id},
-            properties={"title": [{"text": {"content": title}}]},
-        )
+        with tracer.span("notion.pages.create"):
+            new_created_page = self._client.pages.create(
+                parent={"page_id": self._main_page_id},
+                properties={"title": [{"text": {"content": title}}]},
+            )
 
         return new_created_page
 
@@ -54,42 +70,30 @@ class NotionClient:
         """
         Add a new element to the page.
         """
-
-        link_obj = {"url": link} if link is not None else None
-
-        element = [
-            {
-                "object": "block",
-                "type": content_type,
-                content_type: {
-                    "rich_text": [
-                        {
-                            "type": "text",
-                            "text": {"content": content_text, "link": link_obj},
-                            "annotations": {
-                                "bold": is_bold,
-                                "italic": is_italic,
-                                "strikethrough": is_strikethrough,
-                                "underline": is_underline,
-                                "code": is_code,
-                                "color": color,
-                            },
-                        }
-                    ]
-                },
-            }
-        ]
-        self._client.blocks.children.append(block_id=page_id, children=element)
+        element = self.build_element(
+            content_type,
+            content_text,
+            is_bold,
+            is_italic,
+            is_strikethrough,
+            is_underline,
+            is_code,
+            color,
+            link,
+        )
+        self.append_blocks(page_id, [element])
 
     def add_multiple_elements(
-        self, page_id: str, elements_to_be_added: list[dict]
+        self, page_id: str, elements_to_be_added: list[dict], on_written=None
     ) -> None:
         """
-        Add multiple elements to the page.
+        Add multiple elements to the page. The blocks are built locally and appended with as few requests as possible. on_written is called with the ids of the created blocks.
         """
-
-        for element in elements_to_be_added:
-            self.add_element(page_id, **element)
+        block_ids = self.append_blocks(
+            page_id, [self.build_element(**element) for element in elements_to_be_added]
+        )
+        if on_written is not None:
+            on_written(block_ids)
 
     def add_new_line(self, page_id: str) -> None:
         """
@@ -101,21 +105,75 @@ class NotionClient:
         """
         Add a new divider to the page.
         """
-        element = [
-            {
+        self.append_blocks(page_id, [self.build_element("divider")])
+
+    def append_blocks(self, page_id: str, blocks: list[dict]) -> list[str]:
+        """
+        Append the blocks to the page, in chunks of at most <MAX_BLOCKS_PER_REQUEST> blocks, which is the limit of Notion per request. Return the ids of the created blocks.
+        """
+        block_ids = []
+        for i in range(0, len(blocks), self.MAX_BLOCKS_PER_REQUEST):
+            chunk = blocks[i : i + self.MAX_BLOCKS_PER_REQUEST]
+            with tracer.span("notion.blocks.append", blocks=len(chunk)):
+                response = self._client.blocks.children.append(
+                    block_id=page_id, children=chunk
+                )
+            block_ids.extend(block["id"] for block in response["results"])
+
+        return block_ids
+
+    @staticmethod
+    def build_element(
+        content_type: str,
+        content_text: str = "",
+        is_bold: bool = False,
+        is_italic: bool = False,
+        is_strikethrough: bool = False,
+        is_underline: bool = False,
+        is_code: bool = False,
+        color: str = "default",
+        link: str = None,
+    ) -> dict:
+        """
+        Build the block of an element without sending it. The "divider" content type builds a divider and ignores the other arguments.
+        """
+        if content_type == "divider":
+            return {
                 "object": "block",
                 "type": "divider",
                 "divider": {},
             }
-        ]
-        self._client.blocks.children.append(block_id=page_id, children=element)
+
+        link_obj = {"url": link} if link is not None else None
+
+        return {
+            "object": "block",
+            "type": content_type,
+            content_type: {
+                "rich_text": [
+                    {
+                        "type": "text",
+                        "text": {"content": content_text, "link": link_obj},
+                        "annotations": {
+                            "bold": is_bold,
+                            "italic": is_italic,
+                            "strikethrough": is_strikethrough,
+                            "underline": is_underline,
+                            "code": is_code,
+                            "color": color,
+                        },
+                    }
+                ]
+            },
+        }
 
     def _check_subpage_exists(self, subpage_title) -> tuple[bool, str]:
         try:
             # Search for pages with the given title
-            response = self._client.search(
-                query=subpage_title, filter={"property": "object", "value": "page"}
-            ).get("results")
+            with tracer.span("notion.search"):
+                response = self._client.search(
+                    query=subpage_title, filter={"property": "object", "value": "page"}
+                ).get("results")
 
             # Filter the results to find a page with matching parent and title
             for page in response:
@@ -139,7 +197,9 @@ class NotionClient:
         """
         Not really deleting the page, but archiving it.
         """
-        self._client.pages.update(self._check_subpage_exists(title)[1], archived=True)
+        page_id = self._check_subpage_exists(title)[1]
+        with tracer.span("notion.pages.update"):
+            self._client.pages.update(page_id, archived=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+from notion_client import AsyncClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+from .notion import NotionClient
+from .tracing import tracer
+
+
+class TokenBucket:
+    """
+    Token bucket limiter allowing <rate> requests per second on average, with bursts of at most <capacity> requests.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last_time = time.monotonic()
+        self._paused_until = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last_time) * self.rate
+            )
+            self._last_time = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, delay: float) -> None:
+        """
+        Give no token for <delay> seconds, e.g. when the server asks to retry later.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self._tokens = 0.0
+
+
+class AsyncNotionWriter:
+    """
+    Append blocks to Notion pages from a background event loop, so the callers never wait for Notion. The requests are limited by a token bucket, the rate limited (429) and server error responses are retried after the Retry-After header or a jittered exponential backoff, and the appends to the same page that pile up while waiting for the limiter are merged into one request.
+
+    It can be used in place of NotionClient in notion_add_news_part. The token and base_url are read from NOTION_TOKEN and NOTION_BASE_URL when not given, as with NotionClient. Call flush to wait for the pending appends, and close at the end.
+
+    A failed write is raised by the next call to the writer (an append, flush or close). The blocks it did not write are kept in <unwritten> as (page_id, blocks, on_written), whose on_written is never called.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        token: str = None,
+        base_url: str = None,
+        rate: float = 3.0,
+        burst: int = 3,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        max_connections: int = 4,
+    ):
+        self._token = token if token is not None else os.getenv("NOTION_TOKEN", "")
+        if self._token == "":
+            raise ValueError(
+                "Please provide a valid NOTION_TOKEN in your environment variables."
+            )
+        if base_url is None:
+            base_url = os.getenv("NOTION_BASE_URL") or None
+        self._base_url = base_url
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_connections = max_connections
+
+        self.request_count = 0
+        self.retry_count = 0
+        self.unwritten = []
+
+        self._bucket = TokenBucket(rate, burst)
+        self._pending = {}  # page_id -> [(blocks, on_written)] waiting to be appended
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._started = threading.Event()
+        self._closed = False
+        self._error = None
+
+        self._thread = threading.Thread(
+            target=lambda: asyncio.run(self._run()), daemon=True
+        )
+        self._thread.start()
+        self._started.wait()
+
+    def add_multiple_elements(
+        self, page_id: str, elements_to_be_added: list[dict], on_written=None
+    ) -> None:
+        """
+        Queue the elements to be appended to the page and return immediately. on_written is called from the writer thread with the ids of the created blocks once they are appended.
+        """
+        self.append_blocks(
+            page_id,
+            [NotionClient.build_element(**element) for element in elements_to_be_added],
+            on_written,
+        )
+
+    def append_blocks(self, page_id: str, blocks: list[dict], on_written=None) -> None:
+        if self._closed:
+            raise RuntimeError("The writer is already closed.")
+        # the blocks are not queued when an earlier write failed
+        self._raise_error()
+
+        with self._lock:
+            self._pending.setdefault(page_id, []).append((blocks, on_written))
+            self._idle.clear()
+
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def flush(self) -> None:
+        """
+        Wait until every queued block is appended. Raise the first error of the writes, if any.
+        """
+        self._idle.wait()
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            # the loop is already closed when it stopped on an error
+            if not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._started.set()
+
+        try:
+            await self._write_loop()
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+        finally:
+            # never leave flush waiting if the loop stops
+            self._closed = True
+            self._idle.set()
+
+    async def _write_loop(self):
+        # one keep-alive connection pool for all the requests of the run
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            )
+        )
+        # the 429 and server errors are retried here, with the token bucket paused
+        options = {"auth": self._token, "retry": False}
+        if self._base_url is not None:
+            options["base_url"] = self._base_url
+
+        async with AsyncClient(client=http_client, **options) as client:
+            while True:
+                with self._lock:
+                    page_id = next(iter(self._pending), None)
+                    if page_id is None:
+                        self._idle.set()
+
+                if page_id is None:
+                    if self._closed:
+                        break
+                    await self._wakeup.wait()
+                    self._wakeup.clear()
+                    continue
+
+                await self._bucket.acquire()
+
+                # take the blocks only now, so the appends queued while waiting are merged
+                with self._lock:
+                    appends = self._pending.pop(page_id)
+                blocks = [block for append_blocks, _ in appends for block in append_blocks]
+
+                block_ids = []
+                try:
+                    step = NotionClient.MAX_BLOCKS_PER_REQUEST
+                    for i in range(0, len(blocks), step):
+                        if i > 0:
+                            await self._bucket.acquire()
+                        block_ids.extend(
+                            await self._append(client, page_id, blocks[i : i + step])
+                        )
+                except Exception as e:
+                    if self._error is None:
+                        self._error = e
+
+                try:
+                    self._dispatch(page_id, appends, block_ids)
+                except Exception as e:
+                    if self._error is None:
+                        self._error = e
+
+    def _dispatch(self, page_id: str, appends: list, block_ids: list[str]) -> None:
+        """
+        Give each merged append the ids of its own blocks. When the request failed midway, the appends after the written blocks go to unwritten, without the blocks of the first one that were written.
+        """
+        for append_blocks, on_written in appends:
+            if len(block_ids) < len(append_blocks):
+                self.unwritten.append((page_id, append_blocks[len(block_ids) :], on_written))
+                block_ids = []
+                continue
+
+            if on_written is not None:
+                on_written(block_ids[: len(append_blocks)])
+            block_ids = block_ids[len(append_blocks) :]
+
+    async def _append(
+        self, client: AsyncClient, page_id: str, blocks: list[dict]
+    ) -> list[str]:
+        """
+        Append the blocks and return the ids of the created blocks.
+        """
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                self.request_count += 1
+                with tracer.span(
+                    "notion.blocks.append", blocks=len(blocks), attempt=attempt
+                ):
+                    response = await client.blocks.children.append(
+                        block_id=page_id, children=blocks
+                    )
+                return [block["id"] for block in response["results"]]
+            except RequestTimeoutError:
+                if attempt == self.max_retries:
+                    raise
+            except HTTPResponseError as e:
+                if e.status not in self.RETRY_STATUS or attempt == self.max_retries:
+                    raise
+                retry_after = e.headers.get("Retry-After")
+
+            if retry_after is not None and retry_after.isdigit():
+                delay = float(retry_after)
+                self._bucket.pause(delay)
+            else:
+                # full jitter on top of the exponential backoff
+                delay = random.uniform(
+                    0, min(self.backoff_max, self.backoff_base * 2**attempt)
+                )
+
+            self.retry_count += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,254 @@
+import functools
+import queue
+import threading
+import time
+from datetime import datetime
+
+from .config import VLM_BATCH_SIZE
+from .notion_writer import AsyncNotionWriter
+from .seen_index import SeenIndex
+from .sentiment import EscalationRules, SentimentClassifier, TieredSummarizer
+from .summarizer import NewsSummarizer, PromptBuilder
+from .summary_cache import CachedVLM, SummaryCache
+from .utils import notion_add_news_part
+
+# marks the end of the stream in the queues
+_END = object()
+
+
+class StageCounter:
+    """
+    Throughput counter of one pipeline stage. busy_time only counts the time spent on the work of the stage, not the time waiting for the previous stage.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_time = 0.0
+        self.start_time = None
+        self.end_time = None
+
+    def elapsed(self) -> float:
+        if self.start_time is None:
+            return 0.0
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return end_time - self.start_time
+
+    def throughput(self) -> float:
+        """
+        Number of items processed per second of wall time.
+        """
+        elapsed = self.elapsed()
+        return self.items / elapsed if elapsed > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.name}: {self.items} items in {self.elapsed():.2f}s "
+            f"({self.throughput():.2f} items/s, busy {self.busy_time:.2f}s)"
+        )
+
+
+class NewsPipeline:
+    """
+    Run the scrapper, the VLM and the Notion writer concurrently. The news flow through bounded queues from one stage to the next, so network I/O, inference and Notion writes overlap and the memory is bounded by the queue sizes rather than the number of news.
+    """
+
+    def __init__(
+        self,
+        scrapper,
+        vlm,
+        page_id: str,
+        batch_size: int = VLM_BATCH_SIZE,
+        queue_size: int = 16,
+        cache: SummaryCache = None,
+        seen_index: SeenIndex = None,
+        prompt_builder: PromptBuilder = None,
+        structured: bool = False,
+        classifier: SentimentClassifier = None,
+        escalation_rules: EscalationRules = None,
+    ):
+        self.scrapper = scrapper
+        self.vlm = CachedVLM(vlm, cache)
+        self.summarizer = NewsSummarizer(
+            self.vlm,
+            prompt_builder
+            if prompt_builder is not None
+            else PromptBuilder.from_model_id(vlm.model_id),
+            structured=structured,
+        )
+        if classifier is not None:
+            # tiered mode, the VLM only summarizes the news escalated by the rules
+            self.summarizer = TieredSummarizer(
+                self.summarizer,
+                classifier,
+                escalation_rules if escalation_rules is not None else EscalationRules(),
+            )
+        self.page_id = page_id
+        self.batch_size = batch_size
+        self.seen_index = seen_index
+
+        self._news_queue = queue.Queue(maxsize=queue_size)
+        self._summary_queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+
+        self.counters = {
+            "scrap": StageCounter("scrap"),
+            "generate": StageCounter("generate"),
+            "notion": StageCounter("notion"),
+        }
+
+    def run(self, tickers: list[str], verbose: bool = True) -> dict[str, StageCounter]:
+        """
+        Process the news of the tickers and return the counters of each stage.
+        """
+        threads = [
+            threading.Thread(target=self._guard, args=(self._scrap_stage, tickers, verbose)),
+            threading.Thread(target=self._guard, args=(self._generate_stage,)),
+            threading.Thread(target=self._guard, args=(self._notion_stage,)),
+        ]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        if verbose:
+            for counter in self.counters.values():
+                print(counter)
+
+        return self.counters
+
+    def _guard(self, stage, *args):
+        """
+        Run a stage and record its error, the other stages stop as soon as they see it.
+        """
+        try:
+            stage(*args)
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+
+    def _put(self, q: queue.Queue, item):
+        while self._error is None:
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue, block: bool = True):
+        """
+        Get the next item of the queue, or the end marker once any stage failed. Raise queue.Empty if block is False and nothing is available.
+        """
+        if not block:
+            return q.get_nowait()
+
+        while self._error is None:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+        return _END
+
+    def _scrap_stage(self, tickers: list[str], verbose: bool):
+        counter = self.counters["scrap"]
+        counter.start_time = time.perf_counter()
+
+        news_iter = self.scrapper.iter_news(tickers, verbose)
+        while self._error is None:
+            busy_start = time.perf_counter()
+            news = next(news_iter, _END)
+            counter.busy_time += time.perf_counter() - busy_start
+
+            if news is _END:
+                break
+
+            # the latency of the news starts when it is scrapped
+            self._put(self._news_queue, (*news, time.perf_counter()))
+            counter.items += 1
+
+        counter.end_time = time.perf_counter()
+        self._put(self._news_queue, _END)
+
+    def _generate_stage(self):
+        counter = self.counters["generate"]
+        counter.start_time = time.perf_counter()
+
+        finished = False
+        while not finished:
+            # block for the first news of the batch, then take whatever is already available
+            batch = [self._get(self._news_queue)]
+            while len(batch) < self.batch_size and batch[-1] is not _END:
+                try:
+                    batch.append(self._get(self._news_queue, block=False))
+                except queue.Empty:
+                    break
+
+            if batch[-1] is _END:
+                finished = True
+                batch.pop()
+
+            if not batch or self._error is not None:
+                continue
+
+            busy_start = time.perf_counter()
+            vlm_responses = self.summarizer.summarize_batch(
+                [title for _, title, _, _ in batch],
+                [news_text for _, _, (news_text, _, _), _ in batch],
+                [news_image for _, _, (_, news_image, _), _ in batch],
+                [news_url for _, _, (_, _, news_url), _ in batch],
+                news_tickers=[news_tickers for news_tickers, _, _, _ in batch],
+                start_times=[scrapped_at for _, _, _, scrapped_at in batch],
+            )
+            counter.busy_time += time.perf_counter() - busy_start
+
+            for (news_tickers, title, (_, _, news_url), _), vlm_response in zip(
+                batch, vlm_responses
+            ):
+                self._put(
+                    self._summary_queue, (news_tickers, title, vlm_response, news_url)
+                )
+                counter.items += 1
+
+        counter.end_time = time.perf_counter()
+        self._put(self._summary_queue, _END)
+
+    def _notion_stage(self):
+        counter = self.counters["notion"]
+        counter.start_time = time.perf_counter()
+        # the writes are sent in the background, merged and rate limited
+        notion_writer = AsyncNotionWriter()
+
+        while (summary := self._get(self._summary_queue)) is not _END:
+            news_tickers, title, vlm_response, news_url = summary
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+            busy_start = time.perf_counter()
+            # the summary of a news shared by several tickers is added for each of them
+            for ticker in news_tickers:
+                notion_add_news_part(
+                    notion_writer,
+                    self.page_id,
+                    title,
+                    vlm_response,
+                    news_url,
+                    ticker,
+                    current_time,
+                    on_written=(
+                        functools.partial(
+                            self.seen_index.mark_written, news_url, ticker, title, self.page_id
+                        )
+                        if self.seen_index is not None
+                        else None
+                    ),
+                )
+            counter.busy_time += time.perf_counter() - busy_start
+            counter.items += 1
+
+        # wait for the last writes, so the counter covers them
+        notion_writer.close()
+        counter.end_time = time.perf_counter()
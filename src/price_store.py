@@ -0,0 +1,251 @@
+import os
+import tempfile
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# the columns of the stored bars, ret is the daily total return computed from the adjusted close
+BAR_COLUMNS = ["open", "high", "low", "close", "adj_close", "volume", "ret"]
+
+# yfinance columns -> stored columns
+_YF_COLUMNS = {
+    "Open": "open",
+    "High": "high",
+    "Low": "low",
+    "Close": "close",
+    "Adj Close": "adj_close",
+    "Volume": "volume",
+}
+
+
+class PriceStore:
+    """
+    Append-only on-disk store of the daily bars of each ticker, in uncompressed Arrow IPC files which are memory-mapped on read, so loading the history of thousands of tickers does not copy it.
+
+    Each update of a ticker writes a new part file with only the bars after the last stored one, and the parts of a ticker are compacted into one file once there are more than <max_parts>. pyarrow is only imported when the store is used.
+
+    The adjusted close of the past bars changes at every dividend or split, so it is not comparable across the parts. The daily return of each bar is computed when the bar is fetched, from the adjusted closes of the same download, and the factors are computed from these returns.
+    """
+
+    def __init__(self, root: str = "price_store", max_parts: int = 32):
+        self.root = root
+        self.max_parts = max_parts
+        os.makedirs(root, exist_ok=True)
+
+    def tickers(self) -> list[str]:
+        return sorted(
+            self._ticker_from_dir(name)
+            for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name))
+        )
+
+    def last_date(self, ticker: str) -> Optional[date]:
+        """
+        Date of the last stored bar of the ticker, read from the part file names without opening them.
+        """
+        parts = self._parts(ticker)
+        if not parts:
+            return None
+
+        return date.fromisoformat(parts[-1].split("_")[-1][: -len(".arrow")])
+
+    def append(self, ticker: str, bars: pd.DataFrame) -> int:
+        """
+        Store the bars (indexed by date, with BAR_COLUMNS) after the last stored bar of the ticker, and return how many were added.
+        """
+        import pyarrow as pa
+
+        last_date = self.last_date(ticker)
+        dates = pd.to_datetime(bars.index).date
+        if last_date is not None:
+            bars = bars[dates > last_date]
+            dates = dates[dates > last_date]
+
+        if bars.empty:
+            return 0
+
+        table = pa.table(
+            {
+                "date": pa.array(dates, type=pa.date32()),
+                **{
+                    column: pa.array(bars[column].to_numpy(dtype=np.float64))
+                    for column in BAR_COLUMNS
+                },
+            }
+        )
+        self._write(
+            os.path.join(self._ticker_dir(ticker), f"part_{dates[0]}_{dates[-1]}.arrow"),
+            table,
+        )
+
+        if len(self._parts(ticker)) > self.max_parts:
+            self.compact(ticker)
+
+        return len(bars)
+
+    def read(self, ticker: str, columns: list[str] = None):
+        """
+        The stored bars of the ticker as a pyarrow Table (None if there are none), backed by memory maps of the part files.
+        """
+        import pyarrow as pa
+
+        tables = []
+        for part in self._parts(ticker):
+            with pa.memory_map(os.path.join(self._ticker_dir(ticker), part)) as source:
+                table = pa.ipc.open_file(source).read_all()
+            tables.append(table.select(["date", *columns]) if columns else table)
+
+        if not tables:
+            return None
+
+        return pa.concat_tables(tables)
+
+    def compact(self, ticker: str) -> None:
+        """
+        Rewrite the parts of the ticker into one file.
+        """
+        parts = self._parts(ticker)
+        if len(parts) <= 1:
+            return
+
+        table = self.read(ticker)
+        dates = table.column("date")
+        self._write(
+            os.path.join(
+                self._ticker_dir(ticker),
+                f"part_{dates[0].as_py()}_{dates[-1].as_py()}.arrow",
+            ),
+            table,
+        )
+        for part in parts:
+            os.remove(os.path.join(self._ticker_dir(ticker), part))
+
+    def matrix(
+        self, tickers: list[str], column: str = "ret"
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Align a column of the tickers on the union of their dates. Return the dates (datetime64[D]) and a (dates, tickers) float64 matrix, with NaN where a ticker has no bar.
+        """
+        series = []
+        for ticker in tickers:
+            table = self.read(ticker, [column])
+            if table is None:
+                series.append((np.empty(0, dtype="datetime64[D]"), np.empty(0)))
+                continue
+            series.append(
+                (
+                    table.column("date").to_numpy().astype("datetime64[D]"),
+                    table.column(column).to_numpy(),
+                )
+            )
+
+        dates = np.unique(np.concatenate([ticker_dates for ticker_dates, _ in series]))
+        values = np.full((len(dates), len(tickers)), np.nan)
+        for j, (ticker_dates, ticker_values) in enumerate(series):
+            values[np.searchsorted(dates, ticker_dates), j] = ticker_values
+
+        return dates, values
+
+    def _ticker_dir(self, ticker: str) -> str:
+        return os.path.join(self.root, ticker.replace("/", "%2F"))
+
+    @staticmethod
+    def _ticker_from_dir(name: str) -> str:
+        return name.replace("%2F", "/")
+
+    def _parts(self, ticker: str) -> list[str]:
+        """
+        The part files of the ticker, from the oldest to the latest. The ISO dates in their names sort chronologically.
+        """
+        ticker_dir = self._ticker_dir(ticker)
+        if not os.path.isdir(ticker_dir):
+            return []
+
+        return sorted(name for name in os.listdir(ticker_dir) if name.endswith(".arrow"))
+
+    @staticmethod
+    def _write(path: str, table) -> None:
+        """
+        Write the table to a temporary file then rename it, so a reader never sees a partial file.
+        """
+        import pyarrow as pa
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                with pa.ipc.new_file(f, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def _complete_bars(bars: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop the bar of today, which is not complete during the trading hours, and the days without price.
+    """
+    bars = bars[pd.to_datetime(bars.index).date < date.today()]
+
+    return bars.dropna(subset=["adj_close"])
+
+
+def update_prices(
+    store: PriceStore,
+    tickers: list[str],
+    session=None,
+    start: str = "2015-01-01",
+    chunk_size: int = 200,
+    verbose: bool = True,
+) -> dict[str, int]:
+    """
+    Download the daily bars of the tickers since their last stored bar (or <start>) with yfinance through the session, and append them to the store. The tickers with the same last bar are downloaded together, <chunk_size> tickers per request. Return the number of bars added for each ticker.
+    """
+    import yfinance as yf
+
+    # the last stored bar is downloaded again, to compute the return of the first new bar on the same adjustment
+    starts = {}
+    for ticker in tickers:
+        last_date = store.last_date(ticker)
+        starts.setdefault(
+            last_date.isoformat() if last_date is not None else start, []
+        ).append(ticker)
+
+    added = {}
+    for chunk_start, start_tickers in starts.items():
+        if date.fromisoformat(chunk_start) >= date.today() - timedelta(days=1):
+            # no complete bar can be newer than yesterday
+            added.update({ticker: 0 for ticker in start_tickers})
+            continue
+
+        for i in range(0, len(start_tickers), chunk_size):
+            chunk = start_tickers[i : i + chunk_size]
+            data = yf.download(
+                chunk,
+                start=chunk_start,
+                auto_adjust=False,
+                group_by="ticker",
+                progress=False,
+                session=session,
+                multi_level_index=True,
+            )
+
+            for ticker in chunk:
+                if data is None or ticker not in data.columns.get_level_values(0):
+                    added[ticker] = 0
+                    continue
+
+                bars = data[ticker].rename(columns=_YF_COLUMNS)
+                bars = _complete_bars(bars)
+                bars = bars.assign(ret=bars["adj_close"].pct_change(fill_method=None))
+                added[ticker] = store.append(ticker, bars)
+
+    if verbose:
+        print(
+            f"Added {sum(added.values())} bars for {sum(count > 0 for count in added.values())} of {len(tickers)} tickers"
+        )
+
+    return added
@@ -0,0 +1,210 @@
+import json
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from .dedup import canonicalize_url
+
+
+class SeenIndex:
+    """
+    Persistent SQLite index of the news already written to Notion, with the ids of their Notion blocks, and of the high-water mark of each ticker: the publication date up to which every news of the ticker is written. It lets a run skip everything a previous run already processed.
+
+    The news let through by filter_new are pending until they are written. The high-water mark moves up to the newest written news of the ticker, but never past its oldest pending news, so a news which failed or was skipped is fetched again by the next run.
+    """
+
+    def __init__(self, path: str = "seen_news.cache", overlap: int = 60 * 60):
+        self.path = path
+        # news published up to <overlap> seconds before the high-water mark are still checked, since yahoo may list them late
+        self.overlap = overlap
+
+        # the writes come from the Notion writer thread
+        self._lock = threading.Lock()
+        # the index is shared by the shard workers of the host, so wait for their locks, and let them read while one writes
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS written_news (
+                url TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                title TEXT,
+                page_id TEXT,
+                block_ids TEXT,
+                written_at REAL NOT NULL,
+                pub_date INTEGER,
+                PRIMARY KEY (url, ticker)
+            );
+            CREATE TABLE IF NOT EXISTS high_water_marks (
+                ticker TEXT PRIMARY KEY,
+                pub_date INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pending_news (
+                url TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                pub_date INTEGER NOT NULL,
+                PRIMARY KEY (url, ticker)
+            );
+            CREATE TABLE IF NOT EXISTS duplicate_news (
+                url TEXT NOT NULL,
+                duplicate_url TEXT NOT NULL,
+                PRIMARY KEY (url, duplicate_url)
+            );
+            """
+        )
+        # the indexes created before the publication dates of the written news were stored
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(written_news)")]
+        if "pub_date" not in columns:
+            self._conn.execute("ALTER TABLE written_news ADD COLUMN pub_date INTEGER")
+        self._conn.commit()
+
+    def start_time(self, ticker: str, day_ago_time: int) -> int:
+        """
+        The earliest publication date worth fetching for the ticker.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pub_date FROM high_water_marks WHERE ticker = ?", (ticker,)
+            ).fetchone()
+
+        if row is None:
+            return day_ago_time
+
+        return max(day_ago_time, row[0] - self.overlap)
+
+    def filter_new(self, ticker: str, news_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Drop the news of the ticker which are already written, and keep the others as the pending news of the ticker, in place of those of the previous run.
+        """
+        urls = [canonicalize_url(url) for url in news_df["news_url"]] if not news_df.empty else []
+
+        with self._lock:
+            seen = {
+                row[0]
+                for row in self._conn.execute(
+                    f"SELECT url FROM written_news WHERE ticker = ? AND url IN ({','.join('?' * len(urls))})",
+                    (ticker, *urls),
+                )
+            }
+            pending = [
+                (url, ticker, int(pub_date))
+                for url, pub_date in zip(urls, news_df["pubDate"] if urls else [])
+                if url not in seen
+            ]
+
+            # the pending news of the previous run which are not listed anymore are out of the window
+            self._conn.execute("DELETE FROM pending_news WHERE ticker = ?", (ticker,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pending_news VALUES (?, ?, ?)", pending
+            )
+            self._conn.commit()
+
+        if news_df.empty:
+            return news_df
+
+        return news_df[[url not in seen for url in urls]]
+
+    def add_duplicates(self, news_url: str, duplicate_urls: list[str]) -> None:
+        """
+        Remember the near-identical news folded into the news by the deduplication, which are marked written with it.
+        """
+        if not duplicate_urls:
+            return
+
+        url = canonicalize_url(news_url)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO duplicate_news VALUES (?, ?)",
+                [(url, canonicalize_url(duplicate_url)) for duplicate_url in duplicate_urls],
+            )
+            self._conn.commit()
+
+    def mark_written(
+        self,
+        news_url: str,
+        ticker: str,
+        title: str,
+        page_id: str,
+        block_ids: list[str],
+        pub_date: int = None,
+    ) -> None:
+        """
+        Record that the news and its duplicates are written for the ticker, and move the high-water mark of the ticker up to its newest written news, or to its oldest pending news if that one is older. The publication date is the one seen by filter_new unless given.
+        """
+        url = canonicalize_url(news_url)
+
+        with self._lock:
+            urls = [url] + [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT duplicate_url FROM duplicate_news WHERE url = ?", (url,)
+                )
+            ]
+            placeholders = ",".join("?" * len(urls))
+
+            if pub_date is None:
+                row = self._conn.execute(
+                    "SELECT pub_date FROM pending_news WHERE url = ? AND ticker = ?",
+                    (url, ticker),
+                ).fetchone()
+                pub_date = row[0] if row is not None else None
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO written_news VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        written_url,
+                        ticker,
+                        title,
+                        page_id,
+                        json.dumps(block_ids),
+                        time.time(),
+                        int(pub_date) if pub_date is not None else None,
+                    )
+                    for written_url in urls
+                ],
+            )
+            self._conn.execute(
+                f"DELETE FROM pending_news WHERE ticker = ? AND url IN ({placeholders})",
+                (ticker, *urls),
+            )
+
+            # the news are not always written in publication order, so the mark
+            # catches up with the newer news once the older pending ones are written
+            newest_written, oldest_pending = self._conn.execute(
+                """
+                SELECT
+                    (SELECT MAX(pub_date) FROM written_news WHERE ticker = ?),
+                    (SELECT MIN(pub_date) FROM pending_news WHERE ticker = ?)
+                """,
+                (ticker, ticker),
+            ).fetchone()
+            if newest_written is not None:
+                if oldest_pending is not None:
+                    newest_written = min(newest_written, oldest_pending)
+
+                self._conn.execute(
+                    """
+                    INSERT INTO high_water_marks VALUES (?, ?)
+                    ON CONFLICT (ticker) DO UPDATE SET pub_date = MAX(pub_date, excluded.pub_date)
+                    """,
+                    (ticker, int(newest_written)),
+                )
+            self._conn.commit()
+
+    def block_ids(self, news_url: str) -> dict[str, list[str]]:
+        """
+        The ids of the Notion blocks written for the news, for each of its tickers.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ticker, block_ids FROM written_news WHERE url = ?",
+                (canonicalize_url(news_url),),
+            ).fetchall()
+
+        return {ticker: json.loads(block_ids) for ticker, block_ids in rows}
+
+    def close(self) -> None:
+        self._conn.close()
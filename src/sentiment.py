@@ -0,0 +1,231 @@
+import json
+import re
+import time
+from typing import Optional
+
+from .config import ESCALATION_RULES, FAST_SENTIMENT_BATCH_SIZE, FAST_SENTIMENT_MODEL_ID
+from .structured import SENTIMENTS, SentimentResult
+from .summarizer import NewsSummarizer, clean_article_text
+
+
+def lead_text(text: str, max_chars: int = 400) -> str:
+    """
+    The first sentences of the article, which stand in for the summary of the news the VLM does not summarize.
+    """
+    text = clean_article_text(text).replace("\n", " ")
+    if len(text) <= max_chars:
+        return text
+
+    cut = text.rfind(". ", 0, max_chars)
+    return text[: cut + 1] if cut > 0 else text[:max_chars].rstrip() + "..."
+
+
+class SentimentClassifier:
+    """
+    Small finance sentiment encoder (FinBERT by default) labelling the news in batches, fast enough on CPU to run on every scrapped news. The title and the lead of the article are classified.
+    """
+
+    def __init__(
+        self,
+        model_id: str = FAST_SENTIMENT_MODEL_ID,
+        batch_size: int = FAST_SENTIMENT_BATCH_SIZE,
+        max_length: int = 256,
+        device: str = "cpu",
+    ):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.device = torch.device(device)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_id).to(
+            self.device
+        )
+        self.model.eval()
+
+        # e.g. "positive" -> "Positive", to match the labels of the structured mode
+        self.labels = [
+            self.model.config.id2label[i].capitalize()
+            for i in range(self.model.config.num_labels)
+        ]
+        if set(self.labels) != set(SENTIMENTS):
+            raise ValueError(f"{model_id} labels {self.labels}, expected {SENTIMENTS}.")
+
+    def classify(self, titles: list[str], news_texts: list[str]) -> list[SentimentResult]:
+        import torch
+
+        leads = [lead_text(text) for text in news_texts]
+        texts = [f"{title}. {lead}" for title, lead in zip(titles, leads)]
+
+        results = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(
+                texts[start : start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="pt",
+            ).to(self.device)
+
+            with torch.inference_mode():
+                probs = torch.softmax(self.model(**inputs).logits.float(), dim=-1)
+
+            confidences, label_ids = probs.max(dim=-1)
+            for lead, label_id, confidence in zip(
+                leads[start:], label_ids.tolist(), confidences.tolist()
+            ):
+                results.append(SentimentResult(lead, self.labels[label_id], confidence))
+
+        return results
+
+
+class EscalationRules:
+    """
+    Decide which news classified by the SentimentClassifier are sent to the VLM: the news of the tickers marked "always", the high-impact news (a keyword in the title), the news of the given sentiments and the low-confidence ones. The rules of a ticker override the default rules.
+    """
+
+    def __init__(self, default: dict = None, tickers: dict[str, dict] = None):
+        self.default = {**ESCALATION_RULES, **(default or {})}
+        self.tickers = tickers or {}
+
+        self._keyword_res = {}
+
+    @classmethod
+    def from_file(cls, path: str = "tickers.json") -> "EscalationRules":
+        """
+        Read the optional "escalation_rules" of the tickers file, {"default": {...}, "<ticker>": {...}}.
+        """
+        with open(path, "r") as f:
+            rules = json.load(f).get("escalation_rules", {})
+
+        default = rules.pop("default", None)
+        return cls(default, rules)
+
+    def rules(self, ticker: str) -> dict:
+        return {**self.default, **self.tickers.get(ticker, {})}
+
+    def reason(self, ticker: str, title: str, result: SentimentResult) -> Optional[str]:
+        """
+        Why the news should be escalated for the ticker, or None if the classifier result is enough.
+        """
+        rules = self.rules(ticker)
+
+        if rules["always"]:
+            return "always"
+        if self._keyword_re(rules["keywords"]).search(title):
+            return "keyword"
+        if result.confidence < rules["min_confidence"]:
+            return "low confidence"
+        if result.sentiment in rules["sentiments"]:
+            return "sentiment"
+
+        return None
+
+    def _keyword_re(self, keywords: list[str]):
+        key = tuple(keywords)
+        if key not in self._keyword_res:
+            self._keyword_res[key] = re.compile(
+                r"\b(" + "|".join(re.escape(keyword) for keyword in keywords) + r")\b"
+                if keywords
+                else r"(?!)",
+                re.IGNORECASE,
+            )
+
+        return self._keyword_res[key]
+
+
+class TieredSummarizer:
+    """
+    Label every news with the fast SentimentClassifier first, and only summarize with the VLM the news escalated by the rules of any of its tickers. The other news get the lead of the article and the label of the classifier. Same interface as NewsSummarizer.
+    """
+
+    def __init__(
+        self,
+        summarizer: NewsSummarizer,
+        classifier: SentimentClassifier,
+        rules: EscalationRules,
+    ):
+        self.summarizer = summarizer
+        self.classifier = classifier
+        self.rules = rules
+
+        self.tier_items = {"classifier": 0, "vlm": 0}
+        self.tier_time = {"classifier": 0.0, "vlm": 0.0}
+        self.escalation_reasons = {}
+
+    def summarize_batch(
+        self,
+        titles: list[str],
+        news_texts: list[str],
+        images: list,
+        news_urls: list[str],
+        news_tickers: list[list[str]] = None,
+        start_times: list[float] = None,
+    ) -> list[str]:
+        if news_tickers is None:
+            news_tickers = [[None]] * len(titles)
+
+        start = time.perf_counter()
+        results = self.classifier.classify(titles, news_texts)
+        self.tier_time["classifier"] += time.perf_counter() - start
+        self.tier_items["classifier"] += len(titles)
+
+        escalated = []
+        for i, (title, tickers, result) in enumerate(zip(titles, news_tickers, results)):
+            reason = next(
+                (
+                    reason
+                    for ticker in tickers
+                    if (reason := self.rules.reason(ticker, title, result)) is not None
+                ),
+                None,
+            )
+            if reason is not None:
+                escalated.append(i)
+                self.escalation_reasons[reason] = self.escalation_reasons.get(reason, 0) + 1
+
+        outputs = [result.to_text() for result in results]
+        if escalated:
+            start = time.perf_counter()
+            vlm_outputs = self.summarizer.summarize_batch(
+                [titles[i] for i in escalated],
+                [news_texts[i] for i in escalated],
+                [images[i] for i in escalated],
+                [news_urls[i] for i in escalated],
+                news_tickers=[news_tickers[i] for i in escalated],
+                start_times=(
+                    [start_times[i] for i in escalated] if start_times is not None else None
+                ),
+            )
+            self.tier_time["vlm"] += time.perf_counter() - start
+            self.tier_items["vlm"] += len(escalated)
+
+            for i, output in zip(escalated, vlm_outputs):
+                outputs[i] = output
+
+        return outputs
+
+    def escalation_rate(self) -> float:
+        classified = self.tier_items["classifier"]
+        return self.tier_items["vlm"] / classified if classified > 0 else 0.0
+
+    def report(self) -> str:
+        lines = [self.summarizer.report()]
+        for tier, items in self.tier_items.items():
+            elapsed = self.tier_time[tier]
+            throughput = items / elapsed if elapsed > 0 else 0.0
+            lines.append(
+                f"{tier}: {items} news in {elapsed:.2f}s ({throughput:.2f} news/s)"
+            )
+
+        reasons = ", ".join(
+            f"{reason}: {count}" for reason, count in sorted(self.escalation_reasons.items())
+        )
+        lines.append(
+            f"escalation rate: {self.escalation_rate():.1%}" + (f" ({reasons})" if reasons else "")
+        )
+
+        return "\n".join(lines)
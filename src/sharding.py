@@ -0,0 +1,685 @@
+import functools
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from .config import VLM_BATCH_SIZE
+from .dedup import canonicalize_url
+from .notion_writer import AsyncNotionWriter
+from .utils import get_available_gpus, notion_add_news_part
+
+
+def shard_of(ticker: str, num_shards: int) -> int:
+    """
+    Shard of the ticker. The hash is stable across processes, hosts and runs (unlike the built-in hash of str), so a ticker always lands in the same shard for a given number of shards.
+    """
+    digest = hashlib.sha1(ticker.upper().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def partition(tickers: list[str], num_shards: int) -> list[list[str]]:
+    """
+    Split the watchlist into <num_shards> lists of tickers, keeping the order of the watchlist in each shard.
+    """
+    shards = [[] for _ in range(num_shards)]
+    for ticker in tickers:
+        shards[shard_of(ticker, num_shards)].append(ticker)
+
+    return shards
+
+
+class ShardQueue:
+    """
+    Job queue of the sharded runs stored in SQLite, shared by the worker processes of this host, or of several hosts when the file is on a shared filesystem. It holds the shards of each run with their progress, and the summaries generated by the shards until they are merged into the daily Notion page.
+
+    A shard is claimed by one worker at a time. The shard of a worker which crashed, or whose heartbeat is older than <heartbeat_timeout> seconds, is claimed again, and the summaries it already stored are not generated again, so a run resumes where it stopped.
+
+    The deduplication of the scrapper only sees the tickers of one shard, so the news are also claimed by canonical url across the shards of a run. A news listed by the tickers of several shards is fetched and summarized by the shard which claimed it first, and its summary is merged under the tickers of the other shards too.
+
+    The file is in WAL mode, so the workers read it while one of them writes. WAL needs the processes to be on one host, so a queue shared by the workers of several hosts on a network filesystem is opened with wal=False.
+    """
+
+    def __init__(
+        self,
+        path: str = "shards.cache",
+        heartbeat_timeout: float = 10 * 60,
+        max_attempts: int = 3,
+        wal: bool = True,
+    ):
+        self.path = path
+        self.heartbeat_timeout = heartbeat_timeout  # in seconds
+        self.max_attempts = max_attempts
+
+        # the merged summaries are marked from the Notion writer thread
+        self._lock = threading.Lock()
+        # several processes write the file, so wait for their locks instead of failing
+        self._conn = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        if wal:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                tickers TEXT NOT NULL,
+                num_shards INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS shards (
+                run_id TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                tickers TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                heartbeat REAL,
+                articles_done INTEGER NOT NULL DEFAULT 0,
+                articles_total INTEGER,
+                error TEXT,
+                PRIMARY KEY (run_id, shard)
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                run_id TEXT NOT NULL,
+                news_url TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                block_ids TEXT,
+                pub_date INTEGER,
+                PRIMARY KEY (run_id, news_url, ticker)
+            );
+            CREATE TABLE IF NOT EXISTS news_claims (
+                run_id TEXT NOT NULL,
+                canonical_url TEXT NOT NULL,
+                news_url TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                PRIMARY KEY (run_id, canonical_url)
+            );
+            CREATE TABLE IF NOT EXISTS shared_news (
+                run_id TEXT NOT NULL,
+                news_url TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                block_ids TEXT,
+                PRIMARY KEY (run_id, news_url, ticker)
+            );
+            """
+        )
+        # the queues created before the publication dates were stored
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(results)")]
+        if "pub_date" not in columns:
+            self._conn.execute("ALTER TABLE results ADD COLUMN pub_date INTEGER")
+
+    def create_run(self, run_id: str, tickers: list[str], num_shards: int) -> None:
+        """
+        Add the shards of the run, unless the run already exists (e.g. a resumed run). A run cannot be resumed with another watchlist or number of shards, since the tickers would move between shards.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tickers, num_shards FROM runs WHERE run_id = ?", (run_id,)
+                ).fetchone()
+                if row is not None:
+                    if (json.loads(row[0]), row[1]) != (tickers, num_shards):
+                        raise ValueError(
+                            f"Run {run_id} already exists with another watchlist or number of shards, please use another run id."
+                        )
+                    self._conn.execute("COMMIT")
+                    return
+
+                self._conn.execute(
+                    "INSERT INTO runs VALUES (?, ?, ?, ?)",
+                    (run_id, json.dumps(tickers), num_shards, time.time()),
+                )
+                self._conn.executemany(
+                    "INSERT INTO shards (run_id, shard, tickers, status) VALUES (?, ?, ?, 'pending')",
+                    [
+                        (run_id, shard, json.dumps(shard_tickers))
+                        for shard, shard_tickers in enumerate(partition(tickers, num_shards))
+                    ],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def run_tickers(self, run_id: str) -> Optional[list[str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tickers FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+
+        return json.loads(row[0]) if row is not None else None
+
+    def claim(self, run_id: str, worker: str) -> Optional[tuple[int, list[str]]]:
+        """
+        Claim the next shard of the run for the worker: a pending shard, a failed one which has attempts left, or one whose worker stopped sending heartbeats. Return (shard, tickers), or None when there is nothing left to do.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT shard, tickers FROM shards
+                    WHERE run_id = ? AND attempts < ? AND (
+                        status IN ('pending', 'failed')
+                        OR (status = 'running' AND heartbeat < ?)
+                    )
+                    ORDER BY attempts, shard LIMIT 1
+                    """,
+                    (run_id, self.max_attempts, time.time() - self.heartbeat_timeout),
+                ).fetchone()
+
+                if row is not None:
+                    self._conn.execute(
+                        """
+                        UPDATE shards SET status = 'running', worker = ?, attempts = attempts + 1, heartbeat = ?, error = NULL
+                        WHERE run_id = ? AND shard = ?
+                        """,
+                        (worker, time.time(), run_id, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, run_id: str, shard: int, articles_total: int = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE shards SET heartbeat = ?, articles_total = COALESCE(?, articles_total)
+                WHERE run_id = ? AND shard = ?
+                """,
+                (time.time(), articles_total, run_id, shard),
+            )
+
+    def claim_news(
+        self, run_id: str, shard: int, news: list[tuple[str, list[str]]]
+    ) -> set[str]:
+        """
+        Claim the (news_url, tickers) of the shard for the run by canonical url, and return the urls of those the shard summarizes, i.e. the news it claimed first (in this attempt or a previous one). The tickers of the other news are added to the news of the claiming shard.
+        """
+        owned = set()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for news_url, tickers in news:
+                    canonical_url = canonicalize_url(news_url)
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO news_claims VALUES (?, ?, ?, ?)",
+                        (run_id, canonical_url, news_url, shard),
+                    )
+                    owner_url, owner_shard = self._conn.execute(
+                        "SELECT news_url, shard FROM news_claims WHERE run_id = ? AND canonical_url = ?",
+                        (run_id, canonical_url),
+                    ).fetchone()
+
+                    if owner_shard == shard:
+                        owned.add(news_url)
+                        continue
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO shared_news (run_id, news_url, ticker) VALUES (?, ?, ?)",
+                        [(run_id, owner_url, ticker) for ticker in tickers],
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return owned
+
+    def add_results(
+        self, run_id: str, shard: int, results: list[tuple[str, str, str, str, int]]
+    ) -> None:
+        """
+        Store the (news_url, ticker, title, summary, pub_date) generated by the shard, and count its news as done.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO results (run_id, news_url, ticker, shard, title, summary, created_at, pub_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (run_id, news_url, ticker, shard, title, summary, now, pub_date)
+                        for news_url, ticker, title, summary, pub_date in results
+                    ],
+                )
+                self._conn.execute(
+                    """
+                    UPDATE shards SET heartbeat = ?, articles_done = (
+                        SELECT COUNT(DISTINCT news_url) FROM results WHERE run_id = ? AND shard = ?
+                    )
+                    WHERE run_id = ? AND shard = ?
+                    """,
+                    (now, run_id, shard, run_id, shard),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def done_urls(self, run_id: str, shard: int) -> set[str]:
+        """
+        The news already summarized by the shard, in a previous attempt.
+        """
+        with self._lock:
+            return {
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT news_url FROM results WHERE run_id = ? AND shard = ?",
+                    (run_id, shard),
+                )
+            }
+
+    def finish(self, run_id: str, shard: int, error: str = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE shards SET status = ?, error = ?, heartbeat = ? WHERE run_id = ? AND shard = ?",
+                ("failed" if error is not None else "done", error, time.time(), run_id, shard),
+            )
+
+    def release(self, run_id: str, worker: str, error: str) -> int:
+        """
+        Give back the shards of a worker which died, so another worker claims them without waiting for the heartbeat timeout. Return the number of shards given back.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE shards SET status = 'failed', error = ? WHERE run_id = ? AND worker = ? AND status = 'running'",
+                (error, run_id, worker),
+            ).rowcount
+
+    def progress(self, run_id: str) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT shard, tickers, status, worker, attempts, articles_done, articles_total, error
+                FROM shards WHERE run_id = ? ORDER BY shard
+                """,
+                (run_id,),
+            ).fetchall()
+
+        return [
+            {
+                "shard": shard,
+                "tickers": len(json.loads(tickers)),
+                "status": status,
+                "worker": worker,
+                "attempts": attempts,
+                "articles_done": articles_done,
+                "articles_total": articles_total,
+                "error": error,
+            }
+            for shard, tickers, status, worker, attempts, articles_done, articles_total, error in rows
+        ]
+
+    def is_finished(self, run_id: str) -> bool:
+        """
+        Whether no shard of the run is left to be processed, i.e. every shard is done or out of attempts.
+        """
+        return all(
+            shard["status"] == "done"
+            or (shard["status"] == "failed" and shard["attempts"] >= self.max_attempts)
+            for shard in self.progress(run_id)
+        )
+
+    def unmerged_results(self, run_id: str) -> list[tuple[str, str, str, str, float, int]]:
+        """
+        The (news_url, ticker, title, summary, created_at, pub_date) of the run not written to Notion yet, with the summaries of the news claimed by another shard under the tickers of this shard.
+        """
+        with self._lock:
+            return self._conn.execute(
+                """
+                SELECT news_url, ticker, title, summary, created_at, pub_date FROM results
+                WHERE run_id = ? AND block_ids IS NULL
+                UNION ALL
+                SELECT shared_news.news_url, shared_news.ticker, title, summary, MIN(created_at), pub_date
+                FROM shared_news JOIN results
+                ON results.run_id = shared_news.run_id AND results.news_url = shared_news.news_url
+                WHERE shared_news.run_id = ? AND shared_news.block_ids IS NULL
+                GROUP BY shared_news.news_url, shared_news.ticker
+                ORDER BY 5
+                """,
+                (run_id, run_id),
+            ).fetchall()
+
+    def mark_merged(
+        self, run_id: str, news_url: str, ticker: str, block_ids: list[str]
+    ) -> None:
+        with self._lock:
+            for table in ("results", "shared_news"):
+                updated = self._conn.execute(
+                    f"UPDATE {table} SET block_ids = ? WHERE run_id = ? AND news_url = ? AND ticker = ?",
+                    (json.dumps(block_ids), run_id, news_url, ticker),
+                ).rowcount
+                if updated:
+                    return
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ShardHeartbeat:
+    """
+    Send the heartbeats of a claimed shard from a background thread every <interval> seconds until the shard is done, so a shard is not claimed again while its worker is busy with a long batch or the loading of the model.
+    """
+
+    def __init__(self, shard_queue: ShardQueue, run_id: str, shard: int, interval: float = None):
+        self.shard_queue = shard_queue
+        self.run_id = run_id
+        self.shard = shard
+        self.interval = (
+            interval if interval is not None else shard_queue.heartbeat_timeout / 10
+        )
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.shard_queue.heartbeat(self.run_id, self.shard)
+            except sqlite3.OperationalError:
+                # the queue file stayed locked, the next heartbeat will do
+                pass
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+
+def format_progress(progress: list[dict]) -> str:
+    lines = []
+    for shard in progress:
+        articles = (
+            f"{shard['articles_done']}/{shard['articles_total']}"
+            if shard["articles_total"] is not None
+            else f"{shard['articles_done']}/?"
+        )
+        line = (
+            f"shard {shard['shard']:>3}: {shard['status']:<8} {shard['tickers']:>4} tickers "
+            f"{articles:>9} news  attempts {shard['attempts']}"
+        )
+        if shard["worker"] is not None and shard["status"] == "running":
+            line += f"  ({shard['worker']})"
+        if shard["error"] is not None:
+            line += f"  error: {shard['error']}"
+        lines.append(line)
+
+    done = sum(shard["status"] == "done" for shard in progress)
+    lines.append(f"{done}/{len(progress)} shards done")
+
+    return "\n".join(lines)
+
+
+def run_shard(
+    shard_queue: ShardQueue,
+    run_id: str,
+    shard: int,
+    tickers: list[str],
+    scrapper,
+    summarizer,
+    batch_size: int = VLM_BATCH_SIZE,
+) -> None:
+    """
+    Scrap and summarize the news of the tickers of one shard, and store the summaries in the queue batch by batch. The news already summarized by a previous attempt of the shard, and those claimed by another shard, are skipped before their contents are fetched.
+    """
+    done_urls = shard_queue.done_urls(run_id, shard)
+    articles_total = 0
+    batch = []
+    scrapped_at = {}
+
+    def claim(unique_news):
+        nonlocal articles_total
+        owned = shard_queue.claim_news(
+            run_id, shard, [(news["news_url"], news["tickers"]) for news in unique_news]
+        )
+        claimed = [news for news in unique_news if news["news_url"] in owned]
+        articles_total = len(claimed)
+        shard_queue.heartbeat(run_id, shard, articles_total)
+
+        return [news for news in claimed if news["news_url"] not in done_urls]
+
+    def flush():
+        vlm_responses = summarizer.summarize_batch(
+            [news_title for _, news_title, _, _, _ in batch],
+            [news_text for _, _, news_text, _, _ in batch],
+            [news_image for _, _, _, news_image, _ in batch],
+            [news_url for _, _, _, _, news_url in batch],
+            news_tickers=[news_tickers for news_tickers, _, _, _, _ in batch],
+            start_times=[scrapped_at[news_url] for _, _, _, _, news_url in batch],
+        )
+        shard_queue.add_results(
+            run_id,
+            shard,
+            [
+                (news_url, ticker, news_title, vlm_response, scrapper.pub_dates.get(news_url))
+                for (news_tickers, news_title, _, _, news_url), vlm_response in zip(
+                    batch, vlm_responses
+                )
+                for ticker in news_tickers
+            ],
+        )
+        batch.clear()
+
+    for news_tickers, news_title, news_contents in scrapper.iter_news(
+        tickers, verbose=False, claim=claim
+    ):
+        batch.append((news_tickers, news_title, *news_contents))
+        # the latency of the news starts when it is scrapped
+        scrapped_at[news_contents[-1]] = time.perf_counter()
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    shard_queue.heartbeat(run_id, shard, articles_total)
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _worker_main(queue_path: str, run_id: str, options: dict) -> None:
+    """
+    Entry point of a shard worker: build the scrapper and the summarizer as the unsharded run does, then process the shards of the run until none is left.
+    """
+    from .models.registry import get_vlm
+    from .news_scrapper import FinanceNewsScrapper
+    from .seen_index import SeenIndex
+    from .sentiment import EscalationRules, SentimentClassifier, TieredSummarizer
+    from .summarizer import NewsSummarizer, PromptBuilder
+    from .summary_cache import CachedVLM, SummaryCache
+
+    shard_queue = ShardQueue(queue_path, wal=options.get("queue_wal", True))
+    worker = worker_name()
+
+    # the summary cache and the seen index are SQLite files, shared by the workers of the host
+    scrapper = FinanceNewsScrapper(
+        seen_index=SeenIndex() if options.get("incremental") else None
+    )
+    vlm = get_vlm(
+        options.get("model_name", "qwen"),
+        options.get("vlm_socket_path"),
+        options.get("load_config"),
+        options.get("device"),
+    )
+    summarizer = NewsSummarizer(
+        CachedVLM(vlm, SummaryCache() if options.get("use_cache", True) else None),
+        PromptBuilder.from_model_id(vlm.model_id),
+        structured=options.get("structured", False),
+    )
+    if options.get("tiered"):
+        summarizer = TieredSummarizer(
+            summarizer, SentimentClassifier(), EscalationRules.from_file("tickers.json")
+        )
+
+    while (claimed := shard_queue.claim(run_id, worker)) is not None:
+        shard, tickers = claimed
+        try:
+            with ShardHeartbeat(shard_queue, run_id, shard):
+                run_shard(
+                    shard_queue,
+                    run_id,
+                    shard,
+                    tickers,
+                    scrapper,
+                    summarizer,
+                    options.get("batch_size", VLM_BATCH_SIZE),
+                )
+        except Exception as e:
+            shard_queue.finish(run_id, shard, repr(e))
+            continue
+        shard_queue.finish(run_id, shard)
+
+    shard_queue.close()
+
+
+def default_processes(num_shards: int, options: dict) -> int:
+    """
+    The number of shard workers of a host. The workers share the model of the VLM server when there is one, so there is one per shard. Otherwise each worker loads its own model, so there is one per GPU, or a single one on a host without GPU.
+    """
+    socket_path = options.get("vlm_socket_path")
+    if socket_path is not None and os.path.exists(socket_path):
+        return max(num_shards, 1)
+
+    return max(min(num_shards, len(get_available_gpus())), 1)
+
+
+def run_workers(
+    queue_path: str,
+    run_id: str,
+    processes: int,
+    options: dict,
+    progress_interval: float = 10.0,
+    verbose: bool = True,
+    max_restarts: int = 3,
+) -> None:
+    """
+    Run <processes> shard workers on this host (default_processes if None) until the run has no shard left, and print the progress of the shards every <progress_interval> seconds. The workers are spread over the GPUs of the host, each loading its model on its own GPU. A worker which dies gives its shard back and is replaced on the same device while the run has shards left.
+
+    A worker which dies without holding a shard failed before its first claim (e.g. its model or tokenizer could not be loaded), and its replacement would fail the same way, so the run is stopped with a RuntimeError, as it is after <max_restarts> restarts on one device.
+    """
+    shard_queue = ShardQueue(queue_path, wal=options.get("queue_wal", True))
+    if processes is None:
+        processes = default_processes(len(shard_queue.progress(run_id)), options)
+    devices = get_available_gpus()
+    # CUDA cannot be used in forked processes
+    context = mp.get_context("spawn")
+
+    def start(device):
+        process = context.Process(
+            target=_worker_main, args=(queue_path, run_id, dict(options, device=device))
+        )
+        process.start()
+        return process, device
+
+    restarts = Counter()
+    workers = [
+        start(devices[i % len(devices)] if devices else None) for i in range(processes)
+    ]
+    try:
+        while workers:
+            time.sleep(progress_interval)
+
+            alive = []
+            for process, device in workers:
+                if process.is_alive():
+                    alive.append((process, device))
+                    continue
+                if process.exitcode == 0:
+                    continue
+
+                released = shard_queue.release(
+                    run_id,
+                    f"{socket.gethostname()}:{process.pid}",
+                    f"worker exited with code {process.exitcode}",
+                )
+                if not released:
+                    raise RuntimeError(
+                        f"The shard worker on {device or 'cpu'} exited with code {process.exitcode} before claiming a shard"
+                    )
+                restarts[device] += 1
+                if restarts[device] > max_restarts:
+                    raise RuntimeError(
+                        f"The shard worker on {device or 'cpu'} exited with code {process.exitcode}, after {max_restarts} restarts"
+                    )
+                if not shard_queue.is_finished(run_id):
+                    alive.append(start(device))
+            workers = alive
+
+            if verbose:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] run {run_id}")
+                print(format_progress(shard_queue.progress(run_id)))
+    finally:
+        # the other workers of a stopped run
+        for process, _ in workers:
+            process.terminate()
+            process.join()
+        shard_queue.close()
+
+
+def merge_run(
+    shard_queue: ShardQueue,
+    run_id: str,
+    page_id: str,
+    seen_index=None,
+) -> int:
+    """
+    Write the summaries of all the shards to one Notion page, grouped by ticker in the order of the watchlist. Each written news part is marked in the queue, so a merge interrupted by a crash only writes the remaining ones when run again. Return the number of news parts written.
+    """
+    watchlist = shard_queue.run_tickers(run_id) or []
+    positions = {ticker: i for i, ticker in enumerate(watchlist)}
+    results = sorted(
+        shard_queue.unmerged_results(run_id),
+        key=lambda result: (positions.get(result[1], len(positions)), result[4]),
+    )
+
+    notion_writer = AsyncNotionWriter()
+
+    def on_written(news_url, ticker, title, pub_date, block_ids):
+        shard_queue.mark_merged(run_id, news_url, ticker, block_ids)
+        if seen_index is not None:
+            # the seen index of this process did not see the news of the shards
+            seen_index.mark_written(news_url, ticker, title, page_id, block_ids, pub_date)
+
+    for news_url, ticker, title, summary, created_at, pub_date in results:
+        notion_add_news_part(
+            notion_writer,
+            page_id,
+            title,
+            summary,
+            news_url,
+            ticker,
+            # the time the summary was generated by its shard
+            datetime.fromtimestamp(created_at).strftime("%Y-%m-%d %H:%M:%S"),
+            on_written=functools.partial(on_written, news_url, ticker, title, pub_date),
+        )
+
+    notion_writer.close()
+
+    return len(results)
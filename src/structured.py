@@ -0,0 +1,199 @@
+import json
+import math
+import re
+
+SENTIMENTS = ("Positive", "Negative", "Neutral")
+
+# the answer is prefilled up to the sentiment label, so the model only picks the label then writes the summary
+ANSWER_PREFIX = '{"sentiment": "'
+SUMMARY_FIELD = '", "summary": "'
+
+# the end of the JSON object, i.e. an unescaped quote closing the summary followed by the closing brace
+_CLOSED_RE = re.compile(r'(?<!\\)"\s*}\s*$')
+
+
+class GeneratedText(str):
+    """
+    Text answer of the model, with the number of tokens generated for it (None when unknown). It is a plain string everywhere else.
+    """
+
+    def __new__(cls, text: str, generated_tokens: int = None):
+        self = super().__new__(cls, text)
+        self.generated_tokens = generated_tokens
+        return self
+
+
+class SentimentResult:
+    """
+    Typed answer of the structured mode. The confidence is the probability the model gives to the sentiment label among the allowed ones. The number of generated tokens is not part of the answer, so it is left out of to_dict.
+    """
+
+    def __init__(
+        self,
+        summary: str,
+        sentiment: str,
+        confidence: float,
+        generated_tokens: int = None,
+    ):
+        self.summary = summary
+        self.sentiment = sentiment
+        self.confidence = confidence
+        self.generated_tokens = generated_tokens
+
+    def to_text(self) -> str:
+        return f"{self.summary}\n\nSentiment: {self.sentiment} ({self.confidence:.0%})"
+
+    def to_dict(self) -> dict:
+        return {
+            "summary": self.summary,
+            "sentiment": self.sentiment,
+            "confidence": self.confidence,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, generated_tokens: int = None) -> "SentimentResult":
+        return cls(data["summary"], data["sentiment"], data["confidence"], generated_tokens)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SentimentResult) and other.to_dict() == self.to_dict()
+
+    def __repr__(self) -> str:
+        return f"SentimentResult({self.sentiment}, {self.confidence:.2f}, {self.summary[:40]!r})"
+
+
+class SentimentConstraint:
+    """
+    Logits processor of model.generate constraining the answer after ANSWER_PREFIX: the next tokens must spell one of the SENTIMENTS followed by SUMMARY_FIELD, then the summary is free, and the end of sequence token is forced as soon as the JSON object is closed.
+
+    The state of each row is updated with its last token only, so a step does not depend on the length of the answer. The probabilities of the label tokens among the allowed ones are recorded to compute the confidence of each answer.
+    """
+
+    def __init__(self, tokenizer, eos_token_id: int):
+        self.tokenizer = tokenizer
+        self.eos_token_id = eos_token_id
+
+        # the labels follow the prefix in the answer, so they are tokenized after it
+        prefix_ids = tokenizer(ANSWER_PREFIX, add_special_tokens=False)["input_ids"]
+        self.label_ids = {}
+        for label in SENTIMENTS:
+            ids = tokenizer(
+                ANSWER_PREFIX + label + SUMMARY_FIELD, add_special_tokens=False
+            )["input_ids"]
+            if ids[: len(prefix_ids)] != prefix_ids:
+                # the label merges with the end of the prefix, which is already in the prompt
+                ids = prefix_ids + tokenizer(
+                    label + SUMMARY_FIELD, add_special_tokens=False
+                )["input_ids"]
+            self.label_ids[label] = ids[len(prefix_ids) :]
+
+        self._step = None
+        # per row: the label tokens generated so far, the label once matched, the end of the summary and whether the answer is closed
+        self._label_tokens = []
+        self._labels = []
+        self._tails = []
+        self._closed = []
+        # (row, step) -> {token id: probability among the allowed tokens}
+        self._label_probs = {}
+
+    def __call__(self, input_ids, scores):
+        import torch
+
+        # the first call is right after the prompt, the next ones after a new token of each row
+        if self._step is None:
+            self._step = 0
+            batch_size = input_ids.shape[0]
+            self._label_tokens = [[] for _ in range(batch_size)]
+            self._labels = [None] * batch_size
+            self._tails = [""] * batch_size
+            self._closed = [False] * batch_size
+        else:
+            self._step += 1
+            for row, token_id in enumerate(input_ids[:, -1].tolist()):
+                self._advance(row, token_id)
+
+        for row in range(input_ids.shape[0]):
+            if self._closed[row]:
+                allowed = [self.eos_token_id]
+            elif self._labels[row] is None:
+                allowed = self._next_label_tokens(self._label_tokens[row])
+            else:
+                continue
+
+            if len(allowed) > 1:
+                probs = torch.softmax(scores[row, allowed].float(), dim=-1)
+                self._label_probs[(row, self._step)] = dict(zip(allowed, probs.tolist()))
+
+            mask = torch.full_like(scores[row], float("-inf"))
+            mask[allowed] = 0
+            scores[row] = scores[row] + mask
+
+        return scores
+
+    def confidence(self, row: int, output_ids: list[int]) -> float:
+        """
+        Probability of the label chosen in the row, the product of the probabilities of its tokens.
+        """
+        log_prob = 0.0
+        for step, token_id in enumerate(output_ids):
+            probs = self._label_probs.get((row, step))
+            if probs is not None:
+                log_prob += math.log(max(probs.get(token_id, 0.0), 1e-12))
+
+        return math.exp(log_prob)
+
+    def _advance(self, row: int, token_id: int) -> None:
+        if self._closed[row]:
+            return
+
+        if self._labels[row] is None:
+            ids = self._label_tokens[row]
+            ids.append(token_id)
+            for label, label_ids in self.label_ids.items():
+                if ids == label_ids:
+                    self._labels[row] = label
+            if self._labels[row] is None and not self._next_label_tokens(ids):
+                # the row already ended, it is only padded from now on
+                self._closed[row] = True
+            return
+
+        # the closing quote and brace are a few characters, so only the end of the summary is kept
+        self._tails[row] = (self._tails[row] + self.tokenizer.decode([token_id]))[-16:]
+        if _CLOSED_RE.search(self._tails[row]):
+            self._closed[row] = True
+
+    def _next_label_tokens(self, ids: list[int]) -> list[int]:
+        step = len(ids)
+        return sorted(
+            {
+                label_ids[step]
+                for label_ids in self.label_ids.values()
+                if len(label_ids) > step and label_ids[:step] == ids
+            }
+        )
+
+
+def parse_structured_output(
+    text: str, confidence: float, generated_tokens: int = None
+) -> SentimentResult:
+    """
+    Parse the answer generated after ANSWER_PREFIX. An answer cut by the token cap is not valid JSON, so its fields are then read directly.
+    """
+    answer = (ANSWER_PREFIX + text).strip()
+    try:
+        data = json.loads(answer, strict=False)
+        return SentimentResult(
+            str(data.get("summary", "")).strip(),
+            data["sentiment"],
+            confidence,
+            generated_tokens,
+        )
+    except (json.JSONDecodeError, KeyError, AttributeError):
+        pass
+
+    sentiment = next(
+        (label for label in SENTIMENTS if text.startswith(label)), "Neutral"
+    )
+    summary = text.split(SUMMARY_FIELD, 1)[-1] if SUMMARY_FIELD in text else ""
+    summary = _CLOSED_RE.sub("", summary).rstrip('"').strip()
+
+    return SentimentResult(summary, sentiment, confidence, generated_tokens)
@@ -0,0 +1,280 @@
+import re
+import time
+
+from .config import (
+    CHUNK_PROMPT_TEMPLATE,
+    CHUNK_SUMMARY_MAX_NEW_TOKENS,
+    CHUNK_TOKENS,
+    MAX_ARTICLE_TOKENS,
+    PROMPT_TEMPLATE,
+    REDUCE_PROMPT_TEMPLATE,
+    STRUCTURED_PROMPT_TEMPLATE,
+    VLM_ROLE,
+)
+
+# lines of the yahoo pages which are not part of the article
+BOILERPLATE_PATTERNS = [
+    r"^story continues$",
+    r"^view comments$",
+    r"^(read|see) (more|also|next)\b.*$",
+    r"^(related|recommended|most read)( stories| from [\w ]+)?:?.*$",
+    r"^(click|tap) here\b.*$",
+    r"^(sign up|subscribe)\b.*$",
+    r"^this article was originally published\b.*$",
+    r"^for the latest (news|updates)\b.*$",
+    r"^\(updates? (with|to)\b.*\)$",
+]
+_BOILERPLATE_RE = re.compile("|".join(BOILERPLATE_PATTERNS), re.IGNORECASE)
+
+
+def clean_article_text(text: str) -> str:
+    """
+    Remove the boilerplate lines and the redundant whitespaces of the scrapped article.
+    """
+    paragraphs = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if line and not _BOILERPLATE_RE.match(line):
+            paragraphs.append(line)
+
+    return "\n".join(paragraphs)
+
+
+def _add_tokens(total: int, output) -> int:
+    """
+    Add the tokens generated for an output (GeneratedText or SentimentResult) to the total of its news, which stays None once a count is unknown.
+    """
+    tokens = getattr(output, "generated_tokens", None)
+    if total is None or tokens is None:
+        return None
+
+    return total + tokens
+
+
+class PromptBuilder:
+    """
+    Count the tokens of the articles with the tokenizer of the model, and split the articles above the token budget into chunks of whole paragraphs.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        max_article_tokens: int = MAX_ARTICLE_TOKENS,
+        chunk_tokens: int = CHUNK_TOKENS,
+    ):
+        self.tokenizer = tokenizer
+        self.max_article_tokens = max_article_tokens
+        self.chunk_tokens = chunk_tokens
+
+    @classmethod
+    def from_model_id(cls, model_id: str, **kwargs) -> "PromptBuilder":
+        """
+        Only the tokenizer is loaded, not the model.
+        """
+        from transformers import AutoTokenizer
+
+        return cls(AutoTokenizer.from_pretrained(model_id), **kwargs)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def count_prompt_tokens(self, role: str, prompt: str) -> int:
+        """
+        Count the tokens of the prompt as the model receives it, i.e. with the role rendered by the chat template, as the models build their messages. A tokenizer without a chat template counts the role and the prompt. The tokens of the images are not counted.
+        """
+        if getattr(self.tokenizer, "chat_template", None) is None:
+            return self.count_tokens(role) + self.count_tokens(prompt)
+
+        text = self.tokenizer.apply_chat_template(
+            [
+                {"role": "assistant", "content": role},
+                {"role": "user", "content": prompt},
+            ],
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+        return self.count_tokens(text)
+
+    def split(self, text: str) -> list[str]:
+        """
+        Clean the article and return it as one chunk if it fits in the token budget, otherwise as chunks of at most <chunk_tokens> tokens.
+        """
+        text = clean_article_text(text)
+        if self.count_tokens(text) <= self.max_article_tokens:
+            return [text]
+
+        chunks, current, current_tokens = [], [], 0
+        for paragraph in text.split("\n"):
+            for piece in self._split_paragraph(paragraph):
+                piece_tokens = self.count_tokens(piece)
+                if current and current_tokens + piece_tokens > self.chunk_tokens:
+                    chunks.append("\n".join(current))
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += piece_tokens
+
+        if current:
+            chunks.append("\n".join(current))
+
+        return chunks
+
+    def _split_paragraph(self, paragraph: str) -> list[str]:
+        """
+        Cut a paragraph longer than a chunk at token boundaries.
+        """
+        input_ids = self.tokenizer(paragraph, add_special_tokens=False)["input_ids"]
+        if len(input_ids) <= self.chunk_tokens:
+            return [paragraph]
+
+        return [
+            self.tokenizer.decode(input_ids[i : i + self.chunk_tokens])
+            for i in range(0, len(input_ids), self.chunk_tokens)
+        ]
+
+
+class NewsSummarizer:
+    """
+    Summarize a batch of news with the VLM. The articles within the token budget are summarized with PROMPT_TEMPLATE directly. The longer ones are split into chunks which are summarized together in one batch (map), then the summaries of the chunks of each article are combined into its final summary (reduce).
+
+    In structured mode, the final step asks for a SentimentResult instead of free text (the summaries of the chunks of the long articles are its article text), so the sentiment and its confidence are machine readable.
+
+    The prompt tokens, generated tokens, latency and sentiment of every news are kept in <records>. The prompt tokens are counted on the prompts rendered by the chat template. The generated tokens are counted from the output ids by the model (or stored with a cached summary), and are None when the VLM does not report them. The latency of a news runs from its start time (e.g. when it was scrapped, so the wait for its batch is included) to its summary, and the batch latency is the time of summarize_batch alone.
+    """
+
+    def __init__(self, vlm, prompt_builder: PromptBuilder, structured: bool = False):
+        self.vlm = vlm
+        self.prompt_builder = prompt_builder
+        self.structured = structured
+        self.records = []
+
+    def summarize_batch(
+        self,
+        titles: list[str],
+        news_texts: list[str],
+        images: list,
+        news_urls: list[str],
+        news_tickers: list[list[str]] = None,
+        start_times: list[float] = None,
+    ) -> list[str]:
+        """
+        Summarize the news of the batch. start_times are the time.perf_counter() times the news started, the start of the batch by default.
+        """
+        start = time.perf_counter()
+        if start_times is None:
+            start_times = [start] * len(titles)
+        article_chunks = [self.prompt_builder.split(text) for text in news_texts]
+        prompt_tokens = [0] * len(titles)
+        generated_tokens = [0] * len(titles)
+
+        # map: summarize every chunk of the long articles in one batch
+        chunk_prompts, chunk_owners = [], []
+        for i, (title, chunks) in enumerate(zip(titles, article_chunks)):
+            if len(chunks) == 1:
+                continue
+            for index, chunk in enumerate(chunks):
+                chunk_prompts.append(
+                    CHUNK_PROMPT_TEMPLATE.format(
+                        title=title, index=index + 1, total=len(chunks), news_text=chunk
+                    )
+                )
+                chunk_owners.append(i)
+
+        chunk_summaries = {}
+        if chunk_prompts:
+            outputs = self.vlm.generate_batch(
+                VLM_ROLE,
+                chunk_prompts,
+                [None] * len(chunk_prompts),
+                news_urls=[news_urls[i] for i in chunk_owners],
+                max_new_token=CHUNK_SUMMARY_MAX_NEW_TOKENS,
+            )
+            for i, prompt, output in zip(chunk_owners, chunk_prompts, outputs):
+                chunk_summaries.setdefault(i, []).append(output)
+                prompt_tokens[i] += self.prompt_builder.count_prompt_tokens(VLM_ROLE, prompt)
+                generated_tokens[i] = _add_tokens(generated_tokens[i], output)
+
+        # reduce (or summarize directly the short articles) in one batch
+        prompts = []
+        for i, (title, chunks) in enumerate(zip(titles, article_chunks)):
+            if self.structured:
+                news_text = (
+                    chunks[0] if len(chunks) == 1 else "\n\n".join(chunk_summaries[i])
+                )
+                prompts.append(
+                    STRUCTURED_PROMPT_TEMPLATE.format(title=title, news_text=news_text)
+                )
+            elif len(chunks) == 1:
+                prompts.append(PROMPT_TEMPLATE.format(title=title, news_text=chunks[0]))
+            else:
+                prompts.append(
+                    REDUCE_PROMPT_TEMPLATE.format(
+                        title=title, chunk_summaries="\n\n".join(chunk_summaries[i])
+                    )
+                )
+
+        if self.structured:
+            results = self.vlm.generate_structured(
+                VLM_ROLE, prompts, images, news_urls=news_urls
+            )
+            outputs = [result.to_text() for result in results]
+        else:
+            results = [None] * len(prompts)
+            outputs = self.vlm.generate_batch(
+                VLM_ROLE, prompts, images, news_urls=news_urls
+            )
+
+        end = time.perf_counter()
+        for i, (prompt, output, result) in enumerate(zip(prompts, outputs, results)):
+            prompt_tokens[i] += self.prompt_builder.count_prompt_tokens(VLM_ROLE, prompt)
+            # the text of a structured result is formatted, so its tokens are those of the result
+            generated_tokens[i] = _add_tokens(
+                generated_tokens[i], result if result is not None else output
+            )
+            self.records.append(
+                {
+                    "title": titles[i],
+                    "tickers": news_tickers[i] if news_tickers is not None else None,
+                    "chunks": len(article_chunks[i]),
+                    "prompt_tokens": prompt_tokens[i],
+                    "generated_tokens": generated_tokens[i],
+                    # the summaries of a batch are all returned at its end
+                    "latency": end - start_times[i],
+                    "batch_latency": end - start,
+                    "sentiment": result.sentiment if result is not None else None,
+                    "confidence": result.confidence if result is not None else None,
+                }
+            )
+
+        return outputs
+
+    def report(self) -> str:
+        lines = [
+            f"{'chunks':>6} {'prompt':>7} {'generated':>9} {'latency':>8} {'batch latency':>13} "
+            f"{'sentiment':>14}  title"
+        ]
+        sentiment_counts = {}
+        for record in self.records:
+            sentiment = ""
+            if record["sentiment"] is not None:
+                sentiment = f"{record['sentiment']} {record['confidence']:.2f}"
+                sentiment_counts[record["sentiment"]] = (
+                    sentiment_counts.get(record["sentiment"], 0) + 1
+                )
+
+            generated = record["generated_tokens"]
+            lines.append(
+                f"{record['chunks']:>6} {record['prompt_tokens']:>7} "
+                f"{generated if generated is not None else '-':>9} "
+                f"{record['latency']:>7.2f}s {record['batch_latency']:>12.2f}s "
+                f"{sentiment:>14}  {record['title'][:60]}"
+            )
+
+        if sentiment_counts:
+            lines.append(
+                ", ".join(
+                    f"{sentiment}: {count}"
+                    for sentiment, count in sorted(sentiment_counts.items())
+                )
+            )
+
+        return "\n".join(lines)
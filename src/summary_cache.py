@@ -0,0 +1,257 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from .config import FAILED_CONTENT_PREFIX, STRUCTURED_MAX_NEW_TOKENS
+from .image_store import StoredImage
+from .structured import GeneratedText, SentimentResult
+
+
+class SummaryCache:
+    """
+    On-disk cache of the VLM summaries stored in SQLite. The key is a hash of everything that affects the summary, so a summary is only reused when the article, the prompt, the model and the generation parameters are all the same. The number of tokens generated for a summary is stored with it.
+    """
+
+    def __init__(
+        self,
+        path: str = "summary.cache",
+        max_entries: int = 10000,
+        max_age: int = 7 * 24 * 60 * 60,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age  # in seconds
+
+        self.hits = 0
+        self.misses = 0
+
+        # the cache can be used from the generation thread of the pipeline
+        self._lock = threading.Lock()
+        # the cache is shared by the shard workers of the host, so wait for their locks, and let them read while one writes
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                generated_tokens INTEGER
+            )
+            """
+        )
+        # the caches created before the generated tokens were stored
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(summaries)")]
+        if "generated_tokens" not in columns:
+            self._conn.execute("ALTER TABLE summaries ADD COLUMN generated_tokens INTEGER")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        news_url: Optional[str],
+        prompt: str,
+        image,
+        role: str,
+        model_id: str,
+        generation_params: dict,
+    ) -> str:
+        """
+        Hash the inputs of a generation. The prompt is the formatted PROMPT_TEMPLATE, so it covers the template, the title and the article text.
+        """
+        hasher = hashlib.sha256()
+        for part in (
+            news_url or "",
+            prompt,
+            role,
+            model_id,
+            json.dumps(generation_params, sort_keys=True),
+        ):
+            hasher.update(part.encode("utf-8"))
+            hasher.update(b"\0")
+
+        if isinstance(image, StoredImage):
+            # the key of a stored image is already the hash of its bytes
+            hasher.update(image.key.encode("utf-8"))
+        elif image is not None:
+            hasher.update(f"{image.mode}{image.size}".encode("utf-8"))
+            hasher.update(image.tobytes())
+
+        return hasher.hexdigest()
+
+    def get(self, key: str) -> Optional[GeneratedText]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, created_at, generated_tokens FROM summaries WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        return GeneratedText(row[0], row[2])
+
+    def put(self, key: str, summary: str, generated_tokens: int = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO summaries (key, summary, created_at, accessed_at, generated_tokens)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, summary, now, now, generated_tokens),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """
+        Remove the expired summaries, then the least recently used ones above <max_entries>.
+        """
+        self._conn.execute(
+            "DELETE FROM summaries WHERE created_at < ?", (now - self.max_age,)
+        )
+        self._conn.execute(
+            """
+            DELETE FROM summaries WHERE key IN (
+                SELECT key FROM summaries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class CachedVLM:
+    """
+    Wrap a VLM (Qwen25Vision / LlamaVision) so that the summaries found in the cache skip the model entirely. Only the cache misses of a batch are sent to the model. A summary found in the cache keeps the number of tokens generated for it. The summaries of the news whose page could not be fetched are not cached, so they are generated again once the page is available.
+    """
+
+    def __init__(self, vlm, cache: Optional[SummaryCache]):
+        self.vlm = vlm
+        self.cache = cache
+
+    def generate_batch(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        news_urls: list = None,
+        max_new_token=1500,
+        temperature=0.6,
+    ) -> list[str]:
+        return self._generate(
+            "generate_batch",
+            role,
+            prompts,
+            images,
+            news_urls,
+            {"max_new_token": max_new_token, "temperature": temperature},
+        )
+
+    def generate_structured(
+        self,
+        role: str,
+        prompts: list[str],
+        images: list = None,
+        news_urls: list = None,
+        max_new_token=STRUCTURED_MAX_NEW_TOKENS,
+        temperature=None,
+    ) -> list[SentimentResult]:
+        """
+        The SentimentResults are cached as JSON.
+        """
+        return self._generate(
+            "generate_structured",
+            role,
+            prompts,
+            images,
+            news_urls,
+            {"max_new_token": max_new_token, "temperature": temperature},
+            to_text=lambda result: json.dumps(result.to_dict()),
+            from_text=lambda text: SentimentResult.from_dict(
+                json.loads(text), text.generated_tokens
+            ),
+        )
+
+    def _generate(
+        self,
+        method: str,
+        role: str,
+        prompts: list[str],
+        images: list,
+        news_urls: list,
+        generation_params: dict,
+        to_text=lambda response: response,
+        from_text=lambda text: text,
+    ) -> list:
+        if images is None:
+            images = [None] * len(prompts)
+        if news_urls is None:
+            news_urls = [None] * len(prompts)
+
+        generate = getattr(self.vlm, method)
+        if self.cache is None:
+            return generate(role, prompts, images, **generation_params)
+
+        # the structured answers of a prompt are not interchangeable with its free text summaries
+        key_params = dict(generation_params)
+        if method != "generate_batch":
+            key_params["method"] = method
+
+        keys = [
+            SummaryCache.make_key(
+                news_url, prompt, image, role, self.vlm.model_id, key_params
+            )
+            for news_url, prompt, image in zip(news_urls, prompts, images)
+        ]
+        results = []
+        for key in keys:
+            text = self.cache.get(key)
+            results.append(from_text(text) if text is not None else None)
+
+        missed = [i for i, result in enumerate(results) if result is None]
+        if missed:
+            responses = generate(
+                role,
+                [prompts[i] for i in missed],
+                [images[i] for i in missed],
+                **generation_params,
+            )
+            for i, response in zip(missed, responses):
+                results[i] = response
+                if FAILED_CONTENT_PREFIX in prompts[i]:
+                    continue
+                self.cache.put(
+                    keys[i], to_text(response), getattr(response, "generated_tokens", None)
+                )
+
+        return results
+
+    def __getattr__(self, name):
+        return getattr(self.vlm, name)
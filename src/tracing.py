@@ -0,0 +1,214 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class _NullSpan:
+    """
+    The span of a disabled tracer, shared by all the calls so that nothing is allocated.
+    """
+
+    def set(self, **args) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer: "Tracer", name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def set(self, **args) -> None:
+        """
+        Add arguments known only inside the span, e.g. the number of bytes received.
+        """
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add_span(self.name, self.start, time.perf_counter(), **self.args)
+        return False
+
+
+class Tracer:
+    """
+    Records the spans of a run, exported as a Chrome trace (chrome://tracing or https://ui.perfetto.dev) and summarized per span name. A disabled tracer (the default) returns a shared no-op span, so the instrumented code only pays an attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []  # (name, start, end, thread id, args)
+        self._origin = time.perf_counter()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        self.events = []
+        self._origin = time.perf_counter()
+
+    def span(self, name: str, **args):
+        """
+        Context manager recording the time spent in its block, with optional arguments shown in the trace.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+
+        return _Span(self, name, args)
+
+    def add_span(self, name: str, start: float, end: float, **args) -> None:
+        """
+        Record a span measured by the caller with time.perf_counter, e.g. the prefill and decode phases of a generation.
+        """
+        if self.enabled:
+            # list.append is atomic, the spans come from several threads
+            self.events.append((name, start, end, threading.get_ident(), args))
+
+    def export_chrome_trace(self, path: str) -> None:
+        pid = os.getpid()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        trace_events = [
+            {
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            }
+            for name, start, end, tid, args in self.events
+        ]
+        trace_events.extend(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": thread_names.get(tid, str(tid))},
+            }
+            for tid in {tid for _, _, _, tid, _ in self.events}
+        )
+
+        with open(path, "w") as f:
+            json.dump(
+                {"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, default=str
+            )
+
+    def summary(self) -> str:
+        """
+        Count, total, mean, p50, p95 and max duration of each span name, from the longest total.
+        """
+        durations = {}
+        for name, start, end, _, _ in self.events:
+            durations.setdefault(name, []).append(end - start)
+
+        lines = [
+            f"{'span':<32} {'count':>7} {'total':>9} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}"
+        ]
+        for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+            values.sort()
+            lines.append(
+                f"{name:<32} {len(values):>7} {sum(values):>8.2f}s "
+                f"{sum(values) / len(values) * 1e3:>7.1f}ms "
+                f"{_percentile(values, 0.5) * 1e3:>7.1f}ms "
+                f"{_percentile(values, 0.95) * 1e3:>7.1f}ms "
+                f"{values[-1] * 1e3:>7.1f}ms"
+            )
+
+        return "\n".join(lines)
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+# the tracer of the process, enabled by quant_news.py --trace
+tracer = Tracer()
+
+
+def traced(name: str):
+    """
+    Decorator recording every call of the function as a span of the process tracer.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+
+            with tracer.span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the Python stacks of all the threads every <interval> seconds from a background thread, without any dependency. The samples are written as collapsed stacks ("frame;frame;frame count" lines), which speedscope (https://www.speedscope.app) and flamegraph.pl turn into a flame graph.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._sample_loop, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample_loop(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def export_collapsed(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
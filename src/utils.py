@@ -1,116 +1,159 @@
-import re
+import functools
 import json
-from datetime import datetime
-import calendar
+import os
+from typing import Optional
 
-import nvidia_smi
-import torch
 import pandas as pd
 
-from notion import NotionClient
+_UNIX_EPOCH = pd.Timestamp(0, tz="UTC")
 
 
 def get_available_gpu(use_cpu=True) -> str:
     """
     Get the GPU index which have more than 90% free memory
+
+    The device is probed once per process, the models constructed afterwards get the same device without touching NVML or CUDA again.
     """
-    # Initialize NVIDIA-SMI
-    nvidia_smi.nvmlInit()
+    device = _first_usable_gpu()
+
+    # If no available GPU is found
+    if device is None:
+        if not use_cpu:
+            raise RuntimeError("No available GPU found")
+        return "cpu"
+
+    return device
+
+
+def get_available_gpus() -> list[str]:
+    """
+    Get all the GPUs which have more than 90% free memory
+    """
+    return list(_probe_gpus())
+
+
+@functools.lru_cache(maxsize=None)
+def _probe_gpus() -> tuple[str, ...]:
+    """
+    The GPUs with more than 90% free memory, read from NVML once per process. Without the nvidia_smi package or an NVIDIA driver, there is no GPU and torch is not imported.
+    """
+    try:
+        import nvidia_smi
+    except ImportError:
+        return ()
 
-    # Get the number of available GPUs
-    deviceCount = nvidia_smi.nvmlDeviceGetCount()
+    # Initialize NVIDIA-SMI
+    try:
+        nvidia_smi.nvmlInit()
+    except nvidia_smi.NVMLError:
+        return ()
 
-    for i in range(deviceCount):
+    available_gpus = []
+    for i in range(nvidia_smi.nvmlDeviceGetCount()):
         handle = nvidia_smi.nvmlDeviceGetHandleByIndex(i)
         info = nvidia_smi.nvmlDeviceGetMemoryInfo(handle)
 
         # Check if the GPU has enough free memory (e.g., 90% free)
         if info.free / info.total > 0.9:
-            # Try to allocate a small tensor on this GPU
-            try:
-                with torch.cuda.device(f"cuda:{i}"):
-                    torch.cuda.current_stream().synchronize()
-                    torch.cuda.empty_cache()
-                    torch.cuda.memory.empty_cache()
-                    test_tensor = torch.zeros((1,), device=f"cuda:{i}")
-                    del test_tensor
-                    return f"cuda:{i}"
-            except RuntimeError:
-                # If allocation fails, move to the next GPU
-                continue
-
-    # If no available GPU is found
-    if not use_cpu:
-        raise RuntimeError("No available GPU found")
+            available_gpus.append(f"cuda:{i}")
 
-    return "cpu"
+    return tuple(available_gpus)
 
 
-def process_news_df(news: pd.DataFrame, day_ago_time: int, today_time: int) -> pd.DataFrame:
+@functools.lru_cache(maxsize=None)
+def _first_usable_gpu() -> Optional[str]:
     """
-    After updating yfinance to 0.2.54, the news' dataframe is changed completely. 
+    The first GPU of _probe_gpus on which a tensor can be allocated, checked once per process.
+    """
+    gpus = _probe_gpus()
+    if not gpus:
+        return None
+
+    import torch
+
+    for device in gpus:
+        # Try to allocate a small tensor on this GPU
+        try:
+            with torch.cuda.device(device):
+                test_tensor = torch.zeros((1,), device=device)
+                del test_tensor
+                return device
+        except RuntimeError:
+            # If allocation fails, move to the next GPU
+            continue
+
+    return None
+
+
+def process_news_df(
+    news: pd.DataFrame,
+    day_ago_time: int,
+    today_time: int,
+    debug_dir: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    After updating yfinance to 0.2.54, the news' dataframe is changed completely.
     Now all the meta data of the news are stored in a column "content", with each row a dictionary storing the meta data of a news.
+
+    The news outside [day_ago_time, today_time] are dropped before the other fields are extracted. If debug_dir is given, the first raw news and the processed dataframe are saved there.
     """
     if news.empty:
         return news
-    
-    news_content_jsons = list(news["content"])
-    with open('news_content.json', 'w') as fp:
-        json.dump(list(news_content_jsons)[0], fp, indent=4)
-    
-    news_content_df = pd.DataFrame(news_content_jsons)
-    
-    target_columns = ["title", "summary", "pubDate"]
-    
-    # convert the date to timestamp
-    news_content_df = news_content_df[target_columns]
-
-    news_content_df["pubDate"] = news_content_df["pubDate"].apply(
-        lambda x: datetime.strptime(x, "%Y-%m-%dT%H:%M:%SZ")
-    ).apply(lambda x: calendar.timegm(x.timetuple()))
-    
-    news_url_list = []
-    image_url_list = []
-    
-    for news_json in news_content_jsons:
-        # assign the news_url and image_url
-        
-        news_url = None
-        if news_json.get("canonicalUrl", None) is not None:
-            news_url = news_json["canonicalUrl"].get("url")
-        
-        news_url_list.append(news_url)
-        
-        image_url = None
-        if news_json.get("thumbnail", None) is not None:
-            image_url = news_json["thumbnail"].get("originalUrl")
-        
-        image_url_list.append(image_url)
-    
-    news_content_df["news_url"] = news_url_list
-    news_content_df["image_url"] = image_url_list
-    
+
+    contents = news["content"]
+
+    # unix timestamps (in seconds) of the publication dates
+    pub_dates = pd.to_datetime(
+        contents.str.get("pubDate"),
+        utc=True,
+        format="%Y-%m-%dT%H:%M:%SZ",
+        errors="coerce",
+    )
+    pub_times = (pub_dates - _UNIX_EPOCH) // pd.Timedelta(seconds=1)
+
     # filter the news that published within a time range
-    news_content_df = news_content_df[
-        (news_content_df["pubDate"] >= day_ago_time)
-        & (news_content_df["pubDate"] <= today_time)
-    ]
-    
-    news_content_df.to_csv("processed_news_content.csv", index=False)
+    in_range = (pub_times >= day_ago_time) & (pub_times <= today_time)
+    contents = contents[in_range]
+
+    news_content_df = pd.DataFrame(
+        {
+            "title": contents.str.get("title"),
+            "summary": contents.str.get("summary"),
+            "pubDate": pub_times[in_range].astype("int64"),
+            "news_url": _none_if_missing(contents.str.get("canonicalUrl").str.get("url")),
+            "image_url": _none_if_missing(
+                contents.str.get("thumbnail").str.get("originalUrl")
+            ),
+        }
+    )
+
+    if debug_dir is not None:
+        with open(os.path.join(debug_dir, "news_content.json"), "w") as fp:
+            json.dump(news["content"].iloc[0], fp, indent=4)
+        news_content_df.to_csv(
+            os.path.join(debug_dir, "processed_news_content.csv"), index=False
+        )
+
     return news_content_df
 
 
+def _none_if_missing(series: pd.Series) -> pd.Series:
+    return series.astype(object).where(series.notna(), None)
+
+
 def notion_add_news_part(
-    notion_client: NotionClient,
+    notion_client,
     page_id: str,
     news_title: str,
     news_summary: str,
     news_url: str,
     ticker: str,
     current_time: str,
+    on_written=None,
 ):
     """
-    Add the news part to the page. There is a certain format for the news part designed by me. You can change to your own format if you want.
+    Add the news part to the page of the notion_client (a NotionClient or AsyncNotionWriter). There is a certain format for the news part designed by me. You can change to your own format if you want.
+    on_written is called with the ids of the created blocks once the news part is written.
     """
     STOCK_DATA_URL = "https://finance.yahoo.com/quote/{}"
 
@@ -152,13 +195,16 @@ def notion_add_news_part(
             "is_bold": True,
         },
         space_obj,
+        {"content_type": "divider"},
     ]
 
-    notion_client.add_multiple_elements(page_id, elements_to_be_added)
-    notion_client.add_divider(page_id)
+    # one request for the whole news part, divider included
+    notion_client.add_multiple_elements(page_id, elements_to_be_added, on_written)
 
 
 if __name__ == "__main__":
+    from .notion import NotionClient
+
     # Usage
     notion = NotionClient()
 
@@ -0,0 +1,26 @@
+import os
+
+
+class EchoVLM:
+    """
+    Model answering every prompt with the pid of its process and the prompt, to test the inference pool without weights. A prompt "crash <path>" kills the process the first time it is seen (<path> is created to remember it).
+    """
+
+    def __init__(self, device: str = None, load_config=None):
+        self.device = device
+
+    def generate_batch(
+        self, role, prompts, images=None, max_new_token=1500, temperature=0.6, streamer=None
+    ):
+        for prompt in prompts:
+            if prompt.startswith("crash "):
+                path = prompt.split(" ", 1)[1]
+                if not os.path.exists(path):
+                    open(path, "w").close()
+                    os._exit(1)
+            if prompt == "fail":
+                raise ValueError("generation failed")
+
+        return [f"{os.getpid()} {prompt}" for prompt in prompts]
+
+    generate_structured = generate_batch
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("matplotlib")
+
+from benchmarks.bench_charts import make_bars
+from src.charts import ChartCache, ChartRenderer
+from src.config import CHART_STYLE
+from src.price_store import PriceStore
+
+TICKERS = ["AAPL", "MSFT", "TSLA"]
+
+
+@pytest.fixture
+def bars():
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2024-01-02", periods=81)
+    return {ticker: make_bars(rng, dates) for ticker in TICKERS}
+
+
+@pytest.fixture
+def store(tmp_path, bars):
+    store = PriceStore(str(tmp_path / "prices"))
+    # the last bar of each ticker is added by the tests
+    for ticker in TICKERS:
+        store.append(ticker, bars[ticker][:-1])
+    return store
+
+
+@pytest.fixture
+def renderer(tmp_path, store):
+    return ChartRenderer(store, ChartCache(str(tmp_path / "charts")), window=40, processes=0)
+
+
+def test_key_covers_what_the_chart_shows():
+    key = ChartCache.make_key("AAPL", 40, "2024-04-19", CHART_STYLE)
+
+    assert ChartCache.make_key("AAPL", 40, "2024-04-19", dict(CHART_STYLE)) == key
+    assert ChartCache.make_key("MSFT", 40, "2024-04-19", CHART_STYLE) != key
+    assert ChartCache.make_key("AAPL", 60, "2024-04-19", CHART_STYLE) != key
+    assert ChartCache.make_key("AAPL", 40, "2024-04-22", CHART_STYLE) != key
+    assert ChartCache.make_key("AAPL", 40, "2024-04-19", {**CHART_STYLE, "dpi": 50}) != key
+
+
+def test_unchanged_charts_come_from_the_cache(renderer):
+    first = renderer.render(TICKERS)
+    second = renderer.render(TICKERS)
+
+    assert list(first) == TICKERS
+    assert second == first
+    assert (renderer.rendered, renderer.hits) == (3, 3)
+    assert first["AAPL"].load().format == "PNG"
+
+
+def test_new_bar_renders_the_chart_again(renderer, store, bars):
+    first = renderer.render(TICKERS)
+
+    store.append("MSFT", bars["MSFT"][-1:])
+    second = renderer.render(TICKERS)
+
+    # only the chart of the ticker with a new bar is rendered again
+    assert (renderer.rendered, renderer.hits) == (4, 2)
+    assert second["MSFT"] != first["MSFT"]
+    assert second["AAPL"] == first["AAPL"] and second["TSLA"] == first["TSLA"]
+    assert second["MSFT"].load().tobytes() != first["MSFT"].load().tobytes()
+
+
+def test_new_style_renders_every_chart_again(renderer, store):
+    renderer.render(TICKERS)
+
+    restyled = ChartRenderer(
+        store,
+        renderer.cache,
+        window=40,
+        style={**CHART_STYLE, "volume": False},
+        processes=0,
+    )
+    restyled.render(TICKERS)
+
+    assert (restyled.rendered, restyled.hits) == (3, 0)
+
+
+def test_tickers_without_bars_are_skipped(renderer):
+    charts = renderer.render(["AAPL", "UNKNOWN"])
+
+    assert list(charts) == ["AAPL"]
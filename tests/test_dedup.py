@@ -0,0 +1,115 @@
+import pandas as pd
+import pytest
+
+from src.dedup import MinHasher, canonicalize_url, deduplicate_news
+
+ARTICLE = (
+    "Apple reported record revenue for the quarter as iPhone sales grew in every region "
+    "and services reached a new high, beating the estimates of the analysts"
+)
+
+
+def news_df(*news) -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            {
+                "title": title,
+                "summary": summary,
+                "news_url": url,
+                "image_url": None,
+                "pubDate": 1000 + i,
+            }
+            for i, (title, summary, url) in enumerate(news)
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://finance.yahoo.com/news/apple-record-revenue",
+        "https://finance.yahoo.com/news/apple-record-revenue/",
+        "HTTPS://www.Finance.Yahoo.com/news/apple-record-revenue?utm_source=x&guccounter=1",
+        "https://finance.yahoo.com/news/apple-record-revenue#comments",
+        "  https://finance.yahoo.com/news/apple-record-revenue  ",
+    ],
+)
+def test_canonical_url(url):
+    assert canonicalize_url(url) == "https://finance.yahoo.com/news/apple-record-revenue"
+
+
+def test_canonical_url_keeps_the_path():
+    assert canonicalize_url("https://a.com/news/1") != canonicalize_url("https://a.com/news/2")
+    assert canonicalize_url("") == ""
+    assert canonicalize_url(None) == ""
+
+
+def test_minhash_similarity():
+    hasher = MinHasher(num_perm=128)
+    signature = hasher.signature(ARTICLE)
+
+    assert MinHasher.similarity(signature, hasher.signature(ARTICLE.upper() + "!")) == 1.0
+    # one word changed out of 26, the jaccard similarity of the shingles is about 0.8
+    near = ARTICLE.replace("every", "each")
+    assert 0.6 < MinHasher.similarity(signature, hasher.signature(near)) < 1.0
+    assert MinHasher.similarity(signature, hasher.signature("Tesla misses its deliveries")) < 0.2
+
+
+def test_same_url_for_several_tickers():
+    unique_news, stats = deduplicate_news(
+        {
+            "AAPL": news_df(("Apple beats", ARTICLE, "https://a.com/news/1?utm_source=aapl")),
+            "MSFT": news_df(("Apple beats", ARTICLE, "https://www.a.com/news/1/")),
+        }
+    )
+
+    assert len(unique_news) == 1
+    assert unique_news[0]["tickers"] == ["AAPL", "MSFT"]
+    # the identical urls are not duplicates of another news
+    assert unique_news[0]["duplicate_urls"] == []
+    assert stats == {"news": 2, "unique_news": 1, "dedup_ratio": 0.5}
+
+
+def test_near_identical_news_are_grouped():
+    unique_news, stats = deduplicate_news(
+        {
+            "AAPL": news_df(
+                ("Apple posts record revenue", ARTICLE, "https://a.com/news/1"),
+                (
+                    "Tesla misses deliveries",
+                    "Tesla delivered fewer cars than expected",
+                    "https://a.com/news/2",
+                ),
+            ),
+            "GOOG": news_df(("Apple posts record revenue", ARTICLE, "https://b.com/apple-record")),
+        }
+    )
+
+    assert [news["news_url"] for news in unique_news] == [
+        "https://a.com/news/1",
+        "https://a.com/news/2",
+    ]
+    # the first news is kept, the others are folded into it with their tickers
+    assert unique_news[0]["tickers"] == ["AAPL", "GOOG"]
+    assert unique_news[0]["duplicate_urls"] == ["https://b.com/apple-record"]
+    assert unique_news[0]["pub_date"] == 1000
+    assert unique_news[1]["tickers"] == ["AAPL"]
+    assert stats["unique_news"] == 2
+
+
+def test_different_news_are_kept():
+    unique_news, _ = deduplicate_news(
+        {
+            "AAPL": news_df(
+                ("Apple posts record revenue", ARTICLE, "https://a.com/news/1"),
+                (
+                    "Apple recalls chargers",
+                    "Apple recalls a batch of chargers over a fire risk",
+                    "https://a.com/news/3",
+                ),
+            ),
+            "MSFT": pd.DataFrame(),
+        }
+    )
+
+    assert len(unique_news) == 2
@@ -0,0 +1,82 @@
+import numpy as np
+
+from src.config import TRADING_DAYS_PER_YEAR
+from src.factors import rolling_factors
+
+WINDOW = 20
+
+
+def window_fit(stock_returns, benchmark_returns, day: int, window: int = WINDOW):
+    """
+    Beta and alpha of one stock on one day with numpy.polyfit, on the days of the window where both returns are known.
+    """
+    x = benchmark_returns[day - window + 1 : day + 1]
+    y = stock_returns[day - window + 1 : day + 1]
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    beta, intercept = np.polyfit(x[valid], y[valid], 1)
+    return beta, intercept * TRADING_DAYS_PER_YEAR, valid.sum()
+
+
+def test_factors_match_polyfit():
+    rng = np.random.default_rng(0)
+    days = 100
+    benchmark = rng.normal(0, 0.01, days)
+    stocks = np.stack(
+        [
+            0.0005 + beta * benchmark + rng.normal(0, 0.005, days)
+            for beta in (0.5, 1.0, 2.0)
+        ],
+        axis=1,
+    )
+    # missing days of a stock and of the benchmark
+    stocks[30:35, 1] = np.nan
+    benchmark[60] = np.nan
+
+    factors = rolling_factors(stocks, benchmark, WINDOW)
+
+    for day in range(WINDOW - 1, days):
+        for stock in range(stocks.shape[1]):
+            beta, alpha, n = window_fit(stocks[:, stock], benchmark, day)
+            np.testing.assert_allclose(factors["beta"][day, stock], beta, rtol=1e-9)
+            np.testing.assert_allclose(factors["alpha"][day, stock], alpha, rtol=1e-7, atol=1e-12)
+
+            x = benchmark[day - WINDOW + 1 : day + 1]
+            y = stocks[day - WINDOW + 1 : day + 1, stock]
+            valid = ~np.isnan(x) & ~np.isnan(y)
+            np.testing.assert_allclose(
+                factors["volatility"][day, stock],
+                np.std(y[valid], ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR),
+                rtol=1e-9,
+            )
+            np.testing.assert_allclose(
+                factors["correlation"][day, stock],
+                np.corrcoef(x[valid], y[valid])[0, 1],
+                rtol=1e-9,
+            )
+
+
+def test_too_few_days_are_nan():
+    rng = np.random.default_rng(1)
+    benchmark = rng.normal(0, 0.01, 40)
+    stocks = benchmark[:, None] + rng.normal(0, 0.005, (40, 1))
+    stocks[:25, 0] = np.nan
+
+    beta = rolling_factors(stocks, benchmark, WINDOW)["beta"][:, 0]
+
+    # the default min_periods is half the window
+    assert np.isnan(beta[: 25 + WINDOW // 2 - 1]).all()
+    assert np.isfinite(beta[25 + WINDOW // 2 - 1 :]).all()
+
+
+def test_long_history_keeps_its_precision():
+    rng = np.random.default_rng(2)
+    days = 20000
+    # large returns make the rounding errors of sums over the whole history show
+    benchmark = 5 + rng.normal(0, 0.01, days)
+    stocks = 1.5 * benchmark[:, None] + rng.normal(0, 0.01, (days, 1))
+
+    beta = rolling_factors(stocks, benchmark, WINDOW)["beta"][:, 0]
+
+    for day in range(days - 50, days):
+        expected, _, _ = window_fit(stocks[:, 0], benchmark, day)
+        np.testing.assert_allclose(beta[day], expected, rtol=1e-8)
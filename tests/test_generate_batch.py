@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+pytest.importorskip("qwen_vl_utils")
+
+from PIL import Image
+
+from src.config import PROMPT_TEMPLATE, VLM_ROLE
+from src.models.llama_vision import LlamaVision
+from src.models.qwen_vision import Qwen25Vision
+from src.structured import SENTIMENTS
+from tests.tiny_models import save_tiny_llama, save_tiny_qwen
+
+# near greedy, generate_batch always samples
+GENERATE_KWARGS = dict(max_new_token=8, temperature=1e-6)
+
+
+@pytest.fixture(scope="module")
+def qwen(tmp_path_factory):
+    path = save_tiny_qwen(tmp_path_factory.mktemp("qwen"))
+
+    class TinyQwen(Qwen25Vision):
+        model_id = path
+
+    return TinyQwen("cpu")
+
+
+@pytest.fixture(scope="module")
+def llama(tmp_path_factory):
+    path = save_tiny_llama(tmp_path_factory.mktemp("llama"))
+
+    class TinyLlama(LlamaVision):
+        model_id = path
+
+    return TinyLlama("cpu")
+
+
+@pytest.fixture(scope="module")
+def prompts():
+    # of different lengths, so the batch is padded
+    return [
+        PROMPT_TEMPLATE.format(title=f"News {i}", news_text="Shares rose. " * (3 * i + 1))
+        for i in range(3)
+    ]
+
+
+@pytest.fixture(scope="module")
+def image():
+    pixels = np.random.RandomState(0).randint(0, 256, (64, 80, 3), dtype=np.uint8)
+    return Image.fromarray(pixels)
+
+
+@pytest.fixture(params=["qwen", "llama"])
+def vlm(request):
+    return request.getfixturevalue(request.param)
+
+
+def test_batch_matches_single_prompts(vlm, prompts):
+    batched = vlm.generate_batch(VLM_ROLE, prompts, **GENERATE_KWARGS)
+    single = [vlm.generate_batch(VLM_ROLE, [prompt], **GENERATE_KWARGS)[0] for prompt in prompts]
+
+    assert batched == single
+    # the outputs depend on the prompts, so the comparison is meaningful
+    assert len(set(batched)) > 1
+    # the generated tokens are counted without the padding of the items which ended first
+    assert [output.generated_tokens for output in batched] == [
+        output.generated_tokens for output in single
+    ]
+    assert all(1 <= output.generated_tokens <= 8 for output in batched)
+
+
+def test_batch_with_images_matches_single_prompts(vlm, prompts, image):
+    images = [image, None, image]
+
+    batched = vlm.generate_batch(VLM_ROLE, prompts, images, **GENERATE_KWARGS)
+    single = [
+        vlm.generate_batch(VLM_ROLE, [prompt], [prompt_image], **GENERATE_KWARGS)[0]
+        for prompt, prompt_image in zip(prompts, images)
+    ]
+
+    assert batched == single
+
+
+def test_qwen_batch_reuses_the_prefix_cache(qwen, prompts):
+    qwen._prefix_caches.clear()
+
+    qwen.generate_batch(VLM_ROLE, prompts, **GENERATE_KWARGS)
+
+    prefix_cache = qwen._prefix_caches[VLM_ROLE]
+    assert (prefix_cache.hits, prefix_cache.misses) == (1, 0)
+
+
+def test_mismatched_images(vlm, prompts):
+    with pytest.raises(ValueError):
+        vlm.generate_batch(VLM_ROLE, prompts, [None], **GENERATE_KWARGS)
+
+
+def test_structured_answers(vlm, prompts):
+    results = vlm.generate_structured(VLM_ROLE, prompts, max_new_token=16)
+
+    assert len(results) == len(prompts)
+    for result in results:
+        # the tiny model only writes a valid label because of the constraint
+        assert result.sentiment in SENTIMENTS
+        assert 0.0 < result.confidence <= 1.0
+        assert 1 <= result.generated_tokens <= 16
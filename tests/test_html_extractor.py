@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from src.html_extractor import EXTRACTORS, extract_in_process, get_extractor
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "yahoo_article.html")
+
+
+@pytest.fixture(scope="module")
+def page() -> bytes:
+    with open(FIXTURE, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture(params=list(EXTRACTORS))
+def extractor(request):
+    pytest.importorskip(EXTRACTORS[request.param][0])
+    return get_extractor(request.param)
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def test_article_body_and_image(extractor, page):
+    text, image_src = extractor.extract(page)
+
+    assert normalize(text) == (
+        # the no-break space of the page is a whitespace too
+        "Apple (AAPL) reported revenue of $94.9 billion, up 6% from a year ago. "
+        "Services revenue reached an all-time high & the gross margin was 46.2%. "
+        "“We are thrilled,” said Tim Cook, Apple’s CEO. "
+        "iPhone: $46.2 billion Mac: $7.7 billion"
+    )
+    # only the image whose class is exactly the one of the article image
+    assert image_src == "https://s.yimg.com/ny/api/res/1.2/apple.jpg"
+
+
+def test_backends_agree_with_bs4(extractor, page):
+    reference = get_extractor("bs4").extract(page)
+    text, image_src = extractor.extract(page)
+
+    assert (normalize(text), image_src) == (normalize(reference[0]), reference[1])
+
+
+@pytest.mark.parametrize(
+    "html",
+    [b"", b"<html><body><p>No article here</p></body></html>"],
+)
+def test_page_without_article(extractor, html):
+    assert extractor.extract(html) == ("", None)
+
+
+def test_extract_in_process(page):
+    assert extract_in_process("bs4", page) == get_extractor("bs4").extract(page)
+
+
+def test_unknown_extractor():
+    with pytest.raises(ValueError):
+        get_extractor("regex")
+
+    assert get_extractor("auto").name in EXTRACTORS
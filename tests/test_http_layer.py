@@ -0,0 +1,141 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.http_layer import CachedLimiterSession, HostRateLimiter, HTTPCache
+
+ETAG = '"v1"'
+
+
+class PageServer:
+    """
+    Local server answering every GET with a page and its ETag (a 304 when it is sent back), and every POST with a new body. The first answers of the paths in <failures> are 503.
+    """
+
+    def __init__(self):
+        self.requests = Counter()
+        self.failures = Counter()
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _answer(self, body: bytes):
+                with server._lock:
+                    server.requests[self.command, self.path] += 1
+                    count = server.requests[self.command, self.path]
+                    failing = server.failures[self.path] > 0
+                    server.failures[self.path] -= failing
+
+                if failing:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                elif self.command == "GET" and self.headers.get("If-None-Match") == ETAG:
+                    self.send_response(304)
+                    self.end_headers()
+                else:
+                    body = body or f"answer {count}".encode()
+                    self.send_response(200)
+                    self.send_header("ETag", ETAG)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._answer(f"page {self.path}".encode())
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self._answer(b"")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = PageServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HTTPCache(str(tmp_path / "http.cache"))
+    yield cache
+    cache.close()
+
+
+def test_pages_are_revalidated(server, cache):
+    session = CachedLimiterSession(cache)
+
+    first = session.get(f"{server.url}/news/a")
+    second = session.get(f"{server.url}/news/a")
+
+    assert first.text == second.text == "page /news/a"
+    assert getattr(second, "from_cache", False)
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_posts_are_not_cached(server, cache):
+    session = CachedLimiterSession(cache)
+
+    answers = [session.post(f"{server.url}/news-list", data=b"AAPL").text for _ in range(2)]
+
+    assert answers == ["answer 1", "answer 2"]
+    assert cache.stats()["entries"] == 0
+
+
+def test_api_hosts_are_not_cached(server, cache):
+    session = CachedLimiterSession(cache)
+    session.get_adapter(server.url).uncached_hosts = ("127.0.0.1",)
+
+    session.get(f"{server.url}/v1/test/getcrumb")
+    session.get(f"{server.url}/v1/test/getcrumb")
+
+    assert server.requests["GET", "/v1/test/getcrumb"] == 2
+    assert cache.stats() == {"hits": 0, "revalidated": 0, "misses": 0, "entries": 0}
+
+
+def test_counts_from_threads(server, cache):
+    session = CachedLimiterSession(cache, pool_size=16)
+    urls = [f"{server.url}/news/{i % 5}" for i in range(200)]
+
+    with ThreadPoolExecutor(16) as executor:
+        list(executor.map(session.get, urls))
+
+    stats = cache.stats()
+    assert stats["hits"] + stats["revalidated"] + stats["misses"] == len(urls)
+
+
+def test_retries_wait_for_the_rate_limiter(server, monkeypatch):
+    acquired = Counter()
+    acquire = HostRateLimiter.acquire
+
+    def counting_acquire(self, host):
+        acquired[host] += 1
+        acquire(self, host)
+
+    monkeypatch.setattr(HostRateLimiter, "acquire", counting_acquire)
+    monkeypatch.setattr("urllib3.util.Retry.get_backoff_time", lambda self: 0)
+    server.failures["/news/a"] = 2
+
+    response = CachedLimiterSession().get(f"{server.url}/news/a")
+
+    assert response.status_code == 200
+    assert sum(acquired.values()) == 3
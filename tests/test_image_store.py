@@ -0,0 +1,103 @@
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from src.image_store import ImageStore, StoredImage, load_image
+
+
+def png_bytes(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 12), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(str(tmp_path / "image_store"))
+
+
+def stored_files(store: ImageStore) -> list[str]:
+    return [
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(store.root)
+        for name in names
+    ]
+
+
+def test_image_is_stored_once_under_its_hash(store):
+    data = png_bytes("red")
+
+    images = [store.put(data) for _ in range(3)]
+
+    assert images[0] == images[1] == images[2]
+    assert images[0].key == hashlib.sha256(data).hexdigest()
+    assert len(stored_files(store)) == 1
+    assert store.put(png_bytes("blue")) != images[0]
+
+
+def test_image_is_reloaded(store):
+    stored = store.put(png_bytes("red"))
+
+    # another store on the same directory, e.g. the next run
+    image = ImageStore(store.root).open(stored.key)
+
+    assert image.size == (16, 12)
+    assert image.getpixel((0, 0)) == (255, 0, 0)
+    assert load_image(stored).tobytes() == image.tobytes()
+    # the image stays readable once its memory map is closed
+    assert image.copy().size == (16, 12)
+
+
+def test_concurrent_puts_leave_no_partial_file(store):
+    data = [png_bytes(color) for color in ("red", "green", "blue", "white")]
+
+    with ThreadPoolExecutor(8) as executor:
+        images = list(executor.map(store.put, data * 8))
+
+    files = stored_files(store)
+    assert len(files) == 4
+    # no temporary file is left next to the images
+    assert sorted(os.path.basename(path) for path in files) == sorted(
+        {image.key for image in images}
+    )
+    for image, expected in zip(images, data * 8):
+        with open(store._image_path(image.key), "rb") as f:
+            assert f.read() == expected
+
+
+def test_failed_write_removes_the_temporary_file(store, tmp_path):
+    path = str(tmp_path / "image_store" / "images" / "ab" / "abc")
+
+    def write(f):
+        f.write(b"partial")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        ImageStore._atomic_write(path, write)
+
+    assert not os.path.exists(path)
+    assert os.listdir(os.path.dirname(path)) == []
+
+
+def test_features_are_reloaded(store):
+    torch = pytest.importorskip("torch")
+    stored = store.put(png_bytes("red"))
+    features = {"pixel_values": torch.arange(6.0).reshape(2, 3)}
+
+    assert store.load_features(stored.key, "model-a") is None
+    store.save_features(stored.key, "model-a", features)
+
+    loaded = store.load_features(stored.key, "model-a")
+    assert torch.equal(loaded["pixel_values"], features["pixel_values"])
+    # the features of another preprocessing are kept apart
+    assert store.load_features(stored.key, "model-b") is None
+
+
+def test_stored_image_is_hashable(store):
+    stored = store.put(png_bytes("red"))
+
+    assert {stored, StoredImage(store, stored.key)} == {stored}
@@ -0,0 +1,87 @@
+import pytest
+
+from benchmarks.fake_notion import FakeNotionServer
+from src.notion import NotionClient
+from src.utils import notion_add_news_part
+
+
+class ChunkNotionServer(FakeNotionServer):
+    """
+    Keep the number of blocks of each append request.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunk_sizes = []
+
+    def handle(self, method: str, path: str, body: dict) -> tuple:
+        if "/children" in path:
+            self.chunk_sizes.append(len(body["children"]))
+        return super().handle(method, path, body)
+
+
+@pytest.fixture
+def notion(monkeypatch):
+    monkeypatch.setenv("NOTION_TOKEN", "fake-token")
+    monkeypatch.setenv("NOTION_PAGE_ID", "fake-page")
+    monkeypatch.delenv("NOTION_BASE_URL", raising=False)
+
+    with ChunkNotionServer() as server:
+        client = NotionClient(base_url=server.url)
+        page_id = client.create_page("Test")["id"]
+        server.request_count = 0
+        yield client, server, page_id
+
+
+def add_news(notion_client, page_id: str, i: int, on_written=None):
+    notion_add_news_part(
+        notion_client,
+        page_id,
+        f"News {i}",
+        "Some summary of the news.",
+        f"https://finance.yahoo.com/news/{i}",
+        "TSLA",
+        "2025-01-01 00:00:00",
+        on_written,
+    )
+
+
+def test_news_part_is_one_request(notion):
+    client, server, page_id = notion
+    written = []
+
+    for i in range(3):
+        add_news(client, page_id, i, written.append)
+
+    assert server.request_count == 3
+    assert server.chunk_sizes == [11, 11, 11]
+    # the divider ends every news part
+    assert [block["type"] for block in server.blocks[page_id]][10::11] == ["divider"] * 3
+    assert [len(block_ids) for block_ids in written] == [11, 11, 11]
+    assert sum(written, []) == [block["id"] for block in server.blocks[page_id]]
+
+
+def test_append_blocks_chunks(notion):
+    client, server, page_id = notion
+    blocks = [
+        NotionClient.build_element("paragraph", str(i))
+        for i in range(2 * NotionClient.MAX_BLOCKS_PER_REQUEST + 50)
+    ]
+
+    block_ids = client.append_blocks(page_id, blocks)
+
+    assert NotionClient.MAX_BLOCKS_PER_REQUEST == 100
+    assert server.request_count == 3
+    assert server.chunk_sizes == [100, 100, 50]
+    assert block_ids == [block["id"] for block in server.blocks[page_id]]
+    assert [
+        block["paragraph"]["rich_text"][0]["text"]["content"]
+        for block in server.blocks[page_id]
+    ] == [str(i) for i in range(250)]
+
+
+def test_append_blocks_empty(notion):
+    client, server, page_id = notion
+
+    assert client.append_blocks(page_id, []) == []
+    assert server.request_count == 0
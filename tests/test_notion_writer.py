@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_notion import FakeNotionServer
+from src.notion_writer import AsyncNotionWriter
+from src.utils import notion_add_news_part
+
+
+class RateLimitedNotionServer(FakeNotionServer):
+    """
+    Answer the appends whose number is in <rate_limited> with 429 and a Retry-After header, and keep the time of every append.
+    """
+
+    def __init__(self, rate_limited=(), retry_after: int = 1):
+        super().__init__()
+        self.rate_limited = set(rate_limited)
+        self.retry_after = retry_after
+        self.append_times = []
+        self._append_lock = threading.Lock()
+
+    def handle(self, method: str, path: str, body: dict) -> tuple:
+        if "/children" in path:
+            with self._append_lock:
+                self.append_times.append(time.monotonic())
+                append_count = len(self.append_times)
+
+            if append_count in self.rate_limited:
+                return (
+                    429,
+                    {"object": "error", "status": 429, "code": "rate_limited", "message": "Rate limited"},
+                    {"Retry-After": str(self.retry_after)},
+                )
+
+        return super().handle(method, path, body)
+
+
+@pytest.fixture(autouse=True)
+def notion_env(monkeypatch):
+    monkeypatch.setenv("NOTION_TOKEN", "fake-token")
+    monkeypatch.delenv("NOTION_BASE_URL", raising=False)
+
+
+def add_news(notion_writer, page_id: str, i: int):
+    notion_add_news_part(
+        notion_writer,
+        page_id,
+        f"News {i}",
+        "Some summary of the news.",
+        f"https://finance.yahoo.com/news/{i}",
+        "TSLA",
+        "2025-01-01 00:00:00",
+    )
+
+
+def titles(blocks: list[dict]) -> list[str]:
+    return [
+        block["heading_2"]["rich_text"][0]["text"]["content"]
+        for block in blocks
+        if block["type"] == "heading_2"
+    ]
+
+
+def test_retry_after(notion_env):
+    with RateLimitedNotionServer(rate_limited={2}, retry_after=1) as server:
+        with AsyncNotionWriter(base_url=server.url, rate=50, burst=1) as notion_writer:
+            for i in range(3):
+                add_news(notion_writer, "page", i)
+                notion_writer.flush()
+
+        assert notion_writer.retry_count == 1
+        assert notion_writer.request_count == 4
+        assert len(server.append_times) == 4
+        assert titles(server.blocks["page"]) == ["News 0", "News 1", "News 2"]
+        assert notion_writer.unwritten == []
+
+        # the rate limited append is retried after Retry-After, not before
+        assert server.append_times[2] - server.append_times[1] >= 0.95
+
+
+def test_token_bucket_spacing(notion_env):
+    rate, burst, n_pages = 10, 2, 6
+
+    with RateLimitedNotionServer() as server:
+        with AsyncNotionWriter(base_url=server.url, rate=rate, burst=burst) as notion_writer:
+            # one append per page, so none of them are merged
+            for i in range(n_pages):
+                add_news(notion_writer, f"page-{i}", i)
+
+        assert notion_writer.request_count == n_pages
+        assert notion_writer.retry_count == 0
+
+        times = server.append_times
+        assert len(times) == n_pages
+        # after the burst, the requests are spaced by 1 / rate
+        gaps = [b - a for a, b in zip(times[burst - 1 :], times[burst:])]
+        assert min(gaps) >= 0.8 / rate
+        assert times[-1] - times[0] >= 0.9 * (n_pages - burst) / rate
+
+
+def test_appends_merged_while_waiting(notion_env):
+    with RateLimitedNotionServer() as server:
+        with AsyncNotionWriter(base_url=server.url, rate=2, burst=1) as notion_writer:
+            for i in range(5):
+                add_news(notion_writer, "page", i)
+
+        # the first append takes the only token, the others wait and are merged
+        assert notion_writer.request_count < 5
+        assert titles(server.blocks["page"]) == [f"News {i}" for i in range(5)]
+
+
+def test_close_twice(notion_env):
+    with FakeNotionServer() as server:
+        notion_writer = AsyncNotionWriter(base_url=server.url)
+        add_news(notion_writer, "page", 0)
+        notion_writer.close()
+        # the event loop of the writer is closed by now
+        notion_writer.close()
+
+        assert titles(server.blocks["page"]) == ["News 0"]
+        with pytest.raises(RuntimeError):
+            add_news(notion_writer, "page", 1)
+
+
+def test_missing_token(monkeypatch):
+    monkeypatch.delenv("NOTION_TOKEN", raising=False)
+
+    with pytest.raises(ValueError):
+        AsyncNotionWriter()
@@ -0,0 +1,100 @@
+import pytest
+
+from src.models import registry
+from src.models.pool import InferencePool
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setitem(registry.MODELS, "echo", ("tests.echo_vlm", "EchoVLM"))
+    monkeypatch.setitem(registry.MODEL_IDS, "echo", "test/echo")
+
+    with InferencePool("echo", devices=["cpu", "cpu"], micro_batch_size=1) as pool:
+        yield pool
+
+
+def test_outputs_are_in_order(pool):
+    prompts = [f"news {'x' * (i * 37 % 11)} {i}" for i in range(12)]
+
+    outputs = pool.generate_batch("role", prompts)
+
+    assert [output.split(" ", 1)[1] for output in outputs] == prompts
+
+
+def test_micro_batches_are_spread_over_the_workers(pool):
+    outputs = pool.generate_batch("role", [f"news {i}" for i in range(8)])
+
+    pids = {output.split(" ", 1)[0] for output in outputs}
+    assert len(pids) == 2
+    assert pool.stats()["devices"] == ["cpu", "cpu"]
+
+
+def test_longer_prompts_go_to_the_least_loaded_worker(pool):
+    # the two long prompts are sent first, one to each worker
+    prompts = ["a" * 4000, "b" * 4000, "short 1", "short 2"]
+
+    outputs = pool.generate_batch("role", prompts)
+
+    assert outputs[0].split(" ", 1)[0] != outputs[1].split(" ", 1)[0]
+
+
+def test_crashed_worker_is_restarted(pool, tmp_path):
+    prompts = ["news 0", f"crash {tmp_path / 'crashed'}", "news 2"]
+
+    outputs = pool.generate_batch("role", prompts)
+
+    assert [output.split(" ", 1)[1] for output in outputs] == prompts
+    assert pool.restart_count == 1
+    # the restarted worker answers the next batches
+    assert len(pool.generate_batch("role", ["news 3", "news 4"])) == 2
+
+
+def test_failed_generation_is_raised(pool):
+    with pytest.raises(RuntimeError, match="generation failed"):
+        pool.generate_batch("role", ["news 0", "fail"])
+
+
+def test_unknown_model():
+    with pytest.raises(ValueError):
+        InferencePool("unknown", devices=["cpu"])
+
+
+def test_tiny_qwen_in_the_workers(monkeypatch, tmp_path):
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    pytest.importorskip("qwen_vl_utils")
+    from PIL import Image
+
+    from src.config import PROMPT_TEMPLATE, VLM_ROLE
+    from tests.tiny_models import TinyQwen, save_tiny_qwen
+
+    path = save_tiny_qwen(tmp_path / "qwen")
+    # the spawned workers read the path when they import the model class
+    monkeypatch.setenv("TINY_QWEN_PATH", path)
+    monkeypatch.setattr(TinyQwen, "model_id", path)
+    monkeypatch.setitem(registry.MODELS, "tiny-qwen", ("tests.tiny_models", "TinyQwen"))
+    monkeypatch.setitem(registry.MODEL_IDS, "tiny-qwen", path)
+
+    prompts = [
+        PROMPT_TEMPLATE.format(title=f"News {i}", news_text="Shares rose. " * (3 * i + 1))
+        for i in range(3)
+    ]
+    # the image is pickled to the worker with its prompt
+    images = [Image.new("RGB", (64, 80), "red"), None, None]
+    generate_kwargs = dict(max_new_token=8, temperature=1e-6)
+
+    model = TinyQwen("cpu")
+    expected = [
+        model.generate_batch(VLM_ROLE, [prompt], [image], **generate_kwargs)[0]
+        for prompt, image in zip(prompts, images)
+    ]
+
+    with InferencePool("tiny-qwen", devices=["cpu", "cpu"], micro_batch_size=1) as pool:
+        outputs = pool.generate_batch(VLM_ROLE, prompts, images, **generate_kwargs)
+
+    assert outputs == expected
+    assert len(set(outputs)) > 1
+    # the generated token counts survive the trip back from the workers
+    assert [output.generated_tokens for output in outputs] == [
+        output.generated_tokens for output in expected
+    ]
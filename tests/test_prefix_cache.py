@@ -0,0 +1,113 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from src.models.prefix_cache import PrefixCache, common_prefix_length
+
+GENERATE_KWARGS = dict(do_sample=False, max_new_tokens=8, pad_token_id=0)
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    config = transformers.Qwen2Config(
+        vocab_size=128,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=256,
+    )
+    return transformers.Qwen2ForCausalLM(config).eval()
+
+
+@pytest.fixture(scope="module")
+def prefix_ids():
+    return torch.randint(3, 128, (12,), generator=torch.Generator().manual_seed(1))
+
+
+def left_pad(rows: list) -> tuple:
+    length = max(len(row) for row in rows)
+    input_ids = torch.zeros(len(rows), length, dtype=torch.long)
+    attention_mask = torch.zeros_like(input_ids)
+    for i, row in enumerate(rows):
+        input_ids[i, length - len(row) :] = row
+        attention_mask[i, length - len(row) :] = 1
+
+    return input_ids, attention_mask
+
+
+def prompts(prefix_ids, suffix_lengths: list[int], seed: int = 2) -> list:
+    generator = torch.Generator().manual_seed(seed)
+    return [
+        torch.cat([prefix_ids, torch.randint(3, 128, (n,), generator=generator)])
+        for n in suffix_lengths
+    ]
+
+
+def test_common_prefix_length():
+    a = torch.tensor([1, 2, 3, 4])
+    assert common_prefix_length(a, torch.tensor([1, 2, 3, 4])) == 4
+    assert common_prefix_length(a, torch.tensor([1, 2, 5])) == 2
+    assert common_prefix_length(a, torch.tensor([1, 2])) == 2
+    assert common_prefix_length(a, torch.tensor([7])) == 0
+
+
+@pytest.mark.parametrize("suffix_lengths", [[6], [4, 4], [5, 9, 2]])
+def test_cached_generation_matches_uncached(model, prefix_ids, suffix_lengths):
+    input_ids, attention_mask = left_pad(prompts(prefix_ids, suffix_lengths))
+    prefix_cache = PrefixCache(model, prefix_ids)
+
+    expected = model.generate(
+        input_ids=input_ids, attention_mask=attention_mask, **GENERATE_KWARGS
+    )
+    output = prefix_cache.generate(input_ids, attention_mask, **GENERATE_KWARGS)
+
+    assert prefix_cache.hits == 1
+    assert torch.equal(output, expected)
+
+
+def test_padded_batch_matches_single_prompts(model, prefix_ids):
+    rows = prompts(prefix_ids, [5, 9, 2])
+    input_ids, attention_mask = left_pad(rows)
+
+    output = PrefixCache(model, prefix_ids).generate(
+        input_ids, attention_mask, **GENERATE_KWARGS
+    )
+
+    for row, generated in zip(rows, output[:, input_ids.shape[1] :]):
+        expected = model.generate(
+            input_ids=row.unsqueeze(0),
+            attention_mask=torch.ones(1, len(row), dtype=torch.long),
+            **GENERATE_KWARGS,
+        )
+        assert generated.tolist() == expected[0, len(row) :].tolist()
+
+
+def test_partial_prefix_match(model, prefix_ids):
+    # the second prompt only shares the first half of the prefix
+    rows = prompts(prefix_ids, [4, 4])
+    rows[1][6] = (rows[1][6] + 1) % 128
+    input_ids, attention_mask = left_pad(rows)
+    prefix_cache = PrefixCache(model, prefix_ids)
+
+    expected = model.generate(
+        input_ids=input_ids, attention_mask=attention_mask, **GENERATE_KWARGS
+    )
+    output = prefix_cache.generate(input_ids, attention_mask, **GENERATE_KWARGS)
+
+    assert prefix_cache.hits == 1
+    assert torch.equal(output, expected)
+
+
+def test_unrelated_prompt_is_a_miss(model, prefix_ids):
+    input_ids = (prefix_ids[:8] + 1) % 128
+    prefix_cache = PrefixCache(model, prefix_ids)
+
+    expected = model.generate(input_ids=input_ids.unsqueeze(0), **GENERATE_KWARGS)
+    output = prefix_cache.generate(input_ids.unsqueeze(0), **GENERATE_KWARGS)
+
+    assert (prefix_cache.hits, prefix_cache.misses) == (0, 1)
+    assert torch.equal(output, expected)
@@ -0,0 +1,69 @@
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from src.models import registry
+from src.models.load_config import LoadConfig
+from src.models.registry import LazyVLM, VLMClient, VLMServer, get_vlm
+
+
+@pytest.fixture
+def echo_model(monkeypatch):
+    monkeypatch.setitem(registry.MODELS, "echo", ("tests.echo_vlm", "EchoVLM"))
+    monkeypatch.setitem(registry.MODEL_IDS, "echo", "test/echo")
+
+
+@pytest.fixture
+def socket_path(echo_model, tmp_path):
+    socket_path = str(tmp_path / "run" / "vlm.sock")
+    server = VLMServer("echo", socket_path, LoadConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket_path):
+        assert time.monotonic() < deadline, "the VLM server did not start"
+        time.sleep(0.01)
+
+    return socket_path
+
+
+def test_client_uses_the_server(socket_path):
+    vlm = get_vlm("echo", socket_path, LoadConfig())
+
+    assert isinstance(vlm, VLMClient)
+    assert vlm.model_id == "test/echo"
+    assert vlm.generate_batch("role", ["news"]) == [f"{os.getpid()} news"]
+    vlm.close()
+
+
+def test_socket_and_key_are_private(socket_path):
+    for path in (os.path.dirname(socket_path), socket_path, socket_path + ".key"):
+        assert stat.S_IMODE(os.stat(path).st_mode) & 0o077 == 0
+
+
+def test_other_model_or_load_config_is_loaded_locally(socket_path, monkeypatch):
+    monkeypatch.setitem(registry.MODELS, "other", ("tests.echo_vlm", "EchoVLM"))
+    monkeypatch.setitem(registry.MODEL_IDS, "other", "test/other")
+
+    assert isinstance(get_vlm("other", socket_path), LazyVLM)
+    assert isinstance(get_vlm("echo", socket_path, LoadConfig(quantization="dynamic")), LazyVLM)
+
+
+def test_key_readable_by_others_is_refused(socket_path):
+    os.chmod(socket_path + ".key", 0o644)
+
+    with pytest.raises(PermissionError):
+        VLMClient(socket_path)
+    assert isinstance(get_vlm("echo", socket_path), LazyVLM)
+
+
+def test_server_does_not_remove_other_files(echo_model, tmp_path):
+    path = tmp_path / "vlm.sock"
+    path.write_text("not a socket")
+
+    with pytest.raises(FileExistsError):
+        VLMServer("echo", str(path)).serve_forever(preload=False)
+    assert path.read_text() == "not a socket"
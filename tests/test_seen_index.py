@@ -0,0 +1,99 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from src.seen_index import SeenIndex
+
+DAY_AGO = 1_000
+
+
+@pytest.fixture
+def seen_index(tmp_path):
+    seen_index = SeenIndex(str(tmp_path / "seen_news.cache"), overlap=10)
+    yield seen_index
+    seen_index.close()
+
+
+def news(*rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["news_url", "pubDate"])
+
+
+def test_written_news_are_filtered(seen_index):
+    seen_index.filter_new("TSLA", news(("https://a.com/1?utm_source=x", 2000)))
+    seen_index.mark_written("https://a.com/1", "TSLA", "News 1", "page", ["b1"])
+
+    new = seen_index.filter_new(
+        "TSLA", news(("https://a.com/1", 2000), ("https://a.com/2", 2100))
+    )
+
+    assert list(new["news_url"]) == ["https://a.com/2"]
+    assert seen_index.block_ids("https://a.com/1") == {"TSLA": ["b1"]}
+    # the other tickers of the news are not written yet
+    assert len(seen_index.filter_new("AAPL", news(("https://a.com/1", 2000)))) == 1
+
+
+def test_high_water_mark_waits_for_older_pending(seen_index):
+    seen_index.filter_new(
+        "TSLA", news(("https://a.com/1", 2000), ("https://a.com/2", 3000))
+    )
+
+    # the newest news is written first, the older one is still pending
+    seen_index.mark_written("https://a.com/2", "TSLA", "News 2", "page", ["b2"])
+    assert seen_index.start_time("TSLA", DAY_AGO) == 2000 - 10
+
+    # once the older one is written, the mark catches up with the newest written news
+    seen_index.mark_written("https://a.com/1", "TSLA", "News 1", "page", ["b1"])
+    assert seen_index.start_time("TSLA", DAY_AGO) == 3000 - 10
+
+
+def test_high_water_mark_keeps_failed_news(seen_index):
+    seen_index.filter_new(
+        "TSLA",
+        news(("https://a.com/1", 2000), ("https://a.com/2", 2500), ("https://a.com/3", 3000)),
+    )
+
+    # the news published at 2500 is never written
+    seen_index.mark_written("https://a.com/1", "TSLA", "News 1", "page", ["b1"])
+    seen_index.mark_written("https://a.com/3", "TSLA", "News 3", "page", ["b3"])
+    assert seen_index.start_time("TSLA", DAY_AGO) == 2500 - 10
+    assert seen_index.start_time("AAPL", DAY_AGO) == DAY_AGO
+
+
+def test_duplicates_are_written(seen_index):
+    seen_index.filter_new("TSLA", news(("https://a.com/1", 2000)))
+    seen_index.add_duplicates("https://a.com/1", ["https://b.com/1"])
+    seen_index.mark_written("https://a.com/1", "TSLA", "News 1", "page", ["b1"])
+
+    assert seen_index.filter_new("TSLA", news(("https://b.com/1", 2000))).empty
+    assert seen_index.block_ids("https://b.com/1") == {"TSLA": ["b1"]}
+
+
+def test_index_without_pub_date_column(tmp_path):
+    path = str(tmp_path / "seen_news.cache")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE written_news (
+            url TEXT NOT NULL,
+            ticker TEXT NOT NULL,
+            title TEXT,
+            page_id TEXT,
+            block_ids TEXT,
+            written_at REAL NOT NULL,
+            PRIMARY KEY (url, ticker)
+        )
+        """
+    )
+    conn.execute(
+        "INSERT INTO written_news VALUES ('https://a.com/0', 'TSLA', 'News 0', 'page', '[]', 0)"
+    )
+    conn.commit()
+    conn.close()
+
+    seen_index = SeenIndex(path, overlap=10)
+    seen_index.filter_new("TSLA", news(("https://a.com/1", 2000)))
+    seen_index.mark_written("https://a.com/1", "TSLA", "News 1", "page", ["b1"])
+
+    assert seen_index.start_time("TSLA", DAY_AGO) == 2000 - 10
+    seen_index.close()
@@ -0,0 +1,104 @@
+import pytest
+
+from src.sharding import ShardQueue, run_shard, run_workers
+
+
+class FakeScrapper:
+    """
+    Scrapper of fixed news, {url: tickers}, recording the urls whose contents are fetched.
+    """
+
+    def __init__(self, news: dict[str, list[str]]):
+        self.news = news
+        self.fetched = []
+        self.pub_dates = {url: 1000 for url in news}
+
+    def iter_news(self, tickers, verbose=True, claim=None):
+        unique_news = [
+            {"news_url": url, "tickers": [t for t in news_tickers if t in tickers]}
+            for url, news_tickers in self.news.items()
+            if any(t in tickers for t in news_tickers)
+        ]
+        for news in claim(unique_news) if claim is not None else unique_news:
+            self.fetched.append(news["news_url"])
+            yield news["tickers"], f"title {news['news_url']}", ("text", None, news["news_url"])
+
+
+class TitleSummarizer:
+    def summarize_batch(
+        self, titles, news_texts, images, news_urls, news_tickers=None, start_times=None
+    ):
+        return [f"summary of {title}" for title in titles]
+
+
+@pytest.fixture
+def shard_queue(tmp_path):
+    shard_queue = ShardQueue(str(tmp_path / "shards.cache"))
+    yield shard_queue
+    shard_queue.close()
+
+
+def test_queue_is_in_wal_mode(shard_queue):
+    assert shard_queue._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_release_counts_the_given_back_shards(shard_queue):
+    shard_queue.create_run("run", ["AAPL", "MSFT", "TSLA"], 2)
+    shard, _ = shard_queue.claim("run", "host:1")
+
+    assert shard_queue.release("run", "host:2", "worker exited with code 1") == 0
+    assert shard_queue.release("run", "host:1", "worker exited with code 1") == 1
+    assert shard_queue.progress("run")[shard]["status"] == "failed"
+
+
+def test_worker_failing_before_its_first_claim_stops_the_run(shard_queue, tmp_path, monkeypatch):
+    # the caches of the workers are created in the working directory
+    monkeypatch.chdir(tmp_path)
+    shard_queue.create_run("run", ["AAPL", "MSFT"], 2)
+
+    with pytest.raises(RuntimeError, match="before claiming a shard"):
+        run_workers(
+            shard_queue.path,
+            "run",
+            1,
+            {"model_name": "unknown", "vlm_socket_path": None},
+            progress_interval=0.1,
+            verbose=False,
+        )
+    assert all(shard["status"] == "pending" for shard in shard_queue.progress("run"))
+
+
+def test_news_of_several_shards_is_summarized_once(shard_queue):
+    news = {
+        "https://finance.yahoo.com/news/both": ["AAPL", "MSFT"],
+        "https://finance.yahoo.com/news/msft": ["MSFT"],
+    }
+
+    fetched = []
+    # one shard per ticker
+    for shard, ticker in enumerate(["AAPL", "MSFT"]):
+        scrapper = FakeScrapper(news)
+        run_shard(shard_queue, "run", shard, [ticker], scrapper, TitleSummarizer())
+        fetched += scrapper.fetched
+
+    assert sorted(fetched) == sorted(news)
+    results = {(url, ticker): summary for url, ticker, _, summary, _, _ in shard_queue.unmerged_results("run")}
+    assert results == {
+        ("https://finance.yahoo.com/news/both", "AAPL"): "summary of title https://finance.yahoo.com/news/both",
+        ("https://finance.yahoo.com/news/both", "MSFT"): "summary of title https://finance.yahoo.com/news/both",
+        ("https://finance.yahoo.com/news/msft", "MSFT"): "summary of title https://finance.yahoo.com/news/msft",
+    }
+
+    shard_queue.mark_merged("run", "https://finance.yahoo.com/news/both", "MSFT", ["block"])
+    assert len(shard_queue.unmerged_results("run")) == 2
+
+
+def test_claims_are_by_canonical_url(shard_queue):
+    assert shard_queue.claim_news("run", 0, [("https://finance.yahoo.com/news/a", ["AAPL"])]) == {
+        "https://finance.yahoo.com/news/a"
+    }
+    assert shard_queue.claim_news("run", 1, [("https://www.finance.yahoo.com/news/a/?utm=x", ["MSFT"])]) == set()
+    # a new attempt of the shard keeps its claims
+    assert shard_queue.claim_news("run", 0, [("https://finance.yahoo.com/news/a", ["AAPL"])]) == {
+        "https://finance.yahoo.com/news/a"
+    }
@@ -0,0 +1,140 @@
+import pytest
+
+from src.structured import (
+    ANSWER_PREFIX,
+    SENTIMENTS,
+    SUMMARY_FIELD,
+    SentimentConstraint,
+    SentimentResult,
+    parse_structured_output,
+)
+
+EOS = "<|im_end|>"
+
+
+class DecodeCountingTokenizer:
+    """
+    Wrap a tokenizer to keep the lengths of the ids given to decode.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.decoded_lengths = []
+
+    def __call__(self, text: str, add_special_tokens: bool = False) -> dict:
+        return self.tokenizer(text, add_special_tokens=add_special_tokens)
+
+    def decode(self, ids: list[int]) -> str:
+        self.decoded_lengths.append(len(ids))
+        return self.tokenizer.decode(ids)
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    # the constraint needs torch, the answers are parsed without it
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from tests.tiny_models import byte_tokenizer
+
+    return byte_tokenizer(eos_token=EOS)
+
+
+def generate(constraint, tokenizer, answers: list[str], max_steps: int = 64):
+    """
+    Greedy decoding of a batch through the constraint, with the scores pushing each row towards its answer. Return the generated ids of each row and the allowed tokens of each step.
+    """
+    import torch
+
+    targets = [
+        tokenizer(answer, add_special_tokens=False)["input_ids"] for answer in answers
+    ]
+    vocab_size = len(tokenizer)
+    input_ids = torch.zeros((len(answers), 3), dtype=torch.long)
+    allowed = []
+
+    for step in range(max_steps):
+        scores = torch.zeros((len(answers), vocab_size))
+        for row, target in enumerate(targets):
+            if step < len(target):
+                scores[row, target[step]] = 5.0
+
+        scores = constraint(input_ids, scores)
+        allowed.append(
+            [torch.isfinite(row_scores).nonzero().flatten().tolist() for row_scores in scores]
+        )
+        next_ids = scores.argmax(dim=-1)
+        input_ids = torch.cat([input_ids, next_ids[:, None]], dim=1)
+
+        if all(token_id == constraint.eos_token_id for token_id in next_ids.tolist()):
+            break
+
+    return [ids[3:] for ids in input_ids.tolist()], allowed
+
+
+def test_labels_are_tokenized_after_the_prefix(tokenizer):
+    constraint = SentimentConstraint(tokenizer, tokenizer.eos_token_id)
+    prefix_ids = tokenizer(ANSWER_PREFIX, add_special_tokens=False)["input_ids"]
+
+    for label in SENTIMENTS:
+        ids = tokenizer(
+            ANSWER_PREFIX + label + SUMMARY_FIELD, add_special_tokens=False
+        )["input_ids"]
+        assert ids[: len(prefix_ids)] == prefix_ids
+        assert constraint.label_ids[label] == ids[len(prefix_ids) :]
+
+
+def test_constraint_forces_a_label_then_closes(tokenizer):
+    counting_tokenizer = DecodeCountingTokenizer(tokenizer)
+    constraint = SentimentConstraint(counting_tokenizer, tokenizer.eos_token_id)
+    answers = [
+        'Negative", "summary": "Sales fell."}',
+        # not a label, the constraint picks one of them
+        'Great news", "summary": "x"}',
+    ]
+
+    output_ids, allowed = generate(constraint, tokenizer, answers)
+
+    texts = [tokenizer.decode(ids, skip_special_tokens=True) for ids in output_ids]
+    assert texts[0] == answers[0]
+    assert any(texts[1].startswith(label + SUMMARY_FIELD) for label in SENTIMENTS)
+    # the first token is one of the first tokens of the labels
+    assert allowed[0][0] == sorted({ids[0] for ids in constraint.label_ids.values()})
+    # the end of sequence token is forced once the object is closed
+    closed_step = len(tokenizer(answers[0], add_special_tokens=False)["input_ids"])
+    assert allowed[closed_step][0] == [tokenizer.eos_token_id]
+    assert output_ids[0][closed_step] == tokenizer.eos_token_id
+    # the summary is checked one token at a time
+    assert set(counting_tokenizer.decoded_lengths) == {1}
+
+
+def test_confidence_of_the_label(tokenizer):
+    constraint = SentimentConstraint(tokenizer, tokenizer.eos_token_id)
+
+    output_ids, _ = generate(constraint, tokenizer, ['Positive", "summary": "Up."}'])
+
+    confidence = constraint.confidence(0, output_ids[0])
+    assert 1 / len(SENTIMENTS) < confidence <= 1.0
+
+
+def test_parse_valid_answer():
+    result = parse_structured_output(
+        'Positive", "summary": "Shares rose \\"sharply\\"."}', 0.9, generated_tokens=12
+    )
+
+    assert result == SentimentResult('Shares rose "sharply".', "Positive", 0.9)
+    assert result.generated_tokens == 12
+
+
+def test_parse_answer_cut_by_the_token_cap():
+    result = parse_structured_output('Negative", "summary": "Sales fell because', 0.7)
+
+    assert result.sentiment == "Negative"
+    assert result.summary == "Sales fell because"
+    assert result.confidence == 0.7
+
+
+def test_parse_answer_without_label():
+    result = parse_structured_output("no json at all", 0.5)
+
+    assert result.sentiment == "Neutral"
+    assert result.summary == ""
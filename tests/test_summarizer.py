@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+from benchmarks.stub_vlm import StubVLM, WordTokenizer
+from src.config import PROMPT_TEMPLATE, VLM_ROLE
+from src.summarizer import NewsSummarizer, PromptBuilder
+from src.summary_cache import CachedVLM, SummaryCache
+
+TITLES = ["Apple beats estimates", "Tesla misses deliveries"]
+TEXTS = ["Apple reported record revenue this quarter.", "Tesla delivered fewer cars than expected."]
+URLS = ["https://example.com/apple", "https://example.com/tesla"]
+
+
+class CountingTokenizer(WordTokenizer):
+    """
+    Fails the test if a generated summary is tokenized again to count its tokens.
+    """
+
+    def __call__(self, text: str, add_special_tokens: bool = False) -> dict:
+        if text.startswith("stub summary"):
+            raise AssertionError("the summary was tokenized again")
+        return super().__call__(text, add_special_tokens)
+
+
+class SummaryVLM(StubVLM):
+    decode_step = 0.0
+    output_tokens = 7
+
+    @staticmethod
+    def _summary(prompt: str, n_tokens: int) -> str:
+        return "stub summary"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SummaryCache(str(tmp_path / "summary.cache"))
+    yield cache
+    cache.close()
+
+
+@pytest.mark.parametrize("structured", [False, True])
+def test_generated_tokens_come_from_the_model(cache, structured):
+    summarizer = NewsSummarizer(
+        CachedVLM(SummaryVLM(), cache), PromptBuilder(CountingTokenizer()), structured
+    )
+
+    summarizer.summarize_batch(TITLES, TEXTS, [None, None], URLS)
+
+    assert [record["generated_tokens"] for record in summarizer.records] == [7, 7]
+
+
+@pytest.mark.parametrize("structured", [False, True])
+def test_cached_summaries_keep_their_generated_tokens(cache, structured):
+    vlm = SummaryVLM()
+    for _ in range(2):
+        summarizer = NewsSummarizer(
+            CachedVLM(vlm, cache), PromptBuilder(CountingTokenizer()), structured
+        )
+        summarizer.summarize_batch(TITLES, TEXTS, [None, None], URLS)
+
+    assert vlm.calls == 1
+    assert cache.hits == 2
+    assert [record["generated_tokens"] for record in summarizer.records] == [7, 7]
+
+
+def test_report_shows_the_latencies(cache):
+    summarizer = NewsSummarizer(CachedVLM(SummaryVLM(), cache), PromptBuilder(CountingTokenizer()))
+    summarizer.summarize_batch(TITLES, TEXTS, [None, None], URLS)
+
+    header, *rows = summarizer.report().splitlines()
+    assert "latency" in header and "batch latency" in header
+    assert len({record["batch_latency"] for record in summarizer.records}) == 1
+    # without start times, the news start with the batch
+    assert all(record["latency"] == record["batch_latency"] for record in summarizer.records)
+    assert len(rows) == 2
+
+
+def test_latency_starts_with_the_news(cache):
+    summarizer = NewsSummarizer(CachedVLM(SummaryVLM(), cache), PromptBuilder(CountingTokenizer()))
+    now = time.perf_counter()
+
+    summarizer.summarize_batch(TITLES, TEXTS, [None, None], URLS, start_times=[now - 5, now - 1])
+
+    first, second = summarizer.records
+    assert first["batch_latency"] < 1
+    assert 5 <= first["latency"] < 5 + 1
+    assert 1 <= second["latency"] < first["latency"]
+
+
+class ChatTokenizer(WordTokenizer):
+    """
+    Word tokenizer with a chat template wrapping every message in start and end words.
+    """
+
+    chat_template = "chat"
+
+    def apply_chat_template(
+        self, messages: list[dict], tokenize: bool = True, add_generation_prompt: bool = False
+    ) -> str:
+        text = "".join(
+            f"<start> {message['role']} {message['content']} <end> " for message in messages
+        )
+        return text + ("<start> assistant" if add_generation_prompt else "")
+
+
+def test_prompt_tokens_include_the_chat_template(cache):
+    prompt_builder = PromptBuilder(ChatTokenizer())
+    summarizer = NewsSummarizer(CachedVLM(SummaryVLM(), cache), prompt_builder)
+
+    summarizer.summarize_batch(TITLES, TEXTS, [None, None], URLS)
+
+    for title, text, record in zip(TITLES, TEXTS, summarizer.records):
+        prompt = PROMPT_TEMPLATE.format(title=title, news_text=text)
+        # the role message, the user message and the generation prompt
+        assert record["prompt_tokens"] == (
+            prompt_builder.count_tokens(VLM_ROLE) + prompt_builder.count_tokens(prompt) + 8
+        )
+        assert record["prompt_tokens"] == prompt_builder.count_prompt_tokens(VLM_ROLE, prompt)
+
+
+def test_prompt_tokens_without_chat_template():
+    prompt_builder = PromptBuilder(WordTokenizer())
+
+    assert prompt_builder.count_prompt_tokens("a role", "some prompt text") == 5
@@ -0,0 +1,122 @@
+import time
+
+import pytest
+from PIL import Image
+
+from src.config import FAILED_CONTENT_PREFIX, PROMPT_TEMPLATE, VLM_ROLE
+from src.structured import GeneratedText
+from src.summary_cache import CachedVLM, SummaryCache
+
+PARAMS = {"max_new_token": 1500, "temperature": 0.6}
+
+
+class CountingVLM:
+    model_id = "test/counting"
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_batch(self, role, prompts, images=None, max_new_token=1500, temperature=0.6):
+        self.prompts.extend(prompts)
+        return [GeneratedText(f"summary {len(self.prompts)}", 3) for _ in prompts]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SummaryCache(str(tmp_path / "summary.cache"), max_entries=3)
+    yield cache
+    cache.close()
+
+
+def make_key(**overrides) -> str:
+    inputs = dict(
+        news_url="https://example.com/news",
+        prompt="prompt",
+        image=None,
+        role=VLM_ROLE,
+        model_id="test/model",
+        generation_params=PARAMS,
+    )
+    inputs.update(overrides)
+    return SummaryCache.make_key(**inputs)
+
+
+def test_key_covers_every_input():
+    image = Image.new("RGB", (8, 8), "red")
+    keys = [
+        make_key(),
+        make_key(news_url="https://example.com/other"),
+        make_key(prompt="other prompt"),
+        make_key(role="other role"),
+        make_key(model_id="test/other"),
+        make_key(generation_params={**PARAMS, "temperature": 0.1}),
+        make_key(image=image),
+        make_key(image=Image.new("RGB", (8, 8), "blue")),
+    ]
+
+    assert len(set(keys)) == len(keys)
+    # the same inputs give the same key, whatever the order of the parameters
+    assert make_key(generation_params=dict(reversed(PARAMS.items()))) == keys[0]
+    assert make_key(image=image.copy()) == keys[6]
+
+
+def test_least_recently_used_are_evicted(cache):
+    for i in range(3):
+        cache.put(f"key {i}", f"summary {i}")
+        time.sleep(0.01)
+    # key 0 is used again, so key 1 is the least recently used
+    assert cache.get("key 0") == "summary 0"
+
+    cache.put("key 3", "summary 3")
+
+    assert cache.get("key 1") is None
+    assert [cache.get(f"key {i}") for i in (0, 2, 3)] == ["summary 0", "summary 2", "summary 3"]
+    assert cache.stats()["entries"] == 3
+
+
+def test_expired_summaries_are_missed(cache):
+    cache.put("key", "summary", generated_tokens=5)
+    assert cache.get("key").generated_tokens == 5
+
+    cache.max_age = 0
+    time.sleep(0.01)
+
+    assert cache.get("key") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cached_vlm_reuses_the_summaries(cache):
+    vlm = CountingVLM()
+    cached_vlm = CachedVLM(vlm, cache)
+    prompts = [
+        PROMPT_TEMPLATE.format(title=f"News {i}", news_text="Shares rose.") for i in range(2)
+    ]
+    urls = ["https://example.com/0", "https://example.com/1"]
+
+    first = cached_vlm.generate_batch(VLM_ROLE, prompts, news_urls=urls)
+    second = cached_vlm.generate_batch(VLM_ROLE, prompts, news_urls=urls)
+
+    assert second == first
+    assert len(vlm.prompts) == 2
+    # another temperature is another summary
+    cached_vlm.generate_batch(VLM_ROLE, prompts[:1], news_urls=urls[:1], temperature=0.1)
+    assert len(vlm.prompts) == 3
+
+
+def test_failed_contents_are_not_cached(cache):
+    vlm = CountingVLM()
+    cached_vlm = CachedVLM(vlm, cache)
+    news_text = (
+        f"{FAILED_CONTENT_PREFIX}https://example.com/0 with status code 503. Please check the URL."
+    )
+    prompts = [
+        PROMPT_TEMPLATE.format(title="News 0", news_text=news_text),
+        PROMPT_TEMPLATE.format(title="News 1", news_text="Shares rose."),
+    ]
+
+    for _ in range(2):
+        cached_vlm.generate_batch(VLM_ROLE, prompts)
+
+    # the news which could not be fetched is generated again, the other one comes from the cache
+    assert vlm.prompts == [prompts[0], prompts[1], prompts[0]]
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from src.tracing import SamplingProfiler, Tracer, traced, tracer
+
+
+@pytest.fixture
+def enabled_tracer():
+    tracer = Tracer()
+    tracer.enable()
+    return tracer
+
+
+def test_chrome_trace_round_trip(enabled_tracer, tmp_path):
+    with enabled_tracer.span("http.article", url="https://a.com/1") as span:
+        time.sleep(0.01)
+        span.set(status=200)
+
+    def worker():
+        with enabled_tracer.span("vlm.generate", batch=4):
+            time.sleep(0.005)
+
+    thread = threading.Thread(target=worker, name="generate")
+    thread.start()
+    thread.join()
+
+    path = str(tmp_path / "trace.json")
+    enabled_tracer.export_chrome_trace(path)
+    with open(path) as f:
+        trace = json.load(f)
+
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert [span["name"] for span in spans] == ["http.article", "vlm.generate"]
+    assert spans[0]["cat"] == "http"
+    assert spans[0]["args"] == {"url": "https://a.com/1", "status": 200}
+    assert spans[1]["args"] == {"batch": 4}
+    # in microseconds from the creation of the tracer, one after the other
+    assert spans[0]["dur"] >= 10_000
+    assert 0 <= spans[0]["ts"] < spans[0]["ts"] + spans[0]["dur"] <= spans[1]["ts"]
+    assert {span["pid"] for span in spans} == {os.getpid()}
+    assert spans[0]["tid"] == threading.get_ident()
+    assert spans[1]["tid"] != spans[0]["tid"]
+
+    # each thread of the spans is named, the finished ones by their id
+    thread_names = {
+        event["tid"]: event["args"]["name"]
+        for event in trace["traceEvents"]
+        if event["ph"] == "M"
+    }
+    assert thread_names == {
+        spans[0]["tid"]: threading.current_thread().name,
+        spans[1]["tid"]: str(spans[1]["tid"]),
+    }
+
+
+def test_error_and_non_json_args(enabled_tracer, tmp_path):
+    with pytest.raises(ValueError):
+        with enabled_tracer.span("html.extract", extractor=object):
+            raise ValueError("bad page")
+
+    path = str(tmp_path / "trace.json")
+    enabled_tracer.export_chrome_trace(path)
+    with open(path) as f:
+        (span,) = [event for event in json.load(f)["traceEvents"] if event["ph"] == "X"]
+
+    assert span["args"]["error"] == "ValueError"
+    # the arguments which are not JSON are exported as strings
+    assert span["args"]["extractor"] == str(object)
+
+
+def test_disabled_tracer_records_nothing():
+    disabled = Tracer()
+
+    with disabled.span("notion.blocks.append") as span:
+        span.set(blocks=3)
+    disabled.add_span("vlm.prefill", 0.0, 1.0)
+
+    assert disabled.events == []
+
+
+def test_summary(enabled_tracer):
+    for duration in (0.001, 0.002, 0.003):
+        enabled_tracer.add_span("vlm.decode", 10.0, 10.0 + duration)
+    enabled_tracer.add_span("http.article", 10.0, 10.5)
+
+    header, *lines = enabled_tracer.summary().splitlines()
+
+    assert header.split() == ["span", "count", "total", "mean", "p50", "p95", "max"]
+    # from the longest total
+    assert [line.split()[0] for line in lines] == ["http.article", "vlm.decode"]
+    assert lines[1].split()[1:4] == ["3", "0.01s", "2.0ms"]
+
+
+def test_traced_decorator(monkeypatch):
+    monkeypatch.setattr(tracer, "enabled", True)
+    monkeypatch.setattr(tracer, "events", [])
+
+    @traced("scrapper.step")
+    def step(value):
+        return value * 2
+
+    assert step(21) == 42
+    assert [event[0] for event in tracer.events] == ["scrapper.step"]
+
+
+def test_sampling_profiler_collapsed_stacks(tmp_path):
+    def busy_loop():
+        end = time.perf_counter() + 0.2
+        while time.perf_counter() < end:
+            pass
+
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    busy_loop()
+    profiler.stop()
+
+    path = str(tmp_path / "profile.txt")
+    profiler.export_collapsed(path)
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) >= 1
+    assert any("busy_loop (test_tracing.py:" in line for line in lines)
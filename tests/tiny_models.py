@@ -0,0 +1,167 @@
+"""
+Tiny random Qwen2.5-VL and Llama 3.2 Vision models built offline, to run the real generation code of the models on CPU without downloading weights.
+"""
+
+import os
+
+import torch
+import transformers
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+
+from src.models.qwen_vision import Qwen25Vision
+
+QWEN_CHAT_TEMPLATE = (
+    "{% for message in messages %}<|im_start|>{{ message['role'] }}\n"
+    "{% if message['content'] is string %}{{ message['content'] }}"
+    "{% else %}{% for content in message['content'] %}"
+    "{% if content['type'] == 'image' %}<|vision_start|><|image_pad|><|vision_end|>"
+    "{% else %}{{ content['text'] }}{% endif %}{% endfor %}{% endif %}"
+    "<|im_end|>\n{% endfor %}"
+    "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+
+LLAMA_CHAT_TEMPLATE = (
+    "{{ bos_token }}{% for message in messages %}"
+    "<|start_header_id|>{{ message['role'] }}<|end_header_id|>\n\n"
+    "{% if message['content'] is string %}{{ message['content'] }}"
+    "{% else %}{% for content in message['content'] %}"
+    "{% if content['type'] == 'image' %}<|image|>"
+    "{% else %}{{ content['text'] }}{% endif %}{% endfor %}{% endif %}"
+    "<|eot_id|>{% endfor %}"
+    "{% if add_generation_prompt %}<|start_header_id|>assistant<|end_header_id|>\n\n{% endif %}"
+)
+
+
+def byte_tokenizer(**special_tokens) -> transformers.PreTrainedTokenizerFast:
+    """
+    A byte level tokenizer built offline, with the `` terminator of the models as a token.
+    """
+    vocab = {char: i for i, char in enumerate(sorted(pre_tokenizers.ByteLevel.alphabet()))}
+    vocab["``"] = len(vocab)
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[("`", "`")]))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+
+    return transformers.PreTrainedTokenizerFast(tokenizer_object=tokenizer, **special_tokens)
+
+
+def save_tiny_qwen(path) -> str:
+    """
+    Save a tiny random Qwen2.5-VL with a byte level tokenizer to the directory, offline.
+    """
+    tokenizer = byte_tokenizer(
+        eos_token="<|im_end|>",
+        pad_token="<|endoftext|>",
+        additional_special_tokens=[
+            "<|im_start|>",
+            "<|vision_start|>",
+            "<|vision_end|>",
+            "<|image_pad|>",
+            "<|video_pad|>",
+        ],
+    )
+    processor = transformers.Qwen2_5_VLProcessor(
+        image_processor=transformers.Qwen2VLImageProcessor(),
+        tokenizer=tokenizer,
+        video_processor=transformers.Qwen2VLVideoProcessor(),
+        chat_template=QWEN_CHAT_TEMPLATE,
+    )
+
+    torch.manual_seed(0)
+    config = transformers.Qwen2_5_VLConfig(
+        text_config=dict(
+            vocab_size=len(tokenizer),
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            max_position_embeddings=4096,
+            rope_scaling={"type": "mrope", "mrope_section": [2, 1, 1]},
+            initializer_range=0.5,
+            bos_token_id=None,
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.pad_token_id,
+        ),
+        vision_config=dict(
+            depth=1,
+            hidden_size=16,
+            intermediate_size=32,
+            num_heads=2,
+            out_hidden_size=32,
+            fullatt_block_indexes=[0],
+        ),
+        image_token_id=tokenizer.convert_tokens_to_ids("<|image_pad|>"),
+        video_token_id=tokenizer.convert_tokens_to_ids("<|video_pad|>"),
+        vision_start_token_id=tokenizer.convert_tokens_to_ids("<|vision_start|>"),
+    )
+
+    transformers.Qwen2_5_VLForConditionalGeneration(config).save_pretrained(path)
+    processor.save_pretrained(path)
+
+    return str(path)
+
+
+def save_tiny_llama(path) -> str:
+    """
+    Save a tiny random Llama 3.2 Vision with a byte level tokenizer to the directory, offline.
+    """
+    tokenizer = byte_tokenizer(
+        bos_token="<|begin_of_text|>",
+        eos_token="<|eot_id|>",
+        additional_special_tokens=[
+            "<|image|>",
+            "<|python_tag|>",
+            "<|start_header_id|>",
+            "<|end_header_id|>",
+        ],
+    )
+    processor = transformers.MllamaProcessor(
+        transformers.MllamaImageProcessor(size={"height": 28, "width": 28}, max_image_tiles=2),
+        tokenizer,
+        chat_template=LLAMA_CHAT_TEMPLATE,
+    )
+
+    torch.manual_seed(0)
+    config = transformers.MllamaConfig(
+        text_config=dict(
+            vocab_size=len(tokenizer),
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            cross_attention_layers=[1],
+            initializer_range=0.5,
+            bos_token_id=tokenizer.bos_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=None,
+        ),
+        vision_config=dict(
+            hidden_size=16,
+            intermediate_size=32,
+            num_hidden_layers=2,
+            num_global_layers=1,
+            attention_heads=2,
+            image_size=28,
+            patch_size=14,
+            max_num_tiles=2,
+            intermediate_layers_indices=[0],
+            vision_output_dim=32,
+            supported_aspect_ratios=[[1, 1], [1, 2], [2, 1]],
+        ),
+        image_token_index=tokenizer.convert_tokens_to_ids("<|image|>"),
+    )
+
+    transformers.MllamaForConditionalGeneration(config).save_pretrained(path)
+    processor.save_pretrained(path)
+
+    return str(path)
+
+
+class TinyQwen(Qwen25Vision):
+    """
+    Tiny Qwen saved at $TINY_QWEN_PATH, importable by the spawned processes of the inference pool.
+    """
+
+    model_id = os.environ.get("TINY_QWEN_PATH", "")